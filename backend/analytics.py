@@ -0,0 +1,311 @@
+"""
+Vectorized trend analysis helpers for EcoVision Climate Visualizer
+Operates on columnar NumPy arrays instead of per-row ORM objects
+"""
+
+import numpy as np
+from sqlalchemy import SmallInteger, String, select, type_coerce
+
+from dimensions import current_dimensions
+from filters import statement_templates
+from models import db, ClimateData, QualityLevel, QUALITY_RANKS, QUALITY_WEIGHTS
+from sharding import fan_out_shards
+
+QUALITY_NAMES = {rank: quality.value for quality, rank in QUALITY_RANKS.items()}
+QUALITY_BY_RANK = {rank: quality for quality, rank in QUALITY_RANKS.items()}
+HIGH_QUALITY_RANK = QUALITY_RANKS[QualityLevel.GOOD]
+# Readings are stored at 4 decimals, so scaled by this they are exact
+# integers and their sums carry no rounding error
+VALUE_SCALE = 10000
+
+
+def _trend_columns_statement(*conditions):
+    # Dates are left unconverted (ISO strings on SQLite, date objects on MySQL);
+    # NumPy parses either form far faster than per-row Python conversion.
+    return select(
+        ClimateData.id,
+        ClimateData.metric_id,
+        type_coerce(ClimateData.date, String),
+        ClimateData.value,
+        type_coerce(ClimateData.quality, SmallInteger),
+        ClimateData.location_id,
+    ).where(*conditions)
+
+
+def fetch_trend_columns(filters):
+    """
+    Fetch the readings matching request filters as column arrays, ordered by
+    metric, then date, then id
+    """
+    shards = fan_out_shards()
+    if shards is not None:
+        return merge_trend_columns(shards.map(fetch_trend_columns, filters))
+
+    statement, params = statement_templates.get(
+        "trend_columns", filters, _trend_columns_statement
+    )
+
+    # Rows are read straight off the DBAPI cursor: every column above is already
+    # a plain scalar, so SQLAlchemy's per-row Row construction is pure overhead.
+    result = db.session.connection().execute(statement, params)
+    rows = result.cursor.fetchall()
+    result.close()
+
+    count = len(rows)
+    if not count:
+        return {
+            "id": np.empty(0, dtype=np.int64),
+            "metric_id": np.empty(0, dtype=np.int64),
+            "date": np.empty(0, dtype="datetime64[D]"),
+            "value": np.empty(0, dtype=np.float64),
+            "quality": np.empty(0, dtype=np.int8),
+            "location_id": np.empty(0, dtype=np.int64),
+        }
+
+    def column(index, dtype):
+        return np.fromiter((row[index] for row in rows), dtype=dtype, count=count)
+
+    columns = {
+        "id": column(0, np.int64),
+        "metric_id": column(1, np.int64),
+        "date": np.array([row[2] for row in rows], dtype="datetime64[D]"),
+        "value": column(3, np.float64),
+        "quality": column(4, np.int8),
+        "location_id": column(5, np.int64),
+    }
+
+    order = np.lexsort((columns["id"], columns["date"], columns["metric_id"]))
+    return {name: values[order] for name, values in columns.items()}
+
+
+def _seasonality_columns_statement(*conditions):
+    return select(
+        ClimateData.metric_id,
+        ClimateData.location_id,
+        type_coerce(ClimateData.date, String),
+        ClimateData.value,
+    ).where(*conditions)
+
+
+def fetch_seasonality_columns(filters):
+    """
+    Fetch only the metric_id, location_id, date and value columns that daily
+    seasonality bins read, for the readings matching request filters. Rows
+    are left unordered: binning does not depend on their order.
+    """
+    shards = fan_out_shards()
+    if shards is not None:
+        parts = shards.map(fetch_seasonality_columns, filters)
+        return {
+            name: np.concatenate([part[name] for part in parts]) for name in parts[0]
+        }
+
+    statement, params = statement_templates.get(
+        "seasonality_columns", filters, _seasonality_columns_statement
+    )
+    result = db.session.connection().execute(statement, params)
+    rows = result.cursor.fetchall()
+    result.close()
+
+    count = len(rows)
+
+    def column(index, dtype):
+        return np.fromiter((row[index] for row in rows), dtype=dtype, count=count)
+
+    return {
+        "metric_id": column(0, np.int64),
+        "location_id": column(1, np.int64),
+        "date": np.array([row[2] for row in rows], dtype="datetime64[D]"),
+        "value": column(3, np.float64),
+    }
+
+
+def merge_trend_columns(parts):
+    """Combine fetch_trend_columns() arrays from several shards, re-sorted"""
+    columns = {
+        name: np.concatenate([part[name] for part in parts]) for name in parts[0]
+    }
+    order = np.lexsort((columns["id"], columns["date"], columns["metric_id"]))
+    return {name: values[order] for name, values in columns.items()}
+
+
+def load_metric_lookup():
+    """Map metric id to (name, unit)"""
+    return current_dimensions().metric_lookup
+
+
+def load_location_lookup():
+    """Map location id to (name, latitude, longitude)"""
+    return current_dimensions().location_lookup
+
+
+def named_summary_rows(rows, metric_lookup):
+    """Summary rows keyed by metric id, with the id replaced by (name, unit)"""
+    return [(*metric_lookup[metric_id], *rest) for metric_id, *rest in rows]
+
+
+def ordered_summary_rows(rows):
+    """
+    Summary GROUP BY rows of raw readings with MIN/MAX/SUM rounded to 4
+    decimals and sorted by (name, unit, quality name): the precision and order
+    per-metric totals have always been accumulated in, so results round alike
+    """
+    rows = [
+        (
+            name,
+            unit,
+            quality,
+            round(minimum, 4),
+            round(maximum, 4),
+            round(total, 4),
+            count,
+            round(weighted, 4),
+        )
+        for name, unit, quality, minimum, maximum, total, count, weighted in rows
+    ]
+    rows.sort(key=lambda row: (row[0], row[1], row[2].name))
+    return rows
+
+
+def summary_rows(columns, metric_lookup):
+    """
+    Per (metric, quality) rows from fetch_trend_columns() arrays, shaped like
+    the summary GROUP BY: name, unit, quality, min, max, sum, count, weighted sum
+    """
+    keys = columns["metric_id"] * len(QUALITY_BY_RANK) + columns["quality"]
+    groups, index = np.unique(keys, return_inverse=True)
+    values = columns["value"]
+    weights = np.array(
+        [QUALITY_WEIGHTS[QUALITY_BY_RANK[rank]] for rank in range(len(QUALITY_BY_RANK))]
+    )[columns["quality"]]
+
+    counts = np.bincount(index, minlength=len(groups))
+    sums = np.bincount(index, weights=values, minlength=len(groups))
+    weighted_sums = np.bincount(index, weights=values * weights, minlength=len(groups))
+    minimums = np.full(len(groups), np.inf)
+    maximums = np.full(len(groups), -np.inf)
+    np.minimum.at(minimums, index, values)
+    np.maximum.at(maximums, index, values)
+
+    rows = []
+    for key, count, minimum, maximum, total, weighted in zip(
+        groups.tolist(),
+        counts.tolist(),
+        minimums.tolist(),
+        maximums.tolist(),
+        sums.tolist(),
+        weighted_sums.tolist(),
+    ):
+        metric_id, rank = divmod(key, len(QUALITY_BY_RANK))
+        name, unit = metric_lookup[metric_id]
+        rows.append(
+            (
+                name,
+                unit,
+                QUALITY_BY_RANK[rank],
+                minimum,
+                maximum,
+                total,
+                count,
+                weighted,
+            )
+        )
+    return ordered_summary_rows(rows)
+
+
+def split_by_metric(columns):
+    """Yield (metric_id, column slices) groups from metric-ordered columns"""
+    metric_ids, starts = np.unique(columns["metric_id"], return_index=True)
+    ends = np.append(starts[1:], len(columns["metric_id"]))
+
+    for metric_id, start, end in zip(metric_ids, starts, ends):
+        yield int(metric_id), {
+            name: column[start:end] for name, column in columns.items()
+        }
+
+
+def scaled_sum(values):
+    """Exact sum of 4-decimal values, as an integer number of 1/VALUE_SCALE"""
+    scaled = np.rint(np.asarray(values, dtype=np.float64) * VALUE_SCALE)
+    return int(scaled.astype(np.int64).sum())
+
+
+def exact_average(total, count):
+    """Mean of ``count`` values from their scaled_sum(), rounded once"""
+    return total / (count * VALUE_SCALE)
+
+
+def classify_trend(count, first_half_avg, second_half_avg, high_quality_count):
+    """Direction, rate and confidence from half-split averages"""
+    if second_half_avg > first_half_avg * 1.05:
+        direction = "increasing"
+        rate = round((second_half_avg - first_half_avg) / count, 4)
+    elif second_half_avg < first_half_avg * 0.95:
+        direction = "decreasing"
+        rate = round((first_half_avg - second_half_avg) / count, 4)
+    else:
+        direction = "stable"
+        rate = 0
+
+    confidence = min(0.95, 0.4 + (high_quality_count / count) * 0.5)
+
+    return direction, rate, confidence
+
+
+def compute_trend(values, qualities):
+    """Half-split trend direction, rate and confidence for one series"""
+    count = len(values)
+    mid_point = count // 2
+    # Exact sums, so rollup-served ranges (summing whole months) agree to
+    # the last digit
+    first_half_avg = (
+        exact_average(scaled_sum(values[:mid_point]), mid_point) if mid_point > 0 else 0
+    )
+    second_half_avg = exact_average(scaled_sum(values[mid_point:]), count - mid_point)
+    high_quality_count = int(np.count_nonzero(qualities >= HIGH_QUALITY_RANK))
+
+    return classify_trend(count, first_half_avg, second_half_avg, high_quality_count)
+
+
+def format_anomaly(day, value, deviation, quality_rank, location_id, location_lookup):
+    name, latitude, longitude = location_lookup[location_id]
+    return {
+        "date": str(day),
+        "value": round(value, 2),
+        "deviation": round(deviation, 1),
+        "quality": QUALITY_NAMES[quality_rank],
+        "location": name,
+        "location_id": location_id,
+        "coordinates": {"latitude": latitude, "longitude": longitude},
+    }
+
+
+def anomaly_positions(values, limit=5):
+    """
+    Positions of the first ``limit`` values more than two standard deviations
+    out, with each one's deviation in standard deviations
+    """
+    if len(values) <= 3:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+
+    mean_val = values.mean()
+    stdev_val = values.std(ddof=1)
+    deviations = np.abs(values - mean_val)
+    positions = np.flatnonzero(deviations > 2 * stdev_val)[:limit]
+    return positions, deviations[positions] / stdev_val
+
+
+def find_anomalies(series, location_lookup, limit=5):
+    """Return the first ``limit`` readings more than two standard deviations out"""
+    positions, deviations = anomaly_positions(series["value"], limit)
+    return [
+        format_anomaly(
+            series["date"][pos],
+            float(series["value"][pos]),
+            float(deviation),
+            int(series["quality"][pos]),
+            int(series["location_id"][pos]),
+            location_lookup,
+        )
+        for pos, deviation in zip(positions, deviations)
+    ]
@@ -4,13 +4,27 @@ from flask_migrate import Migrate
 import os
 from dotenv import load_dotenv
 
+from engine_profiles import DEFAULT_PROFILE, apply_sqlite_pragmas, engine_options
+from json_provider import DEFAULT_JSON_PROVIDER, json_provider_class
+from replicas import REPLICA_BIND_PREFIX, init_replicas, replica_binds
+from sharding import init_sharding, shard_binds
+
 
 load_dotenv()
 
 
-def create_app():
-    """Application factory pattern"""
+def create_app(read_replica_urls=None, shard_urls=None):
+    """
+    Application factory pattern
+    read_replica_urls: database URLs that GET requests read from, defaulting to
+    the comma-separated READ_REPLICA_URLS environment variable
+    shard_urls: database URLs readings are partitioned across by location,
+    defaulting to the comma-separated SHARD_URLS environment variable
+    """
     app = Flask(__name__)
+    app.json = json_provider_class(
+        os.environ.get("JSON_PROVIDER", DEFAULT_JSON_PROVIDER)
+    )(app)
     CORS(app)
 
     mysql_host = os.environ.get("MYSQL_HOST", "localhost")
@@ -29,23 +43,104 @@ def create_app():
 
     app.config["SQLALCHEMY_DATABASE_URI"] = database_url
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["DB_ENGINE_PROFILE"] = os.environ.get("DB_ENGINE_PROFILE", DEFAULT_PROFILE)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        database_url, app.config["DB_ENGINE_PROFILE"]
+    )
+    if read_replica_urls is None:
+        read_replica_urls = [
+            url.strip()
+            for url in os.environ.get("READ_REPLICA_URLS", "").split(",")
+            if url.strip()
+        ]
+    if shard_urls is None:
+        shard_urls = [
+            url.strip()
+            for url in os.environ.get("SHARD_URLS", "").split(",")
+            if url.strip()
+        ]
+    app.config["SQLALCHEMY_BINDS"] = {
+        **replica_binds(read_replica_urls),
+        **shard_binds(shard_urls),
+    }
+    if os.environ.get("SHARD_WORKERS"):
+        app.config["SHARD_WORKERS"] = int(os.environ["SHARD_WORKERS"])
     app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-secret-key")
+    app.config["RESPONSE_CACHE_SIZE"] = int(
+        os.environ.get("RESPONSE_CACHE_SIZE", "256")
+    )
+    app.config["INGEST_MAX_ROWS"] = int(os.environ.get("INGEST_MAX_ROWS", "100000"))
+    app.config["SNAPSHOT_DIR"] = os.environ.get("SNAPSHOT_DIR") or None
+    app.config["SNAPSHOT_REBUILD_ON_INGEST"] = os.environ.get(
+        "SNAPSHOT_REBUILD_ON_INGEST", "1"
+    ) in ("1", "true")
+    app.config["TRENDS_EXECUTOR"] = os.environ.get("TRENDS_EXECUTOR", "serial")
+    if os.environ.get("TRENDS_WORKERS"):
+        app.config["TRENDS_WORKERS"] = int(os.environ["TRENDS_WORKERS"])
+    app.config["TRENDS_MIN_ROWS"] = int(os.environ.get("TRENDS_MIN_ROWS", "200000"))
+    app.config["TRENDS_START_METHOD"] = os.environ.get("TRENDS_START_METHOD") or None
+    app.config["COMPRESSION_ENCODINGS"] = tuple(
+        name.strip()
+        for name in os.environ.get("COMPRESSION_ENCODINGS", "br,gzip").split(",")
+        if name.strip()
+    )
+    app.config["COMPRESSION_MIN_SIZE"] = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+    app.config["COMPRESSION_GZIP_LEVEL"] = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+    app.config["COMPRESSION_BROTLI_LEVEL"] = int(
+        os.environ.get("COMPRESSION_BROTLI_LEVEL", "4")
+    )
 
     from models import db
+    from cache import response_cache
+    from compression import init_compression
+    from dimensions import init_dimensions
+    from snapshot import init_snapshots
+    from trend_pool import init_trend_pool
+
+    # Importing rollups registers the session listeners that fold every write
+    # into climate_rollups/series_stats; it must happen before the first write,
+    # not when an analytics route first imports it
+    import rollups  # noqa: F401
 
     db.init_app(app)
+    response_cache.init_app(app)
 
     migrate = Migrate(app, db)
 
+    # WAL (every profile) keeps reads going while batch ingestion commits.
+    # Replica binds may be opened read-only, so they keep their journal mode;
+    # shards take writes like the primary.
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            if engine.dialect.name == "sqlite":
+                apply_sqlite_pragmas(
+                    engine,
+                    app.config["DB_ENGINE_PROFILE"],
+                    read_only=(bind_key or "").startswith(REPLICA_BIND_PREFIX),
+                )
+
+    init_replicas(app, db)
+    init_sharding(app, db)
+    init_compression(app)
+    init_dimensions(app)
+    init_snapshots(app)
+    init_trend_pool(app)
+
+    from routes.cache import cache_bp
     from routes.climate import climate_bp
+    from routes.dashboard import dashboard_bp
     from routes.locations import locations_bp
     from routes.metrics import metrics_bp
+    from routes.series import series_bp
     from routes.summary import summary_bp
     from routes.trends import trends_bp
 
+    app.register_blueprint(cache_bp)
     app.register_blueprint(climate_bp)
+    app.register_blueprint(dashboard_bp)
     app.register_blueprint(locations_bp)
     app.register_blueprint(metrics_bp)
+    app.register_blueprint(series_bp)
     app.register_blueprint(summary_bp)
     app.register_blueprint(trends_bp)
 
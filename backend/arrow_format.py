@@ -0,0 +1,145 @@
+"""
+Apache Arrow IPC serialization for EcoVision Climate Visualizer
+Builds typed record batches straight from listing query rows, column by column,
+attaching location and metric columns from the dimension lookups
+"""
+
+import io
+import json
+
+from flask import request
+from sqlalchemy import SmallInteger, String, type_coerce
+
+from models import ClimateData, QUALITY_LEVELS
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pa = None
+
+ARROW_STREAM_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+ARROW_SCHEMA = (
+    pa.schema(
+        [
+            ("id", pa.int64()),
+            ("location_id", pa.int32()),
+            ("location_name", pa.dictionary(pa.int32(), pa.string())),
+            ("latitude", pa.float64()),
+            ("longitude", pa.float64()),
+            ("date", pa.date32()),
+            ("metric", pa.dictionary(pa.int32(), pa.string())),
+            ("value", pa.float64()),
+            ("unit", pa.dictionary(pa.int32(), pa.string())),
+            ("quality", pa.dictionary(pa.int32(), pa.string())),
+        ]
+    )
+    if pa is not None
+    else None
+)
+
+
+def arrow_available():
+    """True when pyarrow is installed"""
+    return pa is not None
+
+
+def arrow_requested():
+    """True when the Accept header prefers an Arrow IPC stream over JSON"""
+    best = request.accept_mimetypes.best_match(
+        ["application/json", ARROW_STREAM_MIMETYPE]
+    )
+    return best == ARROW_STREAM_MIMETYPE
+
+
+def arrow_columns():
+    """
+    Columns matching ClimateData.listing_columns(), with SQLAlchemy's per-row
+    result processing skipped so values arrive as plain scalars
+    """
+    return (
+        ClimateData.id,
+        ClimateData.location_id,
+        ClimateData.metric_id,
+        type_coerce(ClimateData.date, String),
+        ClimateData.value,
+        type_coerce(ClimateData.quality, SmallInteger),
+    )
+
+
+def _lookup_columns(ids, lookup):
+    """
+    One array per field of ``lookup`` entries for an id column; only the few
+    distinct ids are looked up, then spread back out with take()
+    """
+    encoded = pa.array(ids, pa.int64()).dictionary_encode()
+    entries = [lookup[key] for key in encoded.dictionary.to_pylist()]
+    return [pa.array(field).take(encoded.indices) for field in zip(*entries)]
+
+
+def _quality_dictionary(values):
+    # The column holds ranks; only the few distinct dictionary entries are
+    # translated to the API's quality names
+    encoded = pa.array(values, pa.int64()).dictionary_encode()
+    labels = [QUALITY_LEVELS[rank].value for rank in encoded.dictionary.to_pylist()]
+    return pa.DictionaryArray.from_arrays(encoded.indices, pa.array(labels))
+
+
+def _dates(values):
+    # ISO strings on SQLite, date objects on MySQL
+    dates = pa.array(values)
+    if not pa.types.is_date32(dates.type):
+        dates = dates.cast(pa.date32())
+    return dates
+
+
+def record_batch(rows, dimensions):
+    """Build a record batch from arrow_columns() rows and a Dimensions snapshot"""
+    if not rows:
+        return pa.RecordBatch.from_pylist([], schema=ARROW_SCHEMA)
+
+    ids, location_ids, metric_ids, dates, values, qualities = zip(*rows)
+    location_names, latitudes, longitudes = _lookup_columns(
+        location_ids, dimensions.location_lookup
+    )
+    metrics, units = _lookup_columns(metric_ids, dimensions.metric_lookup)
+
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(ids, pa.int64()),
+            pa.array(location_ids, pa.int32()),
+            location_names.dictionary_encode(),
+            latitudes.cast(pa.float64()),
+            longitudes.cast(pa.float64()),
+            _dates(dates),
+            metrics.dictionary_encode(),
+            pa.array(values, pa.float64()),
+            units.dictionary_encode(),
+            _quality_dictionary(qualities),
+        ],
+        schema=ARROW_SCHEMA,
+    )
+
+
+def serialize_rows(rows, dimensions, meta=None):
+    """Serialize rows as a complete IPC stream, carrying ``meta`` as schema metadata"""
+    schema = ARROW_SCHEMA
+    if meta is not None:
+        schema = schema.with_metadata({"meta": json.dumps(meta)})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(record_batch(rows, dimensions))
+    return sink.getvalue().to_pybytes()
+
+
+def stream_batches(partitions, dimensions):
+    """Yield IPC stream bytes, one record batch per partition of rows"""
+    buffer = io.BytesIO()
+    with pa.ipc.new_stream(buffer, ARROW_SCHEMA) as writer:
+        for rows in partitions:
+            writer.write_batch(record_batch(rows, dimensions))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
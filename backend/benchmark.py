@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Benchmark helper script for EcoVision Climate Visualizer
+Times request paths against the configured database (DATABASE_URL)
+"""
+
+import os
+import sys
+import threading
+import time
+from functools import partial
+from dotenv import load_dotenv
+
+load_dotenv()
+# Every request should reach the database
+os.environ["RESPONSE_CACHE_SIZE"] = "0"
+
+QUERY_FILTERS = (
+    "location_id=1&metric=temperature&quality_threshold=good",
+    "metric=humidity&start_date=2020-01-01&end_date=2020-03-31",
+    "quality_threshold=excellent",
+)
+READ_URLS = (
+    "/api/v1/climate?cursor=&per_page=50&location_id=1&metric=temperature",
+    "/api/v1/climate?per_page=50&location_id=2&metric=humidity"
+    "&start_date=2020-01-01&end_date=2020-03-31",
+    "/api/v1/summary?location_id=2&metric=temperature"
+    "&start_date=2020-01-01&end_date=2020-03-31",
+    "/api/v1/trends?location_id=3&metric=humidity"
+    "&start_date=2020-01-01&end_date=2020-12-31",
+)
+# Rows rewritten (with unchanged values) per writer transaction
+WRITE_SLICE = 2000
+ENDPOINTS = (
+    "/api/v1/climate?per_page=20&",
+    "/api/v1/climate?cursor=&per_page=20&",
+    "/api/v1/summary?",
+    "/api/v1/trends?",
+)
+
+
+def per_call_ms(function, iterations):
+    """Average wall time of ``function()`` in milliseconds, after a warm-up"""
+    for _ in range(min(iterations, 20)):
+        function()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def benchmark_queries(iterations):
+    """Compare rebuilding filtered statements per request with reusing templates"""
+    from werkzeug.datastructures import MultiDict
+
+    from app import create_app
+    from filters import filter_conditions, parse_filters, statement_templates
+    from models import db, ClimateData, Location, Metric
+
+    app = create_app()
+
+    def count_statement(*conditions):
+        return db.select(db.func.count()).select_from(ClimateData).where(*conditions)
+
+    def listing_statement(*conditions):
+        return (
+            db.select(*ClimateData.listing_columns())
+            .select_from(ClimateData)
+            .join(Location)
+            .join(Metric)
+            .where(*conditions)
+            .order_by(ClimateData.date.desc(), ClimateData.id.desc())
+            .limit(50)
+        )
+
+    def joined_query(args):
+        # Filtering as the routes did before filters.py: joins and a name match
+        query = ClimateData.query.join(Location).join(Metric)
+        if args.get("location_id"):
+            query = query.filter(ClimateData.location_id == int(args["location_id"]))
+        if args.get("metric"):
+            query = query.filter(Metric.name == args["metric"])
+        filters = parse_filters(args)
+        if filters.qualities is not None:
+            query = query.filter(ClimateData.quality.in_(filters.qualities))
+        if filters.start_date:
+            query = query.filter(ClimateData.date >= filters.start_date)
+        if filters.end_date:
+            query = query.filter(ClimateData.date <= filters.end_date)
+        return query
+
+    print(f"Statement overhead per request, ms ({iterations} iterations)")
+    print(f"{'statement':<10} {'joined':>8} {'rebuilt':>8} {'template':>9}  filters")
+    with app.app_context():
+        for query_string in QUERY_FILTERS:
+            args = MultiDict(
+                pair.split("=", 1) for pair in query_string.split("&") if pair
+            )
+            for label, build in (("count", count_statement), ("listing", None)):
+
+                def joined():
+                    query = joined_query(args)
+                    if build is None:
+                        query.with_entities(*ClimateData.listing_columns()).order_by(
+                            ClimateData.date.desc(), ClimateData.id.desc()
+                        ).limit(50).all()
+                    else:
+                        query.count()
+
+                def rebuilt():
+                    statement = (build or listing_statement)(
+                        *filter_conditions(parse_filters(args))
+                    )
+                    db.session.execute(statement).all()
+
+                def template():
+                    statement, params = statement_templates.get(
+                        label, parse_filters(args), build or listing_statement
+                    )
+                    db.session.execute(statement, params).all()
+
+                timings = [
+                    per_call_ms(run, iterations) for run in (joined, rebuilt, template)
+                ]
+                print(
+                    f"{label:<10} {timings[0]:>8.3f} {timings[1]:>8.3f} "
+                    f"{timings[2]:>9.3f}  {query_string}"
+                )
+
+    client = app.test_client()
+    print(f"\nEnd-to-end request latency, ms ({iterations} iterations)")
+    for endpoint in ENDPOINTS:
+        for query_string in QUERY_FILTERS:
+            url = endpoint + query_string
+            elapsed = per_call_ms(lambda: client.get(url), iterations)
+            print(f"{elapsed:>8.3f}  {url}")
+
+
+def run_readers(app, threads, seconds, writer):
+    """
+    Hit READ_URLS from ``threads`` clients for ``seconds``, optionally while a
+    writer keeps committing. Returns (latencies in ms, writer commits).
+    """
+    from sqlalchemy import text
+
+    from models import db
+
+    stop = threading.Event()
+    latencies = [[] for _ in range(threads)]
+    commits = [0]
+
+    def read(index):
+        client = app.test_client()
+        position = index
+        while not stop.is_set():
+            url = READ_URLS[position % len(READ_URLS)]
+            position += 1
+            start = time.perf_counter()
+            client.get(url)
+            latencies[index].append((time.perf_counter() - start) * 1000)
+
+    def write():
+        # Straight through the engine so no ORM hooks bump versions or
+        # invalidate rollups; values are rewritten unchanged
+        with app.app_context():
+            engine = db.engine
+        offset = 0
+        while not stop.is_set():
+            with engine.begin() as connection:
+                connection.execute(
+                    text(
+                        "UPDATE climate_data SET value = value "
+                        "WHERE id > :low AND id <= :high"
+                    ),
+                    {"low": offset, "high": offset + WRITE_SLICE},
+                )
+            commits[0] += 1
+            offset = (offset + WRITE_SLICE) % 1000000
+
+    workers = [threading.Thread(target=read, args=(index,)) for index in range(threads)]
+    if writer:
+        workers.append(threading.Thread(target=write))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+    return sorted(value for values in latencies for value in values), commits[0]
+
+
+def benchmark_reads(threads, seconds):
+    """Concurrent read throughput under each engine profile, with and without a writer"""
+    from app import create_app
+    from engine_profiles import ENGINE_PROFILES, sqlite_settings
+    from models import db
+
+    print(f"Concurrent reads: {threads} threads, {seconds}s per run")
+    print(
+        f"{'profile':<12} {'writer':<7} {'req/s':>8} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'commits':>8}"
+    )
+    for profile in ENGINE_PROFILES:
+        os.environ["DB_ENGINE_PROFILE"] = profile
+        app = create_app()
+        with app.app_context():
+            if db.engine.dialect.name == "sqlite":
+                with db.engine.connect() as connection:
+                    settings = sqlite_settings(connection.connection.dbapi_connection)
+                print(f"{profile:<12} {settings}")
+
+        for writer in (False, True):
+            latencies, commits = run_readers(app, threads, seconds, writer)
+            count = len(latencies)
+            p50 = latencies[count // 2] if count else 0
+            p95 = latencies[int(count * 0.95)] if count else 0
+            print(
+                f"{profile:<12} {'yes' if writer else 'no':<7} {count / seconds:>8.1f} "
+                f"{p50:>8.2f} {p95:>8.2f} {commits if writer else '-':>8}"
+            )
+
+        with app.app_context():
+            db.engine.dispose()
+
+
+def sample_rows(count):
+    """
+    ``count`` listing rows as the Decimal/date result processors returned them
+    and as listing_columns() returns them now (floats, ISO date strings)
+    """
+    from datetime import date, timedelta
+    from decimal import Decimal
+
+    from models import QualityLevel
+
+    qualities = list(QualityLevel)
+    decimal_rows = []
+    native_rows = []
+    for index in range(count):
+        day = date(2000, 1, 1) + timedelta(days=index % 9000)
+        value = Decimal(index % 40000 - 20000).scaleb(-4)
+        quality = qualities[index % len(qualities)]
+        decimal_rows.append(
+            (
+                index + 1,
+                index % 3 + 1,
+                "Irvine",
+                Decimal("33.68460000"),
+                Decimal("-117.82650000"),
+                day,
+                "temperature",
+                value,
+                "celsius",
+                quality,
+            )
+        )
+        native_rows.append(
+            (index + 1, index % 3 + 1, 1, day.isoformat(), float(value), quality)
+        )
+    return decimal_rows, native_rows
+
+
+def decimal_row_to_dict(row):
+    """ClimateData.row_to_dict as it was before the JSON provider handled types"""
+    (
+        data_id,
+        location_id,
+        location_name,
+        latitude,
+        longitude,
+        day,
+        metric,
+        value,
+        unit,
+        quality,
+    ) = row
+    return {
+        "id": data_id,
+        "location_id": location_id,
+        "location_name": location_name,
+        "latitude": float(latitude),
+        "longitude": float(longitude),
+        "date": day.strftime("%Y-%m-%d"),
+        "metric": metric,
+        "value": float(value),
+        "unit": unit,
+        "quality": quality.value,
+    }
+
+
+def benchmark_json(sizes, iterations):
+    """Row conversion and response encoding time per JSON provider"""
+    from flask import Flask
+    from flask.json.provider import DefaultJSONProvider
+
+    from json_provider import ClimateJSONProvider, OrjsonProvider, orjson
+    from models import ClimateData
+
+    app = Flask(__name__)
+    # Native rows carry ids; names and coordinates come from dimension lookups
+    native_row_to_dict = partial(
+        ClimateData.row_to_dict,
+        location_lookup={
+            location_id: ("Irvine", 33.6846, -117.8265) for location_id in (1, 2, 3)
+        },
+        metric_lookup={1: ("temperature", "celsius")},
+    )
+    paths = [
+        ("decimal + stdlib", decimal_row_to_dict, DefaultJSONProvider(app)),
+        ("native + stdlib", native_row_to_dict, ClimateJSONProvider(app)),
+    ]
+    if orjson is not None:
+        paths.append(("native + orjson", native_row_to_dict, OrjsonProvider(app)))
+    else:
+        print("orjson is not installed; only the standard library is timed")
+
+    print(f"JSON serialization, ms ({iterations} iterations)")
+    print(f"{'rows':>8}  {'path':<18} {'convert':>9} {'encode':>9} {'total':>9}")
+    for size in sizes:
+        decimal_rows, native_rows = sample_rows(size)
+        bodies = set()
+        for name, row_to_dict, provider in paths:
+            rows = decimal_rows if row_to_dict is decimal_row_to_dict else native_rows
+            payload = {"data": [row_to_dict(row) for row in rows]}
+            bodies.add(provider.response(payload).get_data())
+
+            convert = per_call_ms(
+                lambda: [row_to_dict(row) for row in rows], iterations
+            )
+            encode = per_call_ms(lambda: provider.response(payload), iterations)
+            print(
+                f"{size:>8}  {name:<18} {convert:>9.2f} {encode:>9.2f} "
+                f"{convert + encode:>9.2f}"
+            )
+        if len(bodies) != 1:
+            print(f"{size:>8}  WARNING: providers produced different bodies")
+
+
+def main():
+    """Main CLI interface"""
+    if len(sys.argv) < 2:
+        print("EcoVision Climate Visualizer - Benchmarks")
+        print("\nUsage:")
+        print(
+            "  python benchmark.py queries [iterations]  - Statement and request overhead"
+        )
+        print(
+            "  python benchmark.py reads [threads] [seconds]  - Concurrent reads per engine profile"
+        )
+        print(
+            "  python benchmark.py json [rows ...]  - JSON serialization per provider"
+            " (default 10000 100000 rows)"
+        )
+        print("\nRuns against DATABASE_URL (or the default database) with the")
+        print("response cache disabled.")
+        return
+
+    command = sys.argv[1].lower()
+
+    if command == "queries":
+        iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+        benchmark_queries(iterations)
+
+    elif command == "reads":
+        threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+        seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+        benchmark_reads(threads, seconds)
+
+    elif command == "json":
+        sizes = [int(size) for size in sys.argv[2:]] or [10000, 100000]
+        benchmark_json(sizes, 5)
+
+    else:
+        print(f"Unknown command: {command}")
+        print("Run 'python benchmark.py' for help")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Versioned in-process response cache for EcoVision Climate Visualizer
+Entries are keyed on the normalized filter set and invalidated by a data
+version stamp that is bumped in the same transaction as any data write.
+The same key and version give every response its ETag.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, request
+from sqlalchemy import event, update
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from arrow_format import arrow_requested
+from models import db, ClimateData, DataVersion, Location, Metric
+
+FILTER_PARAMS = (
+    "location_id",
+    "bbox",
+    "near",
+    "k",
+    "start_date",
+    "end_date",
+    "metric",
+    "quality_threshold",
+)
+PAGE_PARAMS = ("page", "per_page", "cursor", "with_count")
+
+TRACKED_TABLES = {
+    ClimateData.__table__.name,
+    Location.__table__.name,
+    Metric.__table__.name,
+}
+
+WRITE_FLAG = "data_version_dirty"
+
+
+def get_data_version():
+    """
+    Return the current data version stamp (0 before the first write, or while
+    the database has no data_version table yet)
+    """
+    try:
+        shards = current_app.extensions.get("shards")
+        if shards is not None:
+            # Every shard bumps its own stamp, so their sum moves on any write
+            return shards.data_version()
+        version = db.session.execute(
+            db.select(DataVersion.version).where(DataVersion.id == 1)
+        ).scalar()
+    except (OperationalError, ProgrammingError):
+        # A database not yet migrated cannot take writes either, since every
+        # write bumps the stamp, so its data stays at version 0
+        db.session.rollback()
+        return 0
+    return version or 0
+
+
+def request_data_version():
+    """get_data_version(), read once per request and shared by everything it serves"""
+    if "data_version" not in g:
+        g.data_version = get_data_version()
+    return g.data_version
+
+
+def bump_data_version(session):
+    """Increment the data version inside the session's current transaction"""
+    result = session.execute(
+        update(DataVersion)
+        .where(DataVersion.id == 1)
+        .values(version=DataVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        session.execute(db.insert(DataVersion).values(id=1, version=1))
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _track_bulk_writes(orm_execute_state):
+    if not (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    if table is not None and table.name in TRACKED_TABLES:
+        orm_execute_state.session.info[WRITE_FLAG] = True
+
+
+@event.listens_for(db.session, "after_flush")
+def _track_flushed_writes(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if getattr(obj, "__tablename__", None) in TRACKED_TABLES:
+            session.info[WRITE_FLAG] = True
+            return
+
+
+@event.listens_for(db.session, "before_commit")
+def _bump_on_commit(session):
+    session.flush()
+    if session.info.pop(WRITE_FLAG, False):
+        bump_data_version(session)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _clear_on_rollback(session, previous_transaction):
+    session.info.pop(WRITE_FLAG, None)
+
+
+class ResponseCache:
+    """Bounded LRU of serialized responses tagged with a data version"""
+
+    def __init__(self, app=None):
+        self.max_entries = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.setdefault("RESPONSE_CACHE_SIZE", 256)
+        app.extensions["response_cache"] = self
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, version, body):
+        with self.lock:
+            self.entries[key] = (version, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "size": len(self.entries),
+                "max_entries": self.max_entries,
+            }
+
+
+response_cache = ResponseCache()
+
+
+def normalized_filters(params):
+    """Build a hashable key from the recognised, non-empty query parameters"""
+    key = []
+    for name in params:
+        if name in ("location_id", "k", "page", "per_page"):
+            value = request.args.get(name, type=int)
+        elif name == "cursor":
+            # An empty cursor still selects keyset mode, so presence matters
+            value = request.args.get(name)
+        else:
+            value = request.args.get(name) or None
+        if value is not None:
+            key.append((name, value))
+    return tuple(key)
+
+
+def response_etag(key, version):
+    """Strong ETag for a response cache key at a data version"""
+    # repr() rather than hash(): string hashing is salted per process, and
+    # every worker must hand out the same tag for the same response
+    return hashlib.sha1(repr((version, key)).encode()).hexdigest()
+
+
+def tag_response(response, etag):
+    """Attach the ETag and ask clients to revalidate before reusing the body"""
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+def cached_response(params=FILTER_PARAMS, store=True):
+    """
+    Serve a view from the response cache while the data version holds.
+    A request whose If-None-Match names the current ETag gets 304 before the
+    view runs; ``store=False`` (streamed responses) only adds the ETag.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # JSON and Arrow renderings of the same filters are cached separately
+            key = (request.path, arrow_requested(), normalized_filters(params))
+            version = request_data_version()
+            etag = response_etag(key, version)
+            if request.if_none_match.contains_weak(etag):
+                return tag_response(current_app.response_class(status=304), etag)
+
+            cache_body = store and response_cache.enabled
+            if cache_body:
+                entry = response_cache.get(key, version)
+                if entry is not None:
+                    body, mimetype = entry
+                    return tag_response(
+                        current_app.response_class(body, mimetype=mimetype), etag
+                    )
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                if cache_body:
+                    response_cache.set(
+                        key, version, (response.get_data(), response.mimetype)
+                    )
+                tag_response(response, etag)
+            return response
+
+        return wrapper
+
+    return decorator
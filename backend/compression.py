@@ -0,0 +1,111 @@
+"""
+Response compression for EcoVision Climate Visualizer
+API responses above a size threshold are sent brotli- or gzip-encoded,
+whichever the client accepts first in COMPRESSION_ENCODINGS order
+"""
+
+import zlib
+
+from flask import request
+
+from arrow_format import ARROW_STREAM_MIMETYPE
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+DEFAULT_ENCODINGS = ("br", "gzip")
+COMPRESSIBLE_MIMETYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    ARROW_STREAM_MIMETYPE,
+)
+
+
+def supported_encodings(names):
+    """The encodings from ``names`` this process can produce, in order"""
+    available = {"gzip"} | ({"br"} if brotli is not None else set())
+    unknown = [name for name in names if name not in DEFAULT_ENCODINGS]
+    if unknown:
+        raise ValueError(
+            f"Unknown COMPRESSION_ENCODINGS {', '.join(unknown)}. "
+            f"Use: {', '.join(DEFAULT_ENCODINGS)}"
+        )
+    return tuple(name for name in names if name in available)
+
+
+def compressor(encoding, config):
+    """(compress, finish) callables of a new encoder for one response body"""
+    if encoding == "br":
+        encoder = brotli.Compressor(quality=config["COMPRESSION_BROTLI_LEVEL"])
+        return encoder.process, encoder.finish
+    # wbits 31 writes a gzip header and trailer around the deflate stream
+    encoder = zlib.compressobj(config["COMPRESSION_GZIP_LEVEL"], zlib.DEFLATED, 31)
+    return encoder.compress, encoder.flush
+
+
+def compress_stream(chunks, compress, finish):
+    """Encode a streamed body chunk by chunk"""
+    try:
+        for chunk in chunks:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def init_compression(app):
+    """Compress eligible responses after every request"""
+    app.config.setdefault("COMPRESSION_ENCODINGS", DEFAULT_ENCODINGS)
+    app.config.setdefault("COMPRESSION_MIN_SIZE", 1024)
+    app.config.setdefault("COMPRESSION_GZIP_LEVEL", 6)
+    app.config.setdefault("COMPRESSION_BROTLI_LEVEL", 4)
+    encodings = supported_encodings(app.config["COMPRESSION_ENCODINGS"])
+
+    @app.after_request
+    def compress_response(response):
+        if (
+            not encodings
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        if (
+            not response.is_streamed
+            and len(response.get_data()) < app.config["COMPRESSION_MIN_SIZE"]
+        ):
+            return response
+
+        encoding = request.accept_encodings.best_match(encodings)
+        if encoding is None:
+            return response
+
+        compress, finish = compressor(encoding, app.config)
+        if response.is_streamed:
+            # Exports have no length up front, so they are always encoded
+            response.response = compress_stream(
+                response.iter_encoded(), compress, finish
+            )
+            response.headers.pop("Content-Length", None)
+        else:
+            response.set_data(compress(response.get_data()) + finish())
+        response.headers["Content-Encoding"] = encoding
+
+        # The encoded bytes differ from the identity body, so a strong
+        # validator becomes weak; If-None-Match still compares weakly
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    return compress_response
@@ -0,0 +1,110 @@
+"""
+Process-wide dimension lookups for EcoVision Climate Visualizer
+Locations and metrics are loaded once per data version instead of being
+queried or joined on every request: readings are selected from climate_data
+alone and get their names, units and coordinates from these maps, and
+spatial filters resolve to location ids through the grid index built with them
+"""
+
+import threading
+from collections import namedtuple
+
+import numpy as np
+from flask import g
+from sqlalchemy.exc import SQLAlchemyError
+
+from cache import get_data_version, request_data_version
+from models import db, Location, Metric
+from spatial import SpatialIndex
+
+# Immutable snapshot handed to callers, so a concurrent reload never changes
+# the maps underneath a request
+Dimensions = namedtuple(
+    "Dimensions",
+    [
+        "version",
+        "location_ids",
+        "metric_ids",
+        "metric_ids_by_name",
+        "locations",
+        "metrics",
+        "location_lookup",
+        "metric_lookup",
+        "spatial_index",
+    ],
+)
+
+
+class DimensionCache:
+    """Locations and metrics with their lookups, reloaded when the data version moves"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+
+    def _load(self, version):
+        locations = db.session.execute(db.select(Location)).scalars().all()
+        metrics = db.session.execute(db.select(Metric)).scalars().all()
+        location_lookup = {
+            location.id: (
+                location.name,
+                float(location.latitude),
+                float(location.longitude),
+            )
+            for location in locations
+        }
+        return Dimensions(
+            version=version,
+            location_ids=np.array(
+                sorted(location.id for location in locations), dtype=np.int64
+            ),
+            metric_ids=np.array(
+                sorted(metric.id for metric in metrics), dtype=np.int64
+            ),
+            metric_ids_by_name={metric.name: metric.id for metric in metrics},
+            locations=tuple(location.to_dict() for location in locations),
+            metrics=tuple(metric.to_dict() for metric in metrics),
+            location_lookup=location_lookup,
+            metric_lookup={metric.id: (metric.name, metric.unit) for metric in metrics},
+            spatial_index=SpatialIndex(
+                list(location_lookup),
+                [latitude for _, latitude, _ in location_lookup.values()],
+                [longitude for _, _, longitude in location_lookup.values()],
+            ),
+        )
+
+    def current(self, version=None):
+        """Return the snapshot for the current data version, reloading if stale"""
+        if version is None:
+            version = get_data_version()
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.version != version:
+            with self.lock:
+                snapshot = self.snapshot
+                if snapshot is None or snapshot.version != version:
+                    snapshot = self.snapshot = self._load(version)
+        return snapshot
+
+    def clear(self):
+        with self.lock:
+            self.snapshot = None
+
+
+dimension_cache = DimensionCache()
+
+
+def current_dimensions():
+    """The dimension snapshot for the current data version (once per request)"""
+    if "dimensions" not in g:
+        g.dimensions = dimension_cache.current(request_data_version())
+    return g.dimensions
+
+
+def init_dimensions(app):
+    """Load the dimensions at startup; before the schema exists they load on first use"""
+    dimension_cache.clear()
+    with app.app_context():
+        try:
+            dimension_cache.current()
+        except SQLAlchemyError:
+            db.session.rollback()
@@ -0,0 +1,130 @@
+"""
+Vectorized chart downsampling for EcoVision Climate Visualizer
+Series are given as one concatenated pair of x/y arrays with per-series start
+offsets and lengths, and every series is reduced in the same NumPy pass
+"""
+
+import numpy as np
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+
+def _first_match(matches, starts):
+    """Index of the first True in each segment of ``matches`` beginning at ``starts``"""
+    total = len(matches)
+    positions = np.where(matches, np.arange(total), total)
+    return np.minimum.reduceat(positions, starts)
+
+
+def _segment_extreme(values, starts, reduce):
+    """Index of the first minimum or maximum (per ``reduce``) in each segment"""
+    extremes = reduce.reduceat(values, starts)
+    sizes = np.diff(np.append(starts, len(values)))
+    return _first_match(values == np.repeat(extremes, sizes), starts)
+
+
+def minmax_indices(y, starts, lengths, max_points):
+    """
+    Keep the minimum and maximum of ``max_points // 2`` equal-count buckets per
+    series. Every series must be longer than ``max_points`` and the series
+    must be adjacent in ``y``. Returns sorted indices into ``y``.
+    """
+    n_buckets = max_points // 2
+    bucket = np.arange(n_buckets)
+    bounds = (
+        starts[:, None] + (bucket[None, :] * lengths[:, None]) // n_buckets
+    ).ravel()
+    return np.unique(
+        np.concatenate(
+            (
+                _segment_extreme(y, bounds, np.minimum),
+                _segment_extreme(y, bounds, np.maximum),
+            )
+        )
+    )
+
+
+def lttb_indices(x, y, starts, lengths, max_points):
+    """
+    Largest-Triangle-Three-Buckets: keep each series' first and last points
+    and, from each of ``max_points - 2`` buckets between them, the point
+    forming the largest triangle with the previously kept point and the next
+    bucket's mean. Every series must be longer than ``max_points`` and the
+    series must be adjacent in ``x``/``y``. Returns sorted indices.
+
+    The choice in a bucket depends on the previous bucket's, so buckets are
+    walked in order, but each step handles that bucket of every series at once.
+    """
+    n_series = len(starts)
+    n_buckets = max_points - 2
+
+    # Bucket bounds per series, as offsets: bounds[:, j] is where bucket j
+    # starts; column 0 is the first point and the last column the last point
+    bucket = np.arange(n_buckets + 1)
+    bounds = np.empty((n_series, n_buckets + 2), dtype=np.int64)
+    bounds[:, 0] = 0
+    bounds[:, 1:] = (bucket[None, :] * (lengths[:, None] - 2)) // n_buckets + 1
+    sizes = np.diff(np.concatenate((bounds, lengths[:, None]), axis=1), axis=1)
+
+    # Mean of every segment (first point, buckets, last point) in one pass
+    segment_starts = (starts[:, None] + bounds).ravel()
+    segment_sizes = sizes.ravel()
+    mean_x = (np.add.reduceat(x, segment_starts) / segment_sizes).reshape(sizes.shape)
+    mean_y = (np.add.reduceat(y, segment_starts) / segment_sizes).reshape(sizes.shape)
+
+    # Middle points ordered by (bucket, series, position), so each step reads
+    # one contiguous slice holding that bucket for every series
+    middle = np.repeat(segment_starts, segment_sizes) + (
+        np.arange(segment_sizes.sum())
+        - np.repeat(np.cumsum(segment_sizes) - segment_sizes, segment_sizes)
+    )
+    bucket_of = np.repeat(np.tile(np.arange(n_buckets + 2), n_series), segment_sizes)
+    inner = (bucket_of > 0) & (bucket_of <= n_buckets)
+    middle = middle[inner][np.argsort(bucket_of[inner], kind="stable")]
+    step_sizes = sizes[:, 1 : n_buckets + 1]
+    step_ends = np.cumsum(step_sizes.sum(axis=0))
+
+    kept = np.empty((n_series, max_points), dtype=np.int64)
+    kept[:, 0] = starts
+    kept[:, -1] = starts + lengths - 1
+    previous = starts.copy()
+    step_start = 0
+    for step in range(n_buckets):
+        points = middle[step_start : step_ends[step]]
+        counts = step_sizes[:, step]
+        ax = np.repeat(x[previous], counts)
+        ay = np.repeat(y[previous], counts)
+        cx = np.repeat(mean_x[:, step + 2], counts)
+        cy = np.repeat(mean_y[:, step + 2], counts)
+        # Twice the triangle area; the constant factor does not change the pick
+        areas = np.abs((ax - cx) * (y[points] - ay) - (ax - x[points]) * (cy - ay))
+        local_starts = np.cumsum(counts) - counts
+        best = _segment_extreme(areas, local_starts, np.maximum)
+        previous = points[best]
+        kept[:, step + 1] = previous
+        step_start = step_ends[step]
+    return kept.ravel()
+
+
+def downsample(x, y, series_starts, series_lengths, max_points, method="lttb"):
+    """
+    Indices into ``x``/``y`` of the points kept for each series (series are
+    adjacent slices), in order. Series of at most ``max_points`` points are
+    kept whole.
+    """
+    series_starts = np.asarray(series_starts, dtype=np.int64)
+    series_lengths = np.asarray(series_lengths, dtype=np.int64)
+    long = series_lengths > max_points
+    if not long.any():
+        return np.arange(len(x))
+
+    # Run the reducers on the long series alone, packed back to back
+    in_long = np.repeat(long, series_lengths)
+    packed = np.flatnonzero(in_long)
+    lengths = series_lengths[long]
+    starts = np.cumsum(lengths) - lengths
+    if method == "lttb":
+        reduced = lttb_indices(x[packed], y[packed], starts, lengths, max_points)
+    else:
+        reduced = minmax_indices(y[packed], starts, lengths, max_points)
+    return np.sort(np.concatenate((np.flatnonzero(~in_long), packed[reduced])))
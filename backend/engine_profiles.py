@@ -0,0 +1,98 @@
+"""
+Database engine profiles for EcoVision Climate Visualizer
+A named profile, chosen with DB_ENGINE_PROFILE, sets the per-connection SQLite
+pragmas or the MySQL connection pool options
+"""
+
+from sqlalchemy import event
+
+DEFAULT_PROFILE = "standard"
+PRAGMA_NAMES = ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store")
+
+# Pragmas run on every new SQLite connection, in order. journal_mode=WAL is
+# stored in the database file; the others only last for the connection.
+# Negative cache_size values are KiB rather than pages.
+SQLITE_PRAGMAS = {
+    "standard": (("journal_mode", "WAL"),),
+    "balanced": (
+        ("journal_mode", "WAL"),
+        ("synchronous", "NORMAL"),
+        ("cache_size", -32768),
+        ("mmap_size", 268435456),
+        ("temp_store", "MEMORY"),
+    ),
+    "read_heavy": (
+        ("journal_mode", "WAL"),
+        ("synchronous", "NORMAL"),
+        ("cache_size", -131072),
+        ("mmap_size", 1073741824),
+        ("temp_store", "MEMORY"),
+    ),
+}
+
+# SQLAlchemy create_engine() pool options for MySQL
+MYSQL_POOL_OPTIONS = {
+    "standard": {},
+    "balanced": {
+        "pool_size": 10,
+        "max_overflow": 10,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    },
+    "read_heavy": {
+        "pool_size": 20,
+        "max_overflow": 30,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    },
+}
+
+ENGINE_PROFILES = tuple(SQLITE_PRAGMAS)
+
+
+def check_profile(profile):
+    """Raise ValueError for a profile name that is not defined"""
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(
+            f"Unknown DB_ENGINE_PROFILE {profile!r}. Use: {', '.join(ENGINE_PROFILES)}"
+        )
+
+
+def engine_options(database_url, profile):
+    """SQLALCHEMY_ENGINE_OPTIONS for a database URL under a profile"""
+    check_profile(profile)
+    if database_url.startswith("mysql"):
+        return dict(MYSQL_POOL_OPTIONS[profile])
+    return {}
+
+
+def apply_sqlite_pragmas(engine, profile, read_only=False):
+    """
+    Run the profile's pragmas on every connection the engine opens.
+    ``read_only`` engines (replicas) keep the journal mode the file already has.
+    """
+    check_profile(profile)
+    pragmas = [
+        (name, value)
+        for name, value in SQLITE_PRAGMAS[profile]
+        if not (read_only and name == "journal_mode")
+    ]
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def sqlite_settings(connection):
+    """Current values of the profile pragmas on a SQLite DBAPI connection"""
+    cursor = connection.cursor()
+    settings = {
+        name: cursor.execute(f"PRAGMA {name}").fetchone()[0] for name in PRAGMA_NAMES
+    }
+    cursor.close()
+    return settings
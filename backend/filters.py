@@ -0,0 +1,268 @@
+"""
+Shared request filters for EcoVision Climate Visualizer
+The common query parameters are parsed once per request and applied through
+statement templates: each filter combination is built and compiled once, and
+every later request only binds its values
+"""
+
+import math
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import bindparam
+
+from dimensions import current_dimensions
+from models import ClimateData, QualityLevel, QUALITY_RANKS
+
+# Metric names missing from the metrics table resolve to this id, which no
+# reading carries, so the request matches nothing as the name join did
+UNKNOWN_ID = -1
+
+# Qualities passing each quality_threshold, computed once at import
+QUALITY_THRESHOLDS = {
+    threshold.value: tuple(
+        quality
+        for quality, rank in QUALITY_RANKS.items()
+        if rank >= QUALITY_RANKS[threshold]
+    )
+    for threshold in QualityLevel
+}
+QUALITY_THRESHOLD_ERROR = "Invalid quality_threshold. Use: " + ", ".join(
+    QUALITY_THRESHOLDS
+)
+# /summary and /trends have always answered without the list of levels
+SHORT_QUALITY_THRESHOLD_ERROR = "Invalid quality_threshold"
+BBOX_ERROR = "Invalid bbox. Use: min_lon,min_lat,max_lon,max_lat"
+NEAR_ERROR = "Invalid near. Use: latitude,longitude"
+DEFAULT_NEAREST = 10
+MAX_NEAREST = 1000
+
+ClimateFilters = namedtuple(
+    "ClimateFilters",
+    [
+        "location_id",
+        "location_ids",
+        "metric_name",
+        "metric_id",
+        "qualities",
+        "start_date",
+        "end_date",
+    ],
+)
+
+
+class FilterError(ValueError):
+    """A filter query parameter that cannot be parsed"""
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise FilterError(f"Invalid {name} format. Use YYYY-MM-DD") from None
+
+
+def _parse_coordinates(value, count, error):
+    try:
+        numbers = [float(part) for part in value.split(",")]
+    except ValueError:
+        raise FilterError(error) from None
+    if len(numbers) != count or not all(map(math.isfinite, numbers)):
+        raise FilterError(error)
+    return numbers
+
+
+def _valid_point(latitude, longitude):
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+def _spatial_selection(args):
+    """
+    Sorted, distinct ids of the locations picked by bbox and near/k, or None
+    when neither is given. With both, the k nearest locations inside the box.
+    """
+    bbox = args.get("bbox")
+    near = args.get("near")
+    if not bbox and not near:
+        return None
+
+    box = None
+    if bbox:
+        box = _parse_coordinates(bbox, 4, BBOX_ERROR)
+        min_lon, min_lat, max_lon, max_lat = box
+        if (
+            not _valid_point(min_lat, min_lon)
+            or not _valid_point(max_lat, max_lon)
+            or min_lat > max_lat
+        ):
+            raise FilterError(BBOX_ERROR)
+
+    index = current_dimensions().spatial_index
+    if not near:
+        return np.unique(index.within(*box))
+
+    latitude, longitude = _parse_coordinates(near, 2, NEAR_ERROR)
+    if not _valid_point(latitude, longitude):
+        raise FilterError(NEAR_ERROR)
+    k = min(max(args.get("k", DEFAULT_NEAREST, type=int), 1), MAX_NEAREST)
+    return np.unique(index.nearest(latitude, longitude, k, within=box))
+
+
+def parse_filters(args, quality_error=QUALITY_THRESHOLD_ERROR):
+    """
+    Parse location_id, bbox, near, k, start_date, end_date, metric and
+    quality_threshold from request args, raising FilterError with the
+    client-facing message (``quality_error`` for an unknown threshold). The
+    metric name is resolved to its id, and ``qualities`` is None whenever
+    every quality passes. bbox and near/k resolve to the sorted tuple
+    ``location_ids``, which is None when they are absent or select every
+    location.
+    """
+    start_date = args.get("start_date")
+    end_date = args.get("end_date")
+    start_date = _parse_date(start_date, "start_date") if start_date else None
+    end_date = _parse_date(end_date, "end_date") if end_date else None
+
+    metric_name = args.get("metric") or None
+    metric_id = None
+    if metric_name:
+        metric_id = current_dimensions().metric_ids_by_name.get(metric_name, UNKNOWN_ID)
+
+    qualities = None
+    quality_threshold = args.get("quality_threshold")
+    if quality_threshold:
+        if quality_threshold not in QUALITY_THRESHOLDS:
+            raise FilterError(quality_error)
+        # quality is NOT NULL, so a threshold every level passes needs no clause
+        if len(QUALITY_THRESHOLDS[quality_threshold]) < len(QualityLevel):
+            qualities = QUALITY_THRESHOLDS[quality_threshold]
+
+    location_id = args.get("location_id", type=int) or None
+    location_ids = None
+    selected = _spatial_selection(args)
+    if selected is not None:
+        # An empty selection matches nothing, like an unknown metric name
+        if location_id:
+            if location_id not in selected:
+                location_ids = (UNKNOWN_ID,)
+        elif not len(selected):
+            location_ids = (UNKNOWN_ID,)
+        elif len(selected) < len(current_dimensions().location_ids):
+            location_ids = tuple(selected.tolist())
+
+    return ClimateFilters(
+        location_id=location_id,
+        location_ids=location_ids,
+        metric_name=metric_name,
+        metric_id=metric_id,
+        qualities=qualities,
+        start_date=start_date,
+        end_date=end_date,
+    )
+
+
+def location_in(column, location_ids):
+    """
+    ``column IN location_ids`` with the ids rendered into the SQL, so sets of
+    tens of thousands stay clear of the driver's bound-parameter limit
+    """
+    return column.in_(
+        bindparam(
+            "location_ids",
+            location_ids,
+            unique=True,
+            expanding=True,
+            literal_execute=True,
+        )
+    )
+
+
+def _quality_condition(qualities):
+    # Threshold tuples are in rank order and quality is stored as its rank,
+    # so the threshold is a range on idx_quality_date / idx_date_quality
+    return ClimateData.quality >= qualities[0]
+
+
+def filter_conditions(filters, dates=True):
+    """WHERE clauses for the filters on climate_data alone, with literal values"""
+    conditions = []
+    if filters.location_id:
+        conditions.append(ClimateData.location_id == filters.location_id)
+    if filters.location_ids is not None:
+        conditions.append(location_in(ClimateData.location_id, filters.location_ids))
+    if filters.metric_id is not None:
+        conditions.append(ClimateData.metric_id == filters.metric_id)
+    if filters.qualities is not None:
+        conditions.append(_quality_condition(filters.qualities))
+    if dates and filters.start_date:
+        conditions.append(ClimateData.date >= filters.start_date)
+    if dates and filters.end_date:
+        conditions.append(ClimateData.date <= filters.end_date)
+    return conditions
+
+
+def filtered_query(filters, dates=True):
+    """ClimateData query with the filters applied and no dimension joins"""
+    return ClimateData.query.filter(*filter_conditions(filters, dates))
+
+
+# Bound-parameter form of each filter; templates reuse these clause objects
+BOUND_CONDITIONS = {
+    "location_id": ClimateData.location_id == bindparam("location_id"),
+    "location_ids": ClimateData.location_id.in_(
+        bindparam("location_ids", expanding=True, literal_execute=True)
+    ),
+    "metric_id": ClimateData.metric_id == bindparam("metric_id"),
+    "start_date": ClimateData.date >= bindparam("start_date"),
+    "end_date": ClimateData.date <= bindparam("end_date"),
+}
+
+
+class StatementTemplates:
+    """
+    Statements keyed on a name and the set of active filters. A template is
+    reused as the same object, so SQLAlchemy's memoized cache key and
+    compiled SQL are hit instead of rebuilding the query on every request.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.templates = {}
+
+    def get(self, name, filters, build, dates=True):
+        """
+        Return (statement, params) for ``build(*conditions)``. ``build`` must
+        take every per-request value through bindparam(), supplying it in
+        the params passed to execute alongside the returned ones.
+        """
+        params = {}
+        if filters.location_id:
+            params["location_id"] = filters.location_id
+        if filters.location_ids is not None:
+            params["location_ids"] = filters.location_ids
+        if filters.metric_id is not None:
+            params["metric_id"] = filters.metric_id
+        if dates and filters.start_date:
+            params["start_date"] = filters.start_date
+        if dates and filters.end_date:
+            params["end_date"] = filters.end_date
+
+        # The quality set is part of the shape, so its values are baked in
+        key = (name, tuple(params), filters.qualities)
+        statement = self.templates.get(key)
+        if statement is None:
+            conditions = [BOUND_CONDITIONS[param] for param in params]
+            if filters.qualities is not None:
+                conditions.append(_quality_condition(filters.qualities))
+            with self.lock:
+                statement = self.templates.setdefault(key, build(*conditions))
+        return statement, params
+
+    def clear(self):
+        with self.lock:
+            self.templates.clear()
+
+
+statement_templates = StatementTemplates()
@@ -0,0 +1,338 @@
+"""
+Batch ingestion for EcoVision Climate Visualizer
+Readings are validated column-wise with NumPy, deduplicated on
+(location_id, metric_id, date) and upserted in chunked transactions
+"""
+
+import json
+from datetime import date
+
+import numpy as np
+from sqlalchemy import and_, or_, update
+
+from dimensions import current_dimensions
+from models import db, ClimateData, QualityLevel
+from sharding import assign_shard_ids, fan_out_shards, shard_index
+
+INGEST_CHUNK_SIZE = 5000
+# Keys per existence lookup, keeping bound parameters and OR terms well under
+# SQLite's variable and expression depth limits
+LOOKUP_SLICE = 500
+# Values keep the Numeric(10, 4) range and scale the API has always accepted
+VALUE_LIMIT = 1e6
+MAX_REPORTED_REJECTIONS = 50
+# NumPy parses years Python's date cannot hold (e.g. 0000), which would only
+# fail at insert time and take the whole batch down with them
+MIN_DATE = np.datetime64(date.min, "D")
+MAX_DATE = np.datetime64(date.max, "D")
+
+QUALITY_LEVELS = list(QualityLevel)
+QUALITY_CODES = {quality.value: code for code, quality in enumerate(QUALITY_LEVELS)}
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+
+# Checked in order; a reading is reported under the first rule it breaks
+REJECTION_REASONS = (
+    "malformed",
+    "unknown_location",
+    "unknown_metric",
+    "invalid_date",
+    "invalid_value",
+    "invalid_quality",
+)
+
+
+def parse_payload(body, mimetype):
+    """
+    Decode a JSON array (or {"climate_data": [...]}) or NDJSON body into a
+    list of readings. Unparseable NDJSON lines become None so they are
+    rejected individually; an unparseable JSON body raises ValueError.
+    """
+    if mimetype in NDJSON_MIMETYPES:
+        readings = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                readings.append(json.loads(line))
+            except ValueError:
+                readings.append(None)
+        return readings
+
+    payload = json.loads(body)
+    if isinstance(payload, dict):
+        payload = payload.get("climate_data", payload.get("readings"))
+    if not isinstance(payload, list):
+        raise ValueError("Expected a JSON array of readings")
+    return payload
+
+
+def _int_column(values):
+    return np.fromiter(
+        (value if type(value) is int else -1 for value in values),
+        dtype=np.int64,
+        count=len(values),
+    )
+
+
+def _date_column(values):
+    """Parse YYYY-MM-DD strings in one pass, falling back per value on bad input"""
+    strings = [
+        value if isinstance(value, str) and len(value) == 10 else "NaT"
+        for value in values
+    ]
+    try:
+        return np.array(strings, dtype="datetime64[D]")
+    except ValueError:
+        parsed = np.empty(len(strings), dtype="datetime64[D]")
+        for index, value in enumerate(strings):
+            try:
+                parsed[index] = np.datetime64(value, "D")
+            except ValueError:
+                parsed[index] = np.datetime64("NaT")
+        return parsed
+
+
+def validate_readings(readings):
+    """
+    Return (columns, reasons) for a list of readings. ``columns`` holds
+    location_id, metric_id, date, value and quality arrays; ``reasons`` holds
+    an index into REJECTION_REASONS per reading, or -1 when it is valid.
+    """
+    dimensions = current_dimensions()
+    count = len(readings)
+    records = [reading if isinstance(reading, dict) else {} for reading in readings]
+    metric_ids_by_name = dimensions.metric_ids_by_name
+
+    columns = {
+        "location_id": _int_column([record.get("location_id") for record in records]),
+        "metric_id": _int_column(
+            [
+                (
+                    record["metric_id"]
+                    if "metric_id" in record
+                    else metric_ids_by_name.get(record.get("metric"))
+                )
+                for record in records
+            ]
+        ),
+        "date": _date_column([record.get("date") for record in records]),
+        "value": np.fromiter(
+            (
+                value if type(value) in (int, float) else np.nan
+                for value in (record.get("value") for record in records)
+            ),
+            dtype=np.float64,
+            count=count,
+        ),
+        "quality": np.fromiter(
+            (QUALITY_CODES.get(record.get("quality"), -1) for record in records),
+            dtype=np.int64,
+            count=count,
+        ),
+    }
+
+    checks = (
+        np.fromiter((bool(record) for record in records), dtype=bool, count=count),
+        np.isin(columns["location_id"], dimensions.location_ids),
+        np.isin(columns["metric_id"], dimensions.metric_ids),
+        ~np.isnat(columns["date"])
+        & (columns["date"] >= MIN_DATE)
+        & (columns["date"] <= MAX_DATE),
+        np.isfinite(columns["value"]) & (np.abs(columns["value"]) < VALUE_LIMIT),
+        columns["quality"] >= 0,
+    )
+    reasons = np.full(count, -1, dtype=np.int64)
+    for code in range(len(checks) - 1, -1, -1):
+        reasons[~checks[code]] = code
+    return columns, reasons
+
+
+def latest_per_key(columns, positions):
+    """
+    Keep the last of the given reading positions for each
+    (location_id, metric_id, date), returning (kept, duplicates) positions
+    """
+    if not len(positions):
+        return positions, positions
+    keys = (
+        columns["date"][positions],
+        columns["metric_id"][positions],
+        columns["location_id"][positions],
+    )
+    # lexsort is stable, so equal keys stay in arrival order
+    ordered = positions[np.lexsort(keys)]
+    location = columns["location_id"][ordered]
+    metric = columns["metric_id"][ordered]
+    day = columns["date"][ordered]
+    last = np.ones(len(ordered), dtype=bool)
+    last[:-1] = (
+        (location[1:] != location[:-1])
+        | (metric[1:] != metric[:-1])
+        | (day[1:] != day[:-1])
+    )
+    return np.sort(ordered[last]), ordered[~last]
+
+
+def _lookup_clauses(keys):
+    """
+    Yield WHERE clauses covering at most LOOKUP_SLICE keys each, one
+    (location_id, metric_id, date IN ...) term per series. SQLite answers an
+    OR of these with one index search per date; a row-value IN scans the index.
+    """
+    dates_by_series = {}
+    for location_id, metric_id, day in keys:
+        dates_by_series.setdefault((location_id, metric_id), []).append(day)
+
+    terms = []
+    budget = LOOKUP_SLICE
+    for (location_id, metric_id), days in dates_by_series.items():
+        while days:
+            taken, days = days[:budget], days[budget:]
+            terms.append(
+                and_(
+                    ClimateData.location_id == location_id,
+                    ClimateData.metric_id == metric_id,
+                    ClimateData.date.in_(taken),
+                )
+            )
+            budget -= len(taken)
+            if not budget:
+                yield or_(*terms)
+                terms = []
+                budget = LOOKUP_SLICE
+    if terms:
+        yield or_(*terms)
+
+
+def _existing_readings(keys):
+    """Map (location_id, metric_id, date) to (id, value, quality) for stored keys"""
+    existing = {}
+    for clause in _lookup_clauses(keys):
+        rows = db.session.execute(
+            db.select(
+                ClimateData.location_id,
+                ClimateData.metric_id,
+                ClimateData.date,
+                ClimateData.id,
+                ClimateData.value,
+                ClimateData.quality,
+            ).where(clause)
+        )
+        for location_id, metric_id, day, data_id, value, quality in rows:
+            existing[(location_id, metric_id, day)] = (data_id, float(value), quality)
+    return existing
+
+
+def upsert_chunk(rows):
+    """
+    Insert new readings and update changed ones in the current transaction.
+    Returns (inserted, updated, unchanged) counts.
+    """
+    keys = [(row["location_id"], row["metric_id"], row["date"]) for row in rows]
+    existing = _existing_readings(keys)
+
+    inserts = []
+    updates = []
+    unchanged = 0
+    for key, row in zip(keys, rows):
+        stored = existing.get(key)
+        if stored is None:
+            inserts.append(row)
+        elif (
+            round(stored[1], 4) == round(row["value"], 4)
+            and stored[2] == row["quality"]
+        ):
+            unchanged += 1
+        else:
+            updates.append(
+                {"id": stored[0], "value": row["value"], "quality": row["quality"]}
+            )
+
+    if inserts:
+        assign_shard_ids(inserts)
+        db.session.execute(ClimateData.__table__.insert(), inserts)
+    if updates:
+        db.session.execute(update(ClimateData), updates)
+    return len(inserts), len(updates), unchanged
+
+
+def upsert_rows(rows, chunk_size=INGEST_CHUNK_SIZE):
+    """Upsert rows chunk by chunk, returning (inserted, updated, unchanged) totals"""
+    inserted = updated = unchanged = 0
+    for start in range(0, len(rows), chunk_size):
+        try:
+            counts = upsert_chunk(rows[start : start + chunk_size])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        inserted += counts[0]
+        updated += counts[1]
+        unchanged += counts[2]
+    return inserted, updated, unchanged
+
+
+def ingest_readings(readings, chunk_size=INGEST_CHUNK_SIZE):
+    """Validate, deduplicate and upsert readings, committing once per chunk"""
+    columns, reasons = validate_readings(readings)
+    valid = np.flatnonzero(reasons < 0)
+    kept, duplicates = latest_per_key(columns, valid)
+
+    dates = columns["date"][kept].astype(object)
+    rows = [
+        {
+            "location_id": int(location_id),
+            "metric_id": int(metric_id),
+            "date": day,
+            "value": float(value),
+            "quality": QUALITY_LEVELS[code],
+        }
+        for location_id, metric_id, day, value, code in zip(
+            columns["location_id"][kept].tolist(),
+            columns["metric_id"][kept].tolist(),
+            dates,
+            np.round(columns["value"][kept], 4).tolist(),
+            columns["quality"][kept].tolist(),
+        )
+    ]
+
+    shards = fan_out_shards()
+    if shards is None:
+        inserted, updated, unchanged = upsert_rows(rows, chunk_size)
+    else:
+        # Each shard upserts its own locations' readings concurrently
+        rows_by_shard = {}
+        for row in rows:
+            index = shard_index(row["location_id"], len(shards.engines))
+            rows_by_shard.setdefault(index, []).append(row)
+        futures = [
+            shards.submit(index, upsert_rows, shard_rows, chunk_size)
+            for index, shard_rows in sorted(rows_by_shard.items())
+        ]
+        inserted = updated = unchanged = 0
+        for future in futures:
+            counts = future.result()
+            inserted += counts[0]
+            updated += counts[1]
+            unchanged += counts[2]
+
+    rejected = np.flatnonzero(reasons >= 0)
+    reason_counts = np.bincount(reasons[rejected], minlength=len(REJECTION_REASONS))
+    return {
+        "received": len(readings),
+        "accepted": len(rows),
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": unchanged,
+        "duplicates": len(duplicates),
+        "rejected": len(rejected),
+        "rejection_reasons": {
+            reason: int(total)
+            for reason, total in zip(REJECTION_REASONS, reason_counts)
+            if total
+        },
+        "rejected_rows": [
+            {"index": int(index), "reason": REJECTION_REASONS[reasons[index]]}
+            for index in rejected[:MAX_REPORTED_REJECTIONS]
+        ],
+    }
@@ -7,31 +7,148 @@ This script creates the database, tables, and seeds initial data from sample_dat
 import json
 import os
 import sys
-from datetime import datetime
+import time
+from datetime import date
 from dotenv import load_dotenv
+from flask_migrate import stamp
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app import create_app
 from models import db, Location, Metric, ClimateData, QualityLevel
+from rollups import ensure_rollups, rebuild_rollups, rollups_ready
+from running_stats import verify_running_stats
 
 load_dotenv()
 
+SAMPLE_DATA_FILE = os.path.join(
+    os.path.dirname(__file__), "..", "data", "sample_data.json"
+)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
 
-def load_sample_data():
-    """Load sample data from JSON file"""
-    data_file = os.path.join(
-        os.path.dirname(__file__), "..", "data", "sample_data.json"
-    )
-    try:
+QUALITY_MAP = {quality.value: quality for quality in QualityLevel}
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_COMMIT_EVERY = 50000
+READ_CHUNK_SIZE = 1 << 20
+# Sections readings depend on; climate_data is loaded after both
+DIMENSION_SECTIONS = {"locations", "metrics"}
+
+
+class JsonStream:
+    """Incremental reader that decodes one JSON value at a time from a file"""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise json.JSONDecodeError("Unexpected end of file", self.buf, self.pos)
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expected '{char}'", self.buf, self.pos)
+        self.pos += 1
+
+    def decode(self):
+        """Decode the next complete value, reading more input as needed"""
+        self.peek()
+        while True:
+            try:
+                value, self.pos = self.decoder.raw_decode(self.buf, self.pos)
+                return value
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+
+    def iter_array(self):
+        """Yield the items of the array at the current position one by one"""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def _document_sections(f):
+    """
+    Yield a JSON document's top-level (key, value) pairs in file order, with
+    "climate_data" as a lazy iterator that must be consumed before advancing
+    """
+    stream = JsonStream(f)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        key = stream.decode()
+        stream.expect(":")
+        if key == "climate_data":
+            yield key, stream.iter_array()
+        else:
+            yield key, stream.decode()
+        if stream.peek() == ",":
+            stream.pos += 1
+            continue
+        stream.expect("}")
+        return
+
+
+def stream_dataset(data_file):
+    """
+    Yield (section, payload) pairs from a dataset file without loading it whole.
+    JSON documents yield their top-level keys in file order with "climate_data"
+    as a lazy iterator, except that readings always come after the locations
+    and metrics sections they reference: a climate_data section placed ahead
+    of them is skipped and streamed from a second read of the file instead.
+    NDJSON files (.ndjson/.jsonl) yield climate readings only.
+    Each climate_data iterator must be consumed before advancing.
+    """
+    with open(data_file, "r") as f:
+        if data_file.endswith((".ndjson", ".jsonl")):
+            yield "climate_data", (json.loads(line) for line in f if line.strip())
+            return
+
+        seen = set()
+        deferred = False
+        for key, payload in _document_sections(f):
+            if key == "climate_data" and not DIMENSION_SECTIONS <= seen:
+                # Seeded now, every reading would be rejected for an unknown
+                # location or metric; parse past it without keeping it
+                deferred = True
+                for _ in payload:
+                    pass
+                continue
+            seen.add(key)
+            yield key, payload
+
+    if deferred:
         with open(data_file, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print(f"Error: Could not find sample data file at {data_file}")
-        sys.exit(1)
-    except json.JSONDecodeError as e:
-        print(f"Error: Invalid JSON in sample data file: {e}")
-        sys.exit(1)
+            for key, payload in _document_sections(f):
+                if key == "climate_data":
+                    yield key, payload
 
 
 def seed_locations(locations_data):
@@ -80,54 +197,160 @@ def seed_metrics(metrics_data):
     print(f"✓ Seeded {len(metrics_data)} metrics")
 
 
-def seed_climate_data(climate_data):
-    """Seed climate data table"""
-    print("Seeding climate data...")
-    added_count = 0
+def validate_climate_batch(batch, location_ids, metric_ids):
+    """
+    Validate a batch of raw readings, returning (rows, rejected) where rows are
+    insert-ready dicts and rejected is a list of (data_point, reason)
+    """
+    rows = []
+    rejected = []
+    for data_point in batch:
+        try:
+            data_id = data_point["id"]
+            quality = QUALITY_MAP.get(data_point["quality"])
+            if not quality:
+                rejected.append(
+                    (data_point, f"Invalid quality level '{data_point['quality']}'")
+                )
+                continue
+
+            try:
+                reading_date = date.fromisoformat(data_point["date"])
+            except (TypeError, ValueError) as e:
+                rejected.append(
+                    (data_point, f"Invalid date format '{data_point['date']}': {e}")
+                )
+                continue
+
+            if data_point["location_id"] not in location_ids:
+                rejected.append(
+                    (data_point, f"Unknown location_id {data_point['location_id']}")
+                )
+                continue
+            if data_point["metric_id"] not in metric_ids:
+                rejected.append(
+                    (data_point, f"Unknown metric_id {data_point['metric_id']}")
+                )
+                continue
+
+            rows.append(
+                {
+                    "id": data_id,
+                    "location_id": data_point["location_id"],
+                    "metric_id": data_point["metric_id"],
+                    "date": reading_date,
+                    "value": float(data_point["value"]),
+                    "quality": quality,
+                }
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            rejected.append((data_point, f"Malformed data point: {e}"))
 
-    for data_point in climate_data:
-        existing = ClimateData.query.filter_by(id=data_point["id"]).first()
-        if existing:
-            continue
+    return rows, rejected
 
-        quality_map = {
-            "poor": QualityLevel.POOR,
-            "questionable": QualityLevel.QUESTIONABLE,
-            "good": QualityLevel.GOOD,
-            "excellent": QualityLevel.EXCELLENT,
-        }
 
-        quality = quality_map.get(data_point["quality"])
-        if not quality:
-            print(
-                f"  Warning: Invalid quality level '{data_point['quality']}' for data point {data_point['id']}"
-            )
-            continue
+def existing_climate_ids(ids):
+    """Return which of the given ids are already stored, in one lookup"""
+    if not ids:
+        return set()
+    return set(
+        db.session.execute(
+            db.select(ClimateData.id).where(ClimateData.id.in_(ids))
+        ).scalars()
+    )
 
-        try:
-            date = datetime.strptime(data_point["date"], "%Y-%m-%d").date()
-        except ValueError as e:
-            print(
-                f"  Warning: Invalid date format '{data_point['date']}' for data point {data_point['id']}: {e}"
-            )
-            continue
 
-        climate_reading = ClimateData(
-            id=data_point["id"],
-            location_id=data_point["location_id"],
-            metric_id=data_point["metric_id"],
-            date=date,
-            value=data_point["value"],
-            quality=quality,
+def bulk_load_climate_data(
+    climate_data,
+    batch_size=DEFAULT_BATCH_SIZE,
+    commit_every=DEFAULT_COMMIT_EVERY,
+    report_every=None,
+):
+    """
+    Insert readings from any iterable in validated, chunked batches.
+    Existing ids are skipped; a transaction is committed every ``commit_every``
+    inserted rows. Returns (inserted, skipped, rejected) counts.
+    """
+    location_ids = set(db.session.execute(db.select(Location.id)).scalars())
+    metric_ids = set(db.session.execute(db.select(Metric.id)).scalars())
+    insert = ClimateData.__table__.insert()
+
+    read = inserted = skipped = rejected = 0
+    pending = 0
+    next_report = report_every
+    started = time.perf_counter()
+
+    def flush(batch):
+        nonlocal inserted, skipped, rejected, pending
+        rows, invalid = validate_climate_batch(batch, location_ids, metric_ids)
+        for data_point, reason in invalid[:5]:
+            print(f"  Warning: {reason} for data point {data_point.get('id')}")
+        rejected += len(invalid)
+
+        existing = existing_climate_ids([row["id"] for row in rows])
+        fresh = []
+        for row in rows:
+            if row["id"] in existing:
+                skipped += 1
+                continue
+            existing.add(row["id"])
+            fresh.append(row)
+
+        if fresh:
+            db.session.execute(insert, fresh)
+            inserted += len(fresh)
+            pending += len(fresh)
+        if pending >= commit_every:
+            db.session.commit()
+            pending = 0
+
+    batch = []
+    for data_point in climate_data:
+        batch.append(data_point)
+        read += 1
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+            if next_report and read >= next_report:
+                elapsed = time.perf_counter() - started
+                print(
+                    f"  {read:,} read, {inserted:,} inserted "
+                    f"({read / elapsed:,.0f} rows/sec)"
+                )
+                next_report += report_every
+    if batch:
+        flush(batch)
+    db.session.commit()
+
+    elapsed = time.perf_counter() - started
+    if report_every:
+        print(
+            f"  {read:,} read, {inserted:,} inserted, {skipped:,} already present, "
+            f"{rejected:,} rejected in {elapsed:.1f}s "
+            f"({read / elapsed if elapsed else 0:,.0f} rows/sec)"
         )
-        db.session.add(climate_reading)
-        added_count += 1
+    return inserted, skipped, rejected
 
-    db.session.commit()
+
+def seed_climate_data(
+    climate_data, batch_size=DEFAULT_BATCH_SIZE, commit_every=DEFAULT_COMMIT_EVERY
+):
+    """Seed climate data table"""
+    print("Seeding climate data...")
+    added_count, _, _ = bulk_load_climate_data(
+        climate_data,
+        batch_size=batch_size,
+        commit_every=commit_every,
+        report_every=batch_size * 20,
+    )
     print(f"✓ Seeded {added_count} climate data points")
 
 
-def init_database():
+def init_database(
+    data_file=SAMPLE_DATA_FILE,
+    batch_size=DEFAULT_BATCH_SIZE,
+    commit_every=DEFAULT_COMMIT_EVERY,
+):
     """Initialize the database with tables and sample data"""
     print("=== EcoVision Database Initialization ===")
 
@@ -136,15 +359,36 @@ def init_database():
     with app.app_context():
 
         print("Creating database tables...")
+        fresh = not db.inspect(db.engine).has_table(ClimateData.__tablename__)
         db.create_all()
         print("✓ Database tables created")
 
-        print("Loading sample data...")
-        sample_data = load_sample_data()
+        # Tables created from the current models are already at the latest
+        # migration; an existing database is upgraded with migrate_db.py apply
+        if fresh:
+            stamp(directory=MIGRATIONS_DIR)
 
-        seed_locations(sample_data["locations"])
-        seed_metrics(sample_data["metrics"])
-        seed_climate_data(sample_data["climate_data"])
+        # Rollups on an empty database are trivially current and are then kept
+        # up to date as rows are inserted; existing data is rolled up once.
+        ensure_rollups()
+
+        print(f"Loading data from {data_file}...")
+        try:
+            for section, payload in stream_dataset(data_file):
+                if section == "locations":
+                    seed_locations(payload)
+                elif section == "metrics":
+                    seed_metrics(payload)
+                elif section == "climate_data":
+                    seed_climate_data(
+                        payload, batch_size=batch_size, commit_every=commit_every
+                    )
+        except FileNotFoundError:
+            print(f"Error: Could not find data file at {data_file}")
+            sys.exit(1)
+        except json.JSONDecodeError as e:
+            print(f"Error: Invalid JSON in data file: {e}")
+            sys.exit(1)
 
         print("\n=== Database initialization complete! ===")
         print(f"Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
@@ -159,6 +403,147 @@ def init_database():
         print(f"  Climate Data Points: {climate_data_count}")
 
 
+def copy_rows(source, target, statement, table, batch_size):
+    """Copy the rows of ``statement`` on one connection into ``table`` on another"""
+    keys = [column.key for column in table.columns]
+    copied = 0
+    result = source.execution_options(yield_per=batch_size).execute(statement)
+    for partition in result.partitions():
+        target.execute(table.insert(), [dict(zip(keys, row)) for row in partition])
+        copied += len(partition)
+    return copied
+
+
+def shard_database(batch_size=DEFAULT_BATCH_SIZE * 4):
+    """
+    Split the primary database across the SHARD_URLS databases: every shard
+    gets the full schema, all locations and metrics and the readings of its
+    own locations, then its rollups are built
+    """
+    print("Sharding climate data by location...")
+    app = create_app()
+
+    with app.app_context():
+        shards = app.extensions.get("shards")
+        if shards is None:
+            print("✗ Set SHARD_URLS to the shard database URLs first")
+            return False
+
+        started = time.perf_counter()
+        count = len(shards.engines)
+        for index, engine in enumerate(shards.engines):
+            db.metadata.create_all(engine)
+            with db.engine.connect() as source, engine.begin() as target:
+                if target.execute(db.select(ClimateData.id).limit(1)).first():
+                    print(f"  Shard {index}: already holds readings, skipped")
+                    continue
+                for model in (Location, Metric):
+                    target.execute(model.__table__.delete())
+                    copy_rows(
+                        source,
+                        target,
+                        model.__table__.select(),
+                        model.__table__,
+                        batch_size,
+                    )
+                table = ClimateData.__table__
+                copied = copy_rows(
+                    source,
+                    target,
+                    table.select().where(table.c.location_id % count == index),
+                    table,
+                    batch_size,
+                )
+                print(f"  Shard {index}: {copied:,} readings")
+
+        # Each shard rolls up its own readings, all at once
+        rollup_counts = shards.map(rebuild_rollups)
+        print(
+            f"✓ Sharded across {count} databases with {sum(rollup_counts)} rollup rows "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        return True
+
+
+def build_snapshot():
+    """Export climate data to a new memory-mapped snapshot in SNAPSHOT_DIR"""
+    print("Building climate data snapshot...")
+    app = create_app()
+
+    with app.app_context():
+        store = app.extensions.get("snapshots")
+        if store is None:
+            print("✗ Set SNAPSHOT_DIR to the snapshot directory first")
+            return False
+
+        started = time.perf_counter()
+        manifest = store.build()
+        readings = sum(metric["rows"] for metric in manifest["metrics"].values())
+        print(
+            f"✓ Wrote {readings:,} readings at data version "
+            f"{manifest['data_version']} in {time.perf_counter() - started:.1f}s"
+        )
+        return True
+
+
+def build_rollups():
+    """Recompute the monthly/yearly rollups and series stats from raw climate data"""
+    print("Rebuilding climate data rollups...")
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        shards = app.extensions.get("shards")
+        if shards is not None:
+            rollup_count = sum(shards.map(rebuild_rollups))
+        else:
+            rollup_count = rebuild_rollups()
+        print(
+            f"✓ Built {rollup_count} rollup rows in "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+
+
+def checked_running_stats():
+    """verify_running_stats() mismatches, or None when rollups are not current"""
+    if not rollups_ready():
+        return None
+    return verify_running_stats()
+
+
+def verify_stats():
+    """Check stored running stats and rollup M2 against a full recompute"""
+    print("Verifying running statistics against raw climate data...")
+    app = create_app()
+
+    with app.app_context():
+        started = time.perf_counter()
+        # Sharded, each shard is checked against its own readings
+        shards = app.extensions.get("shards")
+        if shards is not None:
+            results = shards.map(checked_running_stats)
+        else:
+            results = [checked_running_stats()]
+
+        if any(result is None for result in results):
+            print(
+                "✗ Running statistics were invalidated by an update or delete; "
+                "run 'python init_db.py rollups' to rebuild them"
+            )
+            return False
+
+        mismatches = [mismatch for result in results for mismatch in result]
+        elapsed = time.perf_counter() - started
+        if mismatches:
+            for mismatch in mismatches[:20]:
+                print(f"  ✗ {mismatch}")
+            print(f"✗ {len(mismatches)} mismatches found in {elapsed:.1f}s")
+            return False
+        print(f"✓ Running statistics match a full recompute ({elapsed:.1f}s)")
+        return True
+
+
 def test_connection():
     """Test database connection"""
     print("Testing database connection...")
@@ -180,5 +565,22 @@ def test_connection():
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "test":
         test_connection()
+    elif len(sys.argv) > 1 and sys.argv[1] == "rollups":
+        build_rollups()
+    elif len(sys.argv) > 1 and sys.argv[1] == "snapshot":
+        sys.exit(0 if build_snapshot() else 1)
+    elif len(sys.argv) > 1 and sys.argv[1] == "shard":
+        sys.exit(0 if shard_database() else 1)
+    elif len(sys.argv) > 1 and sys.argv[1] == "verify":
+        sys.exit(0 if verify_stats() else 1)
+    elif len(sys.argv) > 2 and sys.argv[1] == "load":
+        # python init_db.py load <file.json|file.ndjson> [batch_size] [commit_every]
+        init_database(
+            sys.argv[2],
+            batch_size=int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_BATCH_SIZE,
+            commit_every=(
+                int(sys.argv[4]) if len(sys.argv) > 4 else DEFAULT_COMMIT_EVERY
+            ),
+        )
     else:
         init_database()
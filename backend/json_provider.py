@@ -0,0 +1,70 @@
+"""
+JSON providers for EcoVision Climate Visualizer
+Dates and Decimals are written natively (YYYY-MM-DD and plain numbers), so
+models hand over the values the database returned instead of pre-converting
+every row. orjson encodes responses when installed; the standard library
+encoder is the fallback.
+"""
+
+from datetime import date
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+DEFAULT_JSON_PROVIDER = "orjson"
+JSON_PROVIDERS = ("orjson", "stdlib")
+
+
+def _default(o):
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return float(o)
+    return DefaultJSONProvider.default(o)
+
+
+class ClimateJSONProvider(DefaultJSONProvider):
+    """Standard library encoder writing dates as YYYY-MM-DD and Decimals as floats"""
+
+    default = staticmethod(_default)
+
+
+class OrjsonProvider(ClimateJSONProvider):
+    """orjson encoder with the same output as ClimateJSONProvider"""
+
+    def _options(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        # Custom json.dumps arguments (cls, indent, ...) keep the stdlib path
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent))
+        # Trailing newline as DefaultJSONProvider.response() writes
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def json_provider_class(name=DEFAULT_JSON_PROVIDER):
+    """Provider class for a JSON_PROVIDER name; orjson falls back when missing"""
+    if name not in JSON_PROVIDERS:
+        raise ValueError(
+            f"Unknown JSON_PROVIDER {name!r}. Use: {', '.join(JSON_PROVIDERS)}"
+        )
+    if name == "orjson" and orjson is not None:
+        return OrjsonProvider
+    return ClimateJSONProvider
@@ -0,0 +1,110 @@
+"""add cache and aggregate tables: data_version, climate_rollups, series_stats, rollup_state
+
+Revision ID: 2b7d9c41e6a3
+Revises:
+Create Date: 2026-10-18 06:30:12.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b7d9c41e6a3'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# QualityLevel names as the Enum columns store them
+QUALITY_ENUM = sa.Enum(
+    'EXCELLENT', 'GOOD', 'QUESTIONABLE', 'POOR', name='qualitylevel'
+)
+
+
+def _missing(table_name):
+    # Running init_db.py against the new models creates these tables without
+    # touching climate_data, so an existing table is left as it is
+    return not sa.inspect(op.get_bind()).has_table(table_name)
+
+
+def upgrade():
+    if _missing('data_version'):
+        op.create_table(
+            'data_version',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if _missing('climate_rollups'):
+        op.create_table(
+            'climate_rollups',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('period', sa.String(length=5), nullable=False),
+            sa.Column('period_start', sa.Date(), nullable=False),
+            sa.Column('location_id', sa.Integer(), nullable=False),
+            sa.Column('metric_id', sa.Integer(), nullable=False),
+            sa.Column('quality', QUALITY_ENUM, nullable=False),
+            sa.Column('reading_count', sa.Integer(), nullable=False),
+            sa.Column('value_sum', sa.Float(), nullable=False),
+            sa.Column('value_sum_sq', sa.Float(), nullable=False),
+            sa.Column('value_m2', sa.Float(), nullable=False),
+            sa.Column('value_min', sa.Float(), nullable=False),
+            sa.Column('value_max', sa.Float(), nullable=False),
+            sa.Column('weighted_sum', sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint(['location_id'], ['locations.id']),
+            sa.ForeignKeyConstraint(['metric_id'], ['metrics.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint(
+                'period',
+                'location_id',
+                'metric_id',
+                'quality',
+                'period_start',
+                name='uq_rollup_key',
+            ),
+        )
+        op.create_index(
+            'idx_rollup_period_start',
+            'climate_rollups',
+            ['period', 'period_start'],
+        )
+
+    if _missing('series_stats'):
+        op.create_table(
+            'series_stats',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('location_id', sa.Integer(), nullable=False),
+            sa.Column('metric_id', sa.Integer(), nullable=False),
+            sa.Column('quality', QUALITY_ENUM, nullable=False),
+            sa.Column('reading_count', sa.Integer(), nullable=False),
+            sa.Column('value_mean', sa.Float(), nullable=False),
+            sa.Column('value_m2', sa.Float(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['location_id'], ['locations.id']),
+            sa.ForeignKeyConstraint(['metric_id'], ['metrics.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint(
+                'location_id', 'metric_id', 'quality', name='uq_series_stats_key'
+            ),
+        )
+
+    # Left empty: rollups are served once `python init_db.py rollups` has
+    # built them and written this table's row
+    if _missing('rollup_state'):
+        op.create_table(
+            'rollup_state',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('built_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+
+def downgrade():
+    op.drop_table('rollup_state')
+    op.drop_table('series_stats')
+    op.drop_index('idx_rollup_period_start', table_name='climate_rollups')
+    op.drop_table('climate_rollups')
+    op.drop_table('data_version')
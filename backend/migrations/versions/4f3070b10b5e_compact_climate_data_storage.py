@@ -0,0 +1,83 @@
+"""compact climate_data storage: double values and quality ranks
+
+Revision ID: 4f3070b10b5e
+Revises: 2b7d9c41e6a3
+Create Date: 2026-10-18 06:36:30.404131
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f3070b10b5e'
+down_revision = '2b7d9c41e6a3'
+branch_labels = None
+depends_on = None
+
+
+# QualityLevel names as the Enum column stored them, in rank order
+QUALITY_NAMES = ('POOR', 'QUESTIONABLE', 'GOOD', 'EXCELLENT')
+QUALITY_ENUM = sa.Enum(*QUALITY_NAMES, name='qualitylevel')
+
+climate_data = sa.table(
+    'climate_data',
+    sa.column('quality', sa.String),
+    sa.column('quality_rank', sa.SmallInteger),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('climate_data') as batch_op:
+        batch_op.add_column(sa.Column('quality_rank', sa.SmallInteger(), nullable=True))
+
+    op.execute(
+        climate_data.update().values(
+            quality_rank=sa.case(
+                {name: rank for rank, name in enumerate(QUALITY_NAMES)},
+                value=climate_data.c.quality,
+            )
+        )
+    )
+
+    with op.batch_alter_table('climate_data') as batch_op:
+        batch_op.drop_index('idx_date_quality')
+        batch_op.alter_column(
+            'value',
+            existing_type=sa.Numeric(10, 4),
+            type_=sa.Double(),
+            existing_nullable=False,
+        )
+        batch_op.alter_column(
+            'quality_rank', existing_type=sa.SmallInteger(), nullable=False
+        )
+        batch_op.drop_column('quality')
+        batch_op.create_index('idx_date_quality', ['date', 'quality_rank'])
+        batch_op.create_index('idx_quality_date', ['quality_rank', 'date'])
+
+
+def downgrade():
+    with op.batch_alter_table('climate_data') as batch_op:
+        batch_op.add_column(sa.Column('quality', QUALITY_ENUM, nullable=True))
+
+    op.execute(
+        climate_data.update().values(
+            quality=sa.case(
+                {rank: name for rank, name in enumerate(QUALITY_NAMES)},
+                value=climate_data.c.quality_rank,
+            )
+        )
+    )
+
+    with op.batch_alter_table('climate_data') as batch_op:
+        batch_op.drop_index('idx_quality_date')
+        batch_op.drop_index('idx_date_quality')
+        batch_op.alter_column(
+            'value',
+            existing_type=sa.Double(),
+            type_=sa.Numeric(10, 4),
+            existing_nullable=False,
+        )
+        batch_op.alter_column('quality', existing_type=QUALITY_ENUM, nullable=False)
+        batch_op.drop_column('quality_rank')
+        batch_op.create_index('idx_date_quality', ['date', 'quality'])
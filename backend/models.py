@@ -1,8 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from enum import Enum
+from sqlalchemy import String, type_coerce
 
-db = SQLAlchemy()
+from replicas import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 
 class QualityLevel(Enum):
@@ -26,12 +29,13 @@ class Location(db.Model):
     climate_data = db.relationship("ClimateData", backref="location", lazy=True)
 
     def to_dict(self):
+        # Decimals and dates are left to the JSON provider (json_provider.py)
         return {
             "id": self.id,
             "name": self.name,
             "country": self.country,
-            "latitude": float(self.latitude),
-            "longitude": float(self.longitude),
+            "latitude": self.latitude,
+            "longitude": self.longitude,
             "region": self.region,
         }
 
@@ -58,6 +62,24 @@ class Metric(db.Model):
         }
 
 
+class QualityRank(db.TypeDecorator):
+    """
+    QualityLevel stored as its SMALLINT rank (QUALITY_RANKS), so a quality
+    threshold is an indexable range instead of a list of names
+    """
+
+    impl = db.SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return QUALITY_RANKS[QualityLevel(value)]
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else QUALITY_LEVELS[value]
+
+
 class ClimateData(db.Model):
     __tablename__ = "climate_data"
 
@@ -65,13 +87,15 @@ class ClimateData(db.Model):
     location_id = db.Column(db.Integer, db.ForeignKey("locations.id"), nullable=False)
     metric_id = db.Column(db.Integer, db.ForeignKey("metrics.id"), nullable=False)
     date = db.Column(db.Date, nullable=False)
-    value = db.Column(db.Numeric(10, 4), nullable=False)
-    quality = db.Column(db.Enum(QualityLevel), nullable=False)
+    value = db.Column(db.Double, nullable=False)
+    # Compared and grouped as QualityLevel, stored in the quality_rank column
+    quality = db.Column("quality_rank", QualityRank, key="quality", nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     __table_args__ = (
         db.Index("idx_location_metric_date", "location_id", "metric_id", "date"),
         db.Index("idx_date_quality", "date", "quality"),
+        db.Index("idx_quality_date", "quality", "date"),
     )
 
     def to_dict(self):
@@ -79,15 +103,126 @@ class ClimateData(db.Model):
             "id": self.id,
             "location_id": self.location_id,
             "location_name": self.location.name,
-            "latitude": float(self.location.latitude),
-            "longitude": float(self.location.longitude),
-            "date": self.date.strftime("%Y-%m-%d"),
+            "latitude": self.location.latitude,
+            "longitude": self.location.longitude,
+            "date": self.date,
             "metric": self.metric.name,
-            "value": float(self.value),
+            "value": self.value,
             "unit": self.metric.unit,
             "quality": self.quality.value,
         }
 
+    @classmethod
+    def listing_columns(cls):
+        """
+        Columns selected by the projection-based listing path, in row order.
+        Only climate_data is read; names, units and coordinates are attached
+        from the dimension cache when a row is serialized.
+        """
+        # Dates arrive as the driver returns them (ISO strings on SQLite),
+        # skipping the date result processor
+        return (
+            cls.id,
+            cls.location_id,
+            cls.metric_id,
+            type_coerce(cls.date, String),
+            cls.value,
+            cls.quality,
+        )
+
+    @staticmethod
+    def row_to_dict(row, location_lookup, metric_lookup):
+        """
+        Serialize a listing_columns() row with its location's (name, latitude,
+        longitude) and metric's (name, unit) lookups; its JSON matches to_dict()
+        """
+        data_id, location_id, metric_id, date, value, quality = row
+        location_name, latitude, longitude = location_lookup[location_id]
+        metric, unit = metric_lookup[metric_id]
+        return {
+            "id": data_id,
+            "location_id": location_id,
+            "location_name": location_name,
+            # Rounded to the Numeric scales and the 4 decimals values are
+            # accepted at
+            "latitude": round(latitude, 8),
+            "longitude": round(longitude, 8),
+            "date": date,
+            "metric": metric,
+            "value": round(value, 4),
+            "unit": unit,
+            "quality": quality.value,
+        }
+
+
+class DataVersion(db.Model):
+    __tablename__ = "data_version"
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+
+class ClimateRollup(db.Model):
+    __tablename__ = "climate_rollups"
+
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(5), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)
+    location_id = db.Column(db.Integer, db.ForeignKey("locations.id"), nullable=False)
+    metric_id = db.Column(db.Integer, db.ForeignKey("metrics.id"), nullable=False)
+    quality = db.Column(db.Enum(QualityLevel), nullable=False)
+    reading_count = db.Column(db.Integer, nullable=False, default=0)
+    value_sum = db.Column(db.Float, nullable=False, default=0)
+    value_sum_sq = db.Column(db.Float, nullable=False, default=0)
+    # Sum of squared deviations from the period mean (Welford's M2)
+    value_m2 = db.Column(db.Float, nullable=False, default=0)
+    value_min = db.Column(db.Float, nullable=False)
+    value_max = db.Column(db.Float, nullable=False)
+    weighted_sum = db.Column(db.Float, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "period",
+            "location_id",
+            "metric_id",
+            "quality",
+            "period_start",
+            name="uq_rollup_key",
+        ),
+        db.Index("idx_rollup_period_start", "period", "period_start"),
+    )
+
+
+class SeriesStats(db.Model):
+    __tablename__ = "series_stats"
+
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey("locations.id"), nullable=False)
+    metric_id = db.Column(db.Integer, db.ForeignKey("metrics.id"), nullable=False)
+    quality = db.Column(db.Enum(QualityLevel), nullable=False)
+    reading_count = db.Column(db.Integer, nullable=False, default=0)
+    value_mean = db.Column(db.Float, nullable=False, default=0)
+    value_m2 = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "location_id", "metric_id", "quality", name="uq_series_stats_key"
+        ),
+    )
+
+
+class RollupState(db.Model):
+    __tablename__ = "rollup_state"
+
+    id = db.Column(db.Integer, primary_key=True)
+    built_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 
 QUALITY_WEIGHTS = {
     QualityLevel.EXCELLENT: 1.0,
@@ -95,3 +230,11 @@ QUALITY_WEIGHTS = {
     QualityLevel.QUESTIONABLE: 0.5,
     QualityLevel.POOR: 0.3,
 }
+
+QUALITY_RANKS = {
+    QualityLevel.POOR: 0,
+    QualityLevel.QUESTIONABLE: 1,
+    QualityLevel.GOOD: 2,
+    QualityLevel.EXCELLENT: 3,
+}
+QUALITY_LEVELS = sorted(QUALITY_RANKS, key=QUALITY_RANKS.get)
@@ -0,0 +1,135 @@
+"""
+Read-replica routing for EcoVision Climate Visualizer
+GET requests read from a replica picked round-robin among the healthy ones,
+falling back to the primary; flushes and INSERT/UPDATE/DELETE always use the
+primary
+"""
+
+import threading
+import time
+
+from flask import request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc, text
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND_PREFIX = "replica_"
+REPLICA_INFO_KEY = "read_replica"
+# Set by sharding.py; a shard takes reads and writes alike
+SHARD_INFO_KEY = "shard"
+READ_METHODS = ("GET", "HEAD")
+
+# Seconds between probes of a replica, whether it is up or down
+HEALTH_CHECK_SECONDS = 10
+
+
+def replica_binds(urls):
+    """SQLALCHEMY_BINDS entries for a list of replica URLs"""
+    return {f"{REPLICA_BIND_PREFIX}{index}": url for index, url in enumerate(urls)}
+
+
+def read_only(view):
+    """Mark a view that only reads, such as a POST query endpoint, as replica-safe"""
+    view.read_only = True
+    return view
+
+
+class RoutingSession(Session):
+    """
+    Session sending everything to the shard pinned in ``info``, or else reads
+    to the replica pinned there and writes to the primary
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = self.info.get(SHARD_INFO_KEY)
+        if shard is not None and bind is None:
+            return shard
+        replica = self.info.get(REPLICA_INFO_KEY)
+        if (
+            replica is not None
+            and bind is None
+            and not self._flushing
+            and not isinstance(clause, UpdateBase)
+        ):
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Round-robin over replica engines, skipping ones that failed their last check"""
+
+    def __init__(self, engines, check_interval=HEALTH_CHECK_SECONDS):
+        self.engines = list(engines)
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.position = 0
+        self.healthy = [False] * len(self.engines)
+        # Every replica is probed before its first use
+        self.checked_at = [float("-inf")] * len(self.engines)
+
+        for index, engine in enumerate(self.engines):
+            self._watch(index, engine)
+
+    def _watch(self, index, engine):
+        @event.listens_for(engine, "handle_error")
+        def mark_down(context):
+            if context.is_disconnect or isinstance(
+                context.sqlalchemy_exception, exc.OperationalError
+            ):
+                self.mark(index, False)
+
+    def mark(self, index, healthy):
+        with self.lock:
+            self.healthy[index] = healthy
+            self.checked_at[index] = time.monotonic()
+
+    def _probe(self, index):
+        try:
+            with self.engines[index].connect() as connection:
+                connection.execute(text("SELECT 1"))
+            healthy = True
+        except exc.DBAPIError:
+            healthy = False
+        self.mark(index, healthy)
+        return healthy
+
+    def choose(self):
+        """Next healthy replica engine in rotation, or None to use the primary"""
+        with self.lock:
+            start = self.position
+            self.position = (self.position + 1) % len(self.engines)
+
+        now = time.monotonic()
+        for offset in range(len(self.engines)):
+            index = (start + offset) % len(self.engines)
+            if now - self.checked_at[index] >= self.check_interval:
+                if self._probe(index):
+                    return self.engines[index]
+            elif self.healthy[index]:
+                return self.engines[index]
+        return None
+
+
+def init_replicas(app, db):
+    """Create the router for configured replica binds and pin one per read request"""
+    keys = sorted(
+        key
+        for key in app.config.get("SQLALCHEMY_BINDS", {})
+        if key and key.startswith(REPLICA_BIND_PREFIX)
+    )
+    if not keys:
+        return None
+
+    with app.app_context():
+        router = ReplicaRouter(db.engines[key] for key in keys)
+    app.extensions["replica_router"] = router
+
+    @app.before_request
+    def pin_replica():
+        view = app.view_functions.get(request.endpoint)
+        if request.method in READ_METHODS or getattr(view, "read_only", False):
+            db.session.info[REPLICA_INFO_KEY] = router.choose()
+        else:
+            db.session.info.pop(REPLICA_INFO_KEY, None)
+
+    return router
@@ -0,0 +1,725 @@
+"""
+Pre-aggregated monthly/yearly rollups for EcoVision Climate Visualizer
+Maintained incrementally as readings are inserted, and re-aggregated per
+affected year when ingest corrects readings; summary and trend requests read
+them for the whole periods of a date range and only scan raw rows for the
+ragged edges
+"""
+
+from datetime import MAXYEAR, date, timedelta
+
+from sqlalchemy import (
+    SmallInteger,
+    and_,
+    case,
+    delete,
+    event,
+    func,
+    or_,
+    select,
+    true,
+    type_coerce,
+)
+from sqlalchemy.dialects import mysql, sqlite
+
+from analytics import VALUE_SCALE, exact_average, named_summary_rows, scaled_sum
+from filters import location_in
+from models import (
+    db,
+    ClimateData,
+    ClimateRollup,
+    QualityLevel,
+    RollupState,
+    QUALITY_RANKS,
+    QUALITY_WEIGHTS,
+)
+from running_stats import (
+    clear_series_stats,
+    combine_stats,
+    fold_series_stats,
+    merge_stats,
+    refresh_series_stats,
+    sample_stdev,
+    series_baselines,
+    upsert_series_stats,
+)
+
+MONTH = "month"
+YEAR = "year"
+RAW = "raw"
+PERIODS = (MONTH, YEAR)
+
+KEY_COLUMNS = ("period", "location_id", "metric_id", "quality", "period_start")
+# (location, metric, year) blocks or updated ids per statement when refreshing
+REFRESH_SLICE = 200
+HIGH_QUALITY = [
+    q for q, rank in QUALITY_RANKS.items() if rank >= QUALITY_RANKS[QualityLevel.GOOD]
+]
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def next_year(day):
+    return date(day.year + 1, 1, 1)
+
+
+def period_start(period, day):
+    if period == MONTH:
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def aggregate_readings(readings, aggregates=None):
+    """
+    Fold (location_id, metric_id, date, value, quality) tuples into
+    {rollup key: [count, sum, sum_sq, min, max, weighted_sum, m2]}
+    """
+    if aggregates is None:
+        aggregates = {}
+    for location_id, metric_id, day, value, quality in readings:
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        if not isinstance(quality, QualityLevel):
+            quality = QualityLevel(quality)
+        value = float(value)
+        weighted = value * QUALITY_WEIGHTS[quality]
+
+        for period in PERIODS:
+            key = (period, location_id, metric_id, quality, period_start(period, day))
+            agg = aggregates.get(key)
+            if agg is None:
+                aggregates[key] = [1, value, value * value, value, value, weighted, 0.0]
+            else:
+                # Welford update of M2 from the running mean before and after
+                previous_mean = agg[1] / agg[0]
+                agg[0] += 1
+                agg[1] += value
+                agg[6] += (value - previous_mean) * (value - agg[1] / agg[0])
+                agg[2] += value * value
+                if value < agg[3]:
+                    agg[3] = value
+                if value > agg[4]:
+                    agg[4] = value
+                agg[5] += weighted
+    return aggregates
+
+
+def _merged_values(current, new):
+    # value_m2 comes first: MySQL applies assignments left to right, and the
+    # Chan merge must see the old count and sum
+    count = current.reading_count + new.reading_count
+    delta = (
+        new.value_sum / new.reading_count - current.value_sum / current.reading_count
+    )
+    return {
+        "value_m2": current.value_m2
+        + new.value_m2
+        + delta * delta * current.reading_count * new.reading_count / count,
+        "reading_count": current.reading_count + new.reading_count,
+        "value_sum": current.value_sum + new.value_sum,
+        "value_sum_sq": current.value_sum_sq + new.value_sum_sq,
+        "value_min": case(
+            (new.value_min < current.value_min, new.value_min),
+            else_=current.value_min,
+        ),
+        "value_max": case(
+            (new.value_max > current.value_max, new.value_max),
+            else_=current.value_max,
+        ),
+        "weighted_sum": current.weighted_sum + new.weighted_sum,
+    }
+
+
+def upsert_rollups(session, aggregates):
+    """Merge aggregates into climate_rollups with a single upsert per batch"""
+    if not aggregates:
+        return
+
+    rows = [
+        dict(
+            zip(KEY_COLUMNS, key),
+            reading_count=agg[0],
+            value_sum=agg[1],
+            value_sum_sq=agg[2],
+            value_min=agg[3],
+            value_max=agg[4],
+            weighted_sum=agg[5],
+            value_m2=agg[6],
+        )
+        for key, agg in aggregates.items()
+    ]
+    table = ClimateRollup.__table__
+    dialect = session.get_bind().dialect.name
+
+    if dialect == "sqlite":
+        statement = sqlite.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(KEY_COLUMNS),
+            set_=_merged_values(table.c, statement.excluded),
+        )
+        session.execute(statement, rows)
+    elif dialect in ("mysql", "mariadb"):
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update(
+            list(_merged_values(table.c, statement.inserted).items())
+        )
+        session.execute(statement, rows)
+    else:
+        for row in rows:
+            key_filter = and_(*[table.c[name] == row[name] for name in KEY_COLUMNS])
+            existing = session.execute(select(table).where(key_filter)).first()
+            if existing is None:
+                session.execute(table.insert(), [row])
+                continue
+            _, _, m2 = merge_stats(
+                (
+                    existing.reading_count,
+                    existing.value_sum / existing.reading_count,
+                    existing.value_m2,
+                ),
+                (
+                    row["reading_count"],
+                    row["value_sum"] / row["reading_count"],
+                    row["value_m2"],
+                ),
+            )
+            session.execute(
+                table.update()
+                .where(key_filter)
+                .values(
+                    reading_count=existing.reading_count + row["reading_count"],
+                    value_sum=existing.value_sum + row["value_sum"],
+                    value_sum_sq=existing.value_sum_sq + row["value_sum_sq"],
+                    value_min=min(existing.value_min, row["value_min"]),
+                    value_max=max(existing.value_max, row["value_max"]),
+                    weighted_sum=existing.weighted_sum + row["weighted_sum"],
+                    value_m2=m2,
+                )
+            )
+
+
+def invalidate_rollups(session):
+    """Stop serving rollups and series stats until the next rebuild"""
+    session.execute(delete(RollupState))
+
+
+def maintain_aggregates(session, readings):
+    """
+    Fold newly inserted (location_id, metric_id, date, value, quality)
+    readings into the rollups and the per-series running stats
+    """
+    readings = list(readings)
+    upsert_rollups(session, aggregate_readings(readings))
+    upsert_series_stats(
+        session,
+        fold_series_stats(
+            (location_id, metric_id, value, quality)
+            for location_id, metric_id, _, value, quality in readings
+        ),
+    )
+
+
+def _year_end(year):
+    """Exclusive end of a year, or None for the last year a date can hold"""
+    return date(year + 1, 1, 1) if year < MAXYEAR else None
+
+
+def refresh_aggregates(session, changed):
+    """
+    Recompute, from the stored readings, the rollups of every year holding
+    one of the changed (location_id, metric_id, date) readings and the
+    running stats of their series. An updated value can't be subtracted back
+    out of a stored min/max, so the affected keys are re-aggregated instead.
+    """
+    blocks = sorted(
+        {(location_id, metric_id, day.year) for location_id, metric_id, day in changed}
+    )
+    for start in range(0, len(blocks), REFRESH_SLICE):
+        taken = blocks[start : start + REFRESH_SLICE]
+        # A year's rows and its months' rows all start inside that year
+        session.execute(
+            delete(ClimateRollup).where(
+                or_(
+                    *[
+                        and_(
+                            ClimateRollup.location_id == location_id,
+                            ClimateRollup.metric_id == metric_id,
+                            date_range(
+                                ClimateRollup.period_start,
+                                date(year, 1, 1),
+                                _year_end(year),
+                            ),
+                        )
+                        for location_id, metric_id, year in taken
+                    ]
+                )
+            )
+        )
+        readings = session.execute(
+            select(
+                ClimateData.location_id,
+                ClimateData.metric_id,
+                ClimateData.date,
+                ClimateData.value,
+                ClimateData.quality,
+            ).where(
+                or_(
+                    *[
+                        and_(
+                            ClimateData.location_id == location_id,
+                            ClimateData.metric_id == metric_id,
+                            date_range(
+                                ClimateData.date, date(year, 1, 1), _year_end(year)
+                            ),
+                        )
+                        for location_id, metric_id, year in taken
+                    ]
+                )
+            )
+        )
+        upsert_rollups(session, aggregate_readings(readings))
+    refresh_series_stats(
+        session, {(location_id, metric_id) for location_id, metric_id, _ in blocks}
+    )
+
+
+def _updated_keys(session, ids):
+    """(location_id, metric_id, date) of the readings with the given ids"""
+    keys = []
+    for start in range(0, len(ids), REFRESH_SLICE):
+        keys.extend(
+            session.execute(
+                select(
+                    ClimateData.location_id, ClimateData.metric_id, ClimateData.date
+                ).where(ClimateData.id.in_(ids[start : start + REFRESH_SLICE]))
+            )
+        )
+    return keys
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _maintain_on_execute(orm_execute_state):
+    statement = orm_execute_state.statement
+    table = getattr(statement, "table", None)
+    if table is None or table.name != ClimateData.__tablename__:
+        return
+
+    params = orm_execute_state.parameters
+    if isinstance(params, dict):
+        params = [params]
+
+    if (
+        orm_execute_state.is_update
+        and params
+        and all("id" in p for p in params)
+        and statement.whereclause is None
+    ):
+        # Bulk UPDATE by primary key (ingest corrections): the rows are
+        # known, so only their years and series are re-aggregated
+        session = orm_execute_state.session
+        changed = _updated_keys(session, [p["id"] for p in params])
+        result = orm_execute_state.invoke_statement()
+        refresh_aggregates(session, changed)
+        return result
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        invalidate_rollups(orm_execute_state.session)
+        return
+    if not orm_execute_state.is_insert:
+        return
+
+    if not params:
+        # INSERT ... VALUES/SELECT without bound rows can't be folded in
+        invalidate_rollups(orm_execute_state.session)
+        return
+
+    result = orm_execute_state.invoke_statement()
+    maintain_aggregates(
+        orm_execute_state.session,
+        (
+            (p["location_id"], p["metric_id"], p["date"], p["value"], p["quality"])
+            for p in params
+        ),
+    )
+    return result
+
+
+@event.listens_for(db.session, "after_flush")
+def _maintain_on_flush(session, flush_context):
+    if any(isinstance(obj, ClimateData) for obj in (*session.dirty, *session.deleted)):
+        invalidate_rollups(session)
+
+    inserted = [obj for obj in session.new if isinstance(obj, ClimateData)]
+    if inserted:
+        maintain_aggregates(
+            session,
+            (
+                (obj.location_id, obj.metric_id, obj.date, obj.value, obj.quality)
+                for obj in inserted
+            ),
+        )
+
+
+def rollups_ready():
+    """True when climate_rollups and series_stats are known to match climate_data"""
+    return db.session.execute(select(RollupState.id)).first() is not None
+
+
+def rebuild_rollups(batch_size=50000):
+    """
+    Recompute every rollup and series stats row from the raw readings in one
+    streaming pass
+    """
+    session = db.session
+    session.execute(delete(RollupState))
+    session.execute(delete(ClimateRollup))
+    clear_series_stats(session)
+
+    aggregates = {}
+    partials = {}
+    result = session.execute(
+        select(
+            ClimateData.location_id,
+            ClimateData.metric_id,
+            ClimateData.date,
+            ClimateData.value,
+            ClimateData.quality,
+        ).execution_options(yield_per=batch_size)
+    )
+    for partition in result.partitions():
+        aggregate_readings(partition, aggregates)
+        fold_series_stats(
+            (
+                (location_id, metric_id, value, quality)
+                for location_id, metric_id, _, value, quality in partition
+            ),
+            partials,
+        )
+
+    items = list(aggregates.items())
+    for start in range(0, len(items), batch_size):
+        upsert_rollups(session, dict(items[start : start + batch_size]))
+    upsert_series_stats(session, partials)
+
+    session.add(RollupState(id=1))
+    session.commit()
+    return len(items)
+
+
+def ensure_rollups():
+    """Mark an empty database as rolled up, or rebuild rollups for existing data"""
+    if rollups_ready():
+        return
+    if db.session.execute(select(ClimateData.id).limit(1)).first() is None:
+        db.session.add(RollupState(id=1))
+        db.session.commit()
+        return
+    rebuild_rollups()
+
+
+def plan_segments(start, end, periods=PERIODS):
+    """
+    Split the inclusive [start, end] range (either side may be None) into
+    chronological (kind, lo, hi) segments with exclusive ``hi``. ``kind`` is
+    "month"/"year" for whole periods served from rollups and "raw" for edges.
+    """
+    stop = end + timedelta(days=1) if end is not None else None
+    month_lo = start if start is None or start.day == 1 else next_month(start)
+    month_hi = stop if stop is None or stop.day == 1 else stop.replace(day=1)
+
+    if month_lo is not None and month_hi is not None and month_lo >= month_hi:
+        return [(RAW, start, stop)]
+
+    inner = [(MONTH, month_lo, month_hi)]
+    if YEAR in periods:
+        year_lo = (
+            month_lo if month_lo is None or month_lo.month == 1 else next_year(month_lo)
+        )
+        year_hi = (
+            month_hi
+            if month_hi is None or month_hi.month == 1
+            else month_hi.replace(month=1)
+        )
+        if year_lo is None or year_hi is None or year_lo < year_hi:
+            inner = []
+            if year_lo is not None and month_lo != year_lo:
+                inner.append((MONTH, month_lo, year_lo))
+            inner.append((YEAR, year_lo, year_hi))
+            if year_hi is not None and year_hi != month_hi:
+                inner.append((MONTH, year_hi, month_hi))
+
+    segments = []
+    if start is not None and start < month_lo:
+        segments.append((RAW, start, month_lo))
+    segments.extend(inner)
+    if stop is not None and month_hi < stop:
+        segments.append((RAW, month_hi, stop))
+    return segments
+
+
+def date_range(column, lo, hi):
+    clauses = []
+    if lo is not None:
+        clauses.append(column >= lo)
+    if hi is not None:
+        clauses.append(column < hi)
+    return and_(*clauses) if clauses else true()
+
+
+def raw_condition(segments):
+    return or_(*[date_range(ClimateData.date, lo, hi) for _, lo, hi in segments])
+
+
+def rollup_query(
+    segments, location_id=None, location_ids=None, metric_id=None, qualities=None
+):
+    """Base rollup query covering the given period segments and filters"""
+    query = db.session.query(ClimateRollup)
+    query = query.filter(
+        or_(
+            *[
+                and_(
+                    ClimateRollup.period == kind,
+                    date_range(ClimateRollup.period_start, lo, hi),
+                )
+                for kind, lo, hi in segments
+            ]
+        )
+    )
+    if location_id:
+        query = query.filter(ClimateRollup.location_id == location_id)
+    if location_ids is not None:
+        query = query.filter(location_in(ClimateRollup.location_id, location_ids))
+    if metric_id is not None:
+        query = query.filter(ClimateRollup.metric_id == metric_id)
+    if qualities is not None:
+        query = query.filter(ClimateRollup.quality.in_(qualities))
+    return query
+
+
+def summary_rollup_rows(segments, metric_lookup, **filters):
+    """
+    Per (metric, unit, quality) MIN, MAX, SUM, COUNT and weighted SUM from
+    rollups, shaped like the raw GROUP BY rows in get_summary. Rows are
+    grouped by metric id, named from ``metric_lookup`` and ordered by
+    (name, unit, quality name) like the joined GROUP BY they replace.
+    """
+    rows = (
+        rollup_query(segments, **filters)
+        .with_entities(
+            ClimateRollup.metric_id,
+            ClimateRollup.quality,
+            func.min(ClimateRollup.value_min),
+            func.max(ClimateRollup.value_max),
+            func.sum(ClimateRollup.value_sum),
+            func.sum(ClimateRollup.reading_count),
+            func.sum(ClimateRollup.weighted_sum),
+        )
+        .group_by(ClimateRollup.metric_id, ClimateRollup.quality)
+        .all()
+    )
+    rows = named_summary_rows(rows, metric_lookup)
+    rows.sort(key=lambda row: (row[0], row[1], row[2].name))
+    return rows
+
+
+def _trend_blocks(raw_query, segments, filters):
+    """
+    Chronological per-metric blocks of (lo, hi, scaled_total, stats,
+    high_quality_count) covering the requested range: ``scaled_total`` is the
+    block's exact scaled_sum() and ``stats`` its Welford (count, mean, m2)
+    """
+    blocks = {}
+
+    for kind, lo, hi in segments:
+        if kind != RAW:
+            continue
+        rows = (
+            raw_query.filter(date_range(ClimateData.date, lo, hi))
+            .with_entities(
+                ClimateData.location_id,
+                ClimateData.metric_id,
+                ClimateData.date,
+                ClimateData.value,
+                ClimateData.quality,
+            )
+            .all()
+        )
+        # The same Welford pass that maintains the rollups, one state per
+        # location/quality, Chan-merged per metric
+        states = {}
+        high_quality = {}
+        for key, agg in aggregate_readings(rows).items():
+            period, _, metric_id, quality, _ = key
+            if period != MONTH:
+                continue
+            states.setdefault(metric_id, []).append((agg[0], agg[1] / agg[0], agg[6]))
+            if quality in HIGH_QUALITY:
+                high_quality[metric_id] = high_quality.get(metric_id, 0) + agg[0]
+        values = {}
+        for _, metric_id, _, value, _ in rows:
+            values.setdefault(metric_id, []).append(value)
+        for metric_id, metric_values in values.items():
+            blocks.setdefault(metric_id, []).append(
+                (
+                    lo,
+                    hi,
+                    scaled_sum(metric_values),
+                    combine_stats(states[metric_id]),
+                    high_quality.get(metric_id, 0),
+                )
+            )
+
+    rollup_segments = [segment for segment in segments if segment[0] != RAW]
+    if rollup_segments:
+        # One row per location/quality/month, merged here rather than summed
+        # in SQL so M2 never goes through sum-of-squares cancellation
+        months = {}
+        for metric_id, start, quality, count, total, m2 in (
+            rollup_query(rollup_segments, **filters)
+            .with_entities(
+                ClimateRollup.metric_id,
+                ClimateRollup.period_start,
+                ClimateRollup.quality,
+                ClimateRollup.reading_count,
+                ClimateRollup.value_sum,
+                ClimateRollup.value_m2,
+            )
+            .all()
+        ):
+            month = months.setdefault((metric_id, start), [[], 0, 0])
+            month[0].append((count, total / count, m2))
+            # A row sums one series' month, whose rounding error is far below
+            # half a scaled unit, so rounding recovers its exact scaled sum
+            month[1] += round(total * VALUE_SCALE)
+            if quality in HIGH_QUALITY:
+                month[2] += count
+        for (metric_id, start), (states, total, hq_count) in months.items():
+            blocks.setdefault(metric_id, []).append(
+                (start, next_month(start), total, combine_stats(states), hq_count)
+            )
+
+    for metric_blocks in blocks.values():
+        metric_blocks.sort(key=lambda block: block[0] or date.min)
+    return blocks
+
+
+def rollup_trend_stats(raw_query, segments, **filters):
+    """
+    Half-split averages, quality counts and mean/stdev per metric using
+    monthly rollups, reading raw rows only for edges and the split month.
+    ``raw_query`` is the filtered ClimateData query without date bounds.
+
+    Half-split averages come from exact scaled sums, so they match the raw
+    path to the last digit. Mean and stdev are Chan merges of the blocks'
+    Welford states, or of the per-series running stats when the range is
+    unbounded.
+    """
+    unbounded = all(lo is None and hi is None for _, lo, hi in segments)
+    baselines = series_baselines(**filters) if unbounded else {}
+
+    stats = {}
+    for metric_id, blocks in _trend_blocks(raw_query, segments, filters).items():
+        count = sum(block[3][0] for block in blocks)
+        if count < 2:
+            continue
+        total = sum(block[2] for block in blocks)
+        baseline = baselines.get(metric_id) or combine_stats(
+            block[3] for block in blocks
+        )
+        high_quality_count = sum(block[4] for block in blocks)
+
+        mid_point = count // 2
+        first_total = 0
+        seen = 0
+        for lo, hi, block_total, (block_count, _, _), _ in blocks:
+            if seen + block_count <= mid_point:
+                first_total += block_total
+                seen += block_count
+                continue
+            remaining = mid_point - seen
+            if remaining:
+                values = (
+                    raw_query.filter(
+                        ClimateData.metric_id == metric_id,
+                        date_range(ClimateData.date, lo, hi),
+                    )
+                    .with_entities(ClimateData.value)
+                    .order_by(ClimateData.date.asc(), ClimateData.id.asc())
+                    .limit(remaining)
+                    .all()
+                )
+                first_total += scaled_sum([value for value, in values])
+            break
+
+        stats[metric_id] = {
+            "count": count,
+            "first_half_avg": exact_average(first_total, mid_point),
+            "second_half_avg": exact_average(total - first_total, count - mid_point),
+            "high_quality_count": high_quality_count,
+            "mean": baseline[1],
+            "stdev": sample_stdev(baseline),
+        }
+    return stats
+
+
+def rollup_seasonality_rows(raw_query, segments, **filters):
+    """
+    (metric_id, location_id, date, sum, count) observations for seasonality:
+    one per location-month from rollups plus single raw readings for the edges
+    """
+    rows = []
+    raw_segments = [segment for segment in segments if segment[0] == RAW]
+    if raw_segments:
+        rows.extend(
+            (metric_id, location_id, day, float(value), 1)
+            for metric_id, location_id, day, value in raw_query.filter(
+                raw_condition(raw_segments)
+            ).with_entities(
+                ClimateData.metric_id,
+                ClimateData.location_id,
+                ClimateData.date,
+                ClimateData.value,
+            )
+        )
+
+    rollup_segments = [segment for segment in segments if segment[0] != RAW]
+    if rollup_segments:
+        rows.extend(
+            rollup_query(rollup_segments, **filters)
+            .with_entities(
+                ClimateRollup.metric_id,
+                ClimateRollup.location_id,
+                ClimateRollup.period_start,
+                func.sum(ClimateRollup.value_sum),
+                func.sum(ClimateRollup.reading_count),
+            )
+            .group_by(
+                ClimateRollup.metric_id,
+                ClimateRollup.location_id,
+                ClimateRollup.period_start,
+            )
+            .all()
+        )
+    return rows
+
+
+def rollup_anomaly_rows(raw_query, metric_id, mean, stdev, limit=5):
+    """First ``limit`` readings of a metric more than 2 stdev from ``mean``"""
+    quality_rank = type_coerce(ClimateData.quality, SmallInteger)
+    return (
+        raw_query.filter(
+            ClimateData.metric_id == metric_id,
+            or_(
+                ClimateData.value > mean + 2 * stdev,
+                ClimateData.value < mean - 2 * stdev,
+            ),
+        )
+        .with_entities(
+            ClimateData.date, ClimateData.value, quality_rank, ClimateData.location_id
+        )
+        .order_by(ClimateData.date.asc(), ClimateData.id.asc())
+        .limit(limit)
+        .all()
+    )
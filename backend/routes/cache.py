@@ -0,0 +1,18 @@
+from flask import Blueprint, jsonify
+
+cache_bp = Blueprint("cache", __name__)
+
+
+@cache_bp.route("/api/v1/cache/stats", methods=["GET"])
+def get_cache_stats():
+    """
+    Report response cache hit/miss counters and the current data version.
+    """
+    try:
+        from cache import get_data_version, response_cache
+
+        stats = response_cache.stats()
+        stats["data_version"] = get_data_version()
+        return jsonify({"data": stats})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -1,101 +1,441 @@
-from flask import Blueprint, jsonify, request
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context,
+)
 from datetime import datetime
+import base64
+import csv
+import io
+from sqlalchemy import and_, or_
+
+from arrow_format import (
+    ARROW_STREAM_MIMETYPE,
+    arrow_available,
+    arrow_columns,
+    arrow_requested,
+    serialize_rows,
+    stream_batches,
+)
+from cache import FILTER_PARAMS, PAGE_PARAMS, cached_response
 
 climate_bp = Blueprint("climate", __name__)
 
+EXPORT_BATCH_SIZE = 2000
+EXPORT_FIELDS = (
+    "id",
+    "location_id",
+    "location_name",
+    "latitude",
+    "longitude",
+    "date",
+    "metric",
+    "value",
+    "unit",
+    "quality",
+)
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": ARROW_STREAM_MIMETYPE,
+}
+EXPORT_PARAMS = FILTER_PARAMS + ("format", "after_date", "after_id")
+ARROW_UNAVAILABLE = "Arrow output requires pyarrow, which is not installed"
+
+
+def encode_cursor(date, data_id):
+    """Encode the (date, id) keyset position of a row as an opaque token"""
+    # str() of a date is already YYYY-MM-DD, which is also how raw ISO date
+    # strings arrive on the Arrow path
+    raw = f"{date}|{data_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a token from encode_cursor, raising ValueError if malformed"""
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    date_str, data_id = raw.split("|")
+    return datetime.strptime(date_str, "%Y-%m-%d").date(), int(data_id)
+
+
+def listing_response(rows, meta, arrow):
+    """Render listing rows as JSON, or as an Arrow IPC stream with meta attached"""
+    from models import ClimateData
+    from dimensions import current_dimensions
+
+    dimensions = current_dimensions()
+    if arrow:
+        return Response(
+            serialize_rows(rows, dimensions, meta), mimetype=ARROW_STREAM_MIMETYPE
+        )
+
+    location_lookup = dimensions.location_lookup
+    metric_lookup = dimensions.metric_lookup
+    return jsonify(
+        {
+            "data": [
+                ClimateData.row_to_dict(row, location_lookup, metric_lookup)
+                for row in rows
+            ],
+            "meta": meta,
+        }
+    )
+
+
+def listing_statement(arrow, *conditions):
+    """
+    Listing columns (or their Arrow form) for matching readings, newest first;
+    only climate_data is read, so there are no joins
+    """
+    from models import db, ClimateData
+
+    columns = arrow_columns() if arrow else ClimateData.listing_columns()
+    return (
+        db.select(*columns)
+        .where(*conditions)
+        .order_by(ClimateData.date.desc(), ClimateData.id.desc())
+        .limit(db.bindparam("limit"))
+    )
+
+
+def listing_key(row):
+    """(date, id) of a listing row, the order shards' rows are merged in"""
+    return row[3], row[0]
+
+
+def count_rows(filters):
+    """Count matching readings; no dimension columns are needed, so no joins"""
+    from models import db, ClimateData
+    from filters import statement_templates
+    from sharding import fan_out_shards
+
+    shards = fan_out_shards()
+    if shards is not None:
+        return sum(shards.map(count_rows, filters))
+
+    statement, params = statement_templates.get(
+        "climate_count",
+        filters,
+        lambda *conditions: db.select(db.func.count())
+        .select_from(ClimateData)
+        .where(*conditions),
+    )
+    return db.session.execute(statement, params).scalar()
+
+
+def climate_page(filters, page, per_page, arrow=False):
+    """Listing rows and meta for one page of offset pagination"""
+    from models import db
+    from filters import statement_templates
+    from sharding import fan_out_shards, merged_rows
+    from snapshot import fresh_snapshot
+
+    # Out-of-range page and per_page fall back like Flask-SQLAlchemy's
+    # paginate(error_out=False); meta still echoes the requested values
+    offset_page = page if page >= 1 else 1
+    limit = per_page if per_page >= 1 else 20
+    meta = {"page": page, "per_page": per_page}
+
+    # Arrow rows carry encoded columns, so only JSON pages use a snapshot
+    snapshot = None if arrow else fresh_snapshot()
+    if snapshot is not None:
+        rows, total_count = snapshot.listing_rows(
+            filters, limit, offset=(offset_page - 1) * limit
+        )
+        return rows, {"total_count": total_count, **meta}
+
+    total_count = count_rows(filters)
+    statement, params = statement_templates.get(
+        ("climate_page", arrow),
+        filters,
+        lambda *conditions: listing_statement(arrow, *conditions).offset(
+            db.bindparam("offset")
+        ),
+    )
+    offset = (offset_page - 1) * limit
+    shards = fan_out_shards()
+    if shards is not None:
+        # The page lies within the first offset + limit rows of every shard
+        rows = merged_rows(
+            shards,
+            statement,
+            {**params, "limit": offset + limit, "offset": 0},
+            key=listing_key,
+            reverse=True,
+        )[offset : offset + limit]
+    else:
+        rows = db.session.execute(
+            statement, {**params, "limit": limit, "offset": offset}
+        ).all()
+    return rows, {"total_count": total_count, **meta}
+
 
 @climate_bp.route("/api/v1/climate", methods=["GET"])
+@cached_response(FILTER_PARAMS + PAGE_PARAMS)
 def get_climate_data():
     """
     Retrieve climate data with optional filtering.
-    Query parameters: location_id, start_date, end_date, metric, quality_threshold
+    Query parameters: location_id, bbox, near, k, start_date, end_date, metric,
+    quality_threshold, page, per_page, cursor, with_count
+
+    Passing ``cursor`` (empty for the first page) switches to keyset pagination
+    on (date DESC, id DESC); ``meta.next_cursor`` fetches the following page.
+    Sending ``Accept: application/vnd.apache.arrow.stream`` returns the page as
+    an Arrow IPC stream with ``meta`` in the schema metadata.
     """
     try:
-        from models import ClimateData, Location, Metric, QualityLevel
+        from models import db, ClimateData
+        from filters import FilterError, parse_filters, statement_templates
+        from sharding import fan_out_shards, merged_rows, route_to_shard
+        from snapshot import fresh_snapshot
 
-        location_id = request.args.get("location_id", type=int)
-        start_date = request.args.get("start_date")
-        end_date = request.args.get("end_date")
-        metric = request.args.get("metric")
-        quality_threshold = request.args.get("quality_threshold")
         page = request.args.get("page", 1, type=int)
         per_page = min(request.args.get("per_page", 50, type=int), 100)
+        cursor = request.args.get("cursor")
+        with_count = request.args.get("with_count", "0") in ("1", "true")
+        arrow = arrow_requested()
 
-        query = ClimateData.query.join(Location).join(Metric)
+        if arrow and not arrow_available():
+            return jsonify({"error": ARROW_UNAVAILABLE}), 406
 
-        if location_id:
-            query = query.filter(ClimateData.location_id == location_id)
+        try:
+            filters = parse_filters(request.args)
+        except FilterError as e:
+            return jsonify({"error": str(e)}), 400
 
-        if start_date:
-            try:
-                start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-                query = query.filter(ClimateData.date >= start_date_obj)
-            except ValueError:
-                return (
-                    jsonify({"error": "Invalid start_date format. Use YYYY-MM-DD"}),
-                    400,
+        route_to_shard(filters.location_id, filters.location_ids)
+        if cursor is not None:
+            # Same fallback as offset pages; LIMIT must stay positive, since
+            # SQLite reads a negative limit as no limit at all
+            if per_page < 1:
+                per_page = 20
+            meta = {"per_page": per_page}
+            before = None
+            if cursor:
+                try:
+                    before = decode_cursor(cursor)
+                except ValueError:
+                    return jsonify({"error": "Invalid cursor"}), 400
+
+            snapshot = None if arrow else fresh_snapshot()
+            if snapshot is not None:
+                rows, total_count = snapshot.listing_rows(
+                    filters, per_page + 1, before=before
                 )
+                if with_count:
+                    meta["total_count"] = total_count
+            else:
+                if with_count:
+                    meta["total_count"] = count_rows(filters)
+
+                if before is not None:
+                    statement, params = statement_templates.get(
+                        ("climate_keyset", arrow),
+                        filters,
+                        lambda *conditions: listing_statement(
+                            arrow,
+                            *conditions,
+                            or_(
+                                ClimateData.date < db.bindparam("cursor_date"),
+                                and_(
+                                    ClimateData.date == db.bindparam("cursor_date"),
+                                    ClimateData.id < db.bindparam("cursor_id"),
+                                ),
+                            ),
+                        ),
+                    )
+                    params.update(cursor_date=before[0], cursor_id=before[1])
+                else:
+                    statement, params = statement_templates.get(
+                        ("climate_listing", arrow),
+                        filters,
+                        lambda *conditions: listing_statement(arrow, *conditions),
+                    )
+
+                params["limit"] = per_page + 1
+                shards = fan_out_shards()
+                if shards is not None:
+                    rows = merged_rows(
+                        shards, statement, params, key=listing_key, reverse=True
+                    )
+                else:
+                    rows = db.session.execute(statement, params).all()
+            next_cursor = None
+            if len(rows) > per_page:
+                rows = rows[:per_page]
+                last = rows[-1]
+                next_cursor = encode_cursor(last[3], last[0])
+            meta["next_cursor"] = next_cursor
+
+            return listing_response(rows, meta, arrow)
+
+        rows, meta = climate_page(filters, page, per_page, arrow)
+        return listing_response(rows, meta, arrow)
 
-        if end_date:
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@climate_bp.route("/api/v1/climate/export", methods=["GET"])
+@cached_response(EXPORT_PARAMS, store=False)
+def export_climate_data():
+    """
+    Stream every matching reading as NDJSON, CSV or Arrow IPC in (date, id) order.
+    Query parameters: location_id, bbox, near, k, start_date, end_date, metric,
+    quality_threshold, format (ndjson, csv or arrow), after_date and after_id to
+    resume after a row
+
+    An ``Accept: application/vnd.apache.arrow.stream`` header selects Arrow
+    regardless of ``format``.
+    """
+    try:
+        from models import db, ClimateData
+        from dimensions import current_dimensions
+        from filters import FilterError, filter_conditions, parse_filters
+        from sharding import fan_out_shards, merged_partitions, route_to_shard
+
+        export_format = (
+            "arrow" if arrow_requested() else request.args.get("format", "ndjson")
+        )
+        after_date = request.args.get("after_date")
+        after_id = request.args.get("after_id", type=int)
+
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({"error": "Invalid format. Use: ndjson, csv, arrow"}), 400
+
+        if export_format == "arrow" and not arrow_available():
+            return jsonify({"error": ARROW_UNAVAILABLE}), 406
+
+        try:
+            filters = parse_filters(request.args)
+        except FilterError as e:
+            return jsonify({"error": str(e)}), 400
+
+        route_to_shard(filters.location_id, filters.location_ids)
+        resume = []
+        if after_date or after_id is not None:
             try:
-                end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-                query = query.filter(ClimateData.date <= end_date_obj)
+                after_date_obj = datetime.strptime(after_date or "", "%Y-%m-%d").date()
             except ValueError:
                 return (
-                    jsonify({"error": "Invalid end_date format. Use YYYY-MM-DD"}),
+                    jsonify(
+                        {
+                            "error": "Resuming requires after_date (YYYY-MM-DD) and after_id"
+                        }
+                    ),
                     400,
                 )
-
-        if metric:
-            query = query.filter(Metric.name == metric)
-
-        if quality_threshold:
-            quality_levels = {
-                "poor": [
-                    QualityLevel.POOR,
-                    QualityLevel.QUESTIONABLE,
-                    QualityLevel.GOOD,
-                    QualityLevel.EXCELLENT,
-                ],
-                "questionable": [
-                    QualityLevel.QUESTIONABLE,
-                    QualityLevel.GOOD,
-                    QualityLevel.EXCELLENT,
-                ],
-                "good": [QualityLevel.GOOD, QualityLevel.EXCELLENT],
-                "excellent": [QualityLevel.EXCELLENT],
-            }
-
-            if quality_threshold not in quality_levels:
+            if after_id is None:
                 return (
                     jsonify(
                         {
-                            "error": "Invalid quality_threshold. Use: poor, questionable, good, excellent"
+                            "error": "Resuming requires after_date (YYYY-MM-DD) and after_id"
                         }
                     ),
                     400,
                 )
-
-            query = query.filter(
-                ClimateData.quality.in_(quality_levels[quality_threshold])
+            resume.append(
+                or_(
+                    ClimateData.date > after_date_obj,
+                    and_(ClimateData.date == after_date_obj, ClimateData.id > after_id),
+                )
             )
 
-        total_count = query.count()
-
-        climate_data = query.order_by(ClimateData.date.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
+        # yield_per streams through a server-side cursor where the driver
+        # supports one, so memory stays flat regardless of the result size
+        columns = (
+            arrow_columns()
+            if export_format == "arrow"
+            else ClimateData.listing_columns()
         )
+        statement = (
+            db.select(*columns)
+            .where(*filter_conditions(filters), *resume)
+            .order_by(ClimateData.date.asc(), ClimateData.id.asc())
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        dumps = current_app.json.dumps
+        shards = fan_out_shards()
+        dimensions = current_dimensions()
+        location_lookup = dimensions.location_lookup
+        metric_lookup = dimensions.metric_lookup
 
-        return jsonify(
-            {
-                "data": [data.to_dict() for data in climate_data.items],
-                "meta": {
-                    "total_count": total_count,
-                    "page": page,
-                    "per_page": per_page,
-                },
-            }
+        def generate():
+            if shards is not None:
+                partitions = merged_partitions(
+                    shards, statement, listing_key, EXPORT_BATCH_SIZE
+                )
+            else:
+                partitions = db.session.execute(statement).partitions()
+            if export_format == "arrow":
+                yield from stream_batches(partitions, dimensions)
+            elif export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(EXPORT_FIELDS)
+                for partition in partitions:
+                    for row in partition:
+                        record = ClimateData.row_to_dict(
+                            row, location_lookup, metric_lookup
+                        )
+                        writer.writerow([record[field] for field in EXPORT_FIELDS])
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                yield buffer.getvalue()
+            else:
+                for partition in partitions:
+                    yield "".join(
+                        dumps(
+                            ClimateData.row_to_dict(row, location_lookup, metric_lookup)
+                        )
+                        + "\n"
+                        for row in partition
+                    )
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype=EXPORT_FORMATS[export_format],
+            headers={
+                "Content-Disposition": f"attachment; filename=climate_data.{export_format}"
+            },
         )
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@climate_bp.route("/api/v1/climate/batch", methods=["POST"])
+def ingest_climate_batch():
+    """
+    Ingest readings sent as a JSON array or NDJSON (application/x-ndjson).
+    Each reading: location_id, metric (name) or metric_id, date, value, quality
+    """
+    try:
+        from ingest import ingest_readings, parse_payload
+        from snapshot import rebuild_after_ingest
+
+        try:
+            readings = parse_payload(request.get_data(), request.mimetype)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid payload: {e}"}), 400
+
+        max_rows = current_app.config["INGEST_MAX_ROWS"]
+        if len(readings) > max_rows:
+            return (
+                jsonify(
+                    {"error": f"Batch too large. Send at most {max_rows} readings"}
+                ),
+                413,
+            )
+
+        result = ingest_readings(readings)
+        if result["inserted"] or result["updated"]:
+            rebuild_after_ingest()
+        return jsonify({"data": result})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,174 @@
+from flask import Blueprint, jsonify, request
+from werkzeug.datastructures import MultiDict
+import numpy as np
+
+from replicas import read_only
+
+dashboard_bp = Blueprint("dashboard", __name__)
+
+DASHBOARD_SECTIONS = ("climate", "summary", "trends")
+DASHBOARD_FIELDS = (
+    "location_id",
+    "bbox",
+    "near",
+    "k",
+    "start_date",
+    "end_date",
+    "metric",
+    "quality_threshold",
+    "page",
+    "per_page",
+)
+
+
+class SharedScan:
+    """
+    fetch_trend_columns() for one filter set, run at most once per request,
+    or the same arrays cut from a fresh snapshot
+    """
+
+    def __init__(self, filters):
+        self.filters = filters
+        self.columns = None
+
+    def __call__(self):
+        if self.columns is None:
+            from analytics import fetch_trend_columns
+            from snapshot import fresh_snapshot
+
+            snapshot = fresh_snapshot()
+            if snapshot is not None:
+                self.columns = snapshot.columns(self.filters)
+            else:
+                self.columns = fetch_trend_columns(self.filters)
+        return self.columns
+
+
+def page_from_columns(columns, page, per_page):
+    """
+    One page of /climate records and meta cut from fetch_trend_columns()
+    arrays, matching climate_page() row for row
+    """
+    from models import ClimateData
+    from analytics import QUALITY_BY_RANK, load_location_lookup, load_metric_lookup
+
+    offset_page = page if page >= 1 else 1
+    limit = per_page if per_page >= 1 else 20
+    # Ascending (date, id) reversed is the listing's date DESC, id DESC
+    order = np.lexsort((columns["id"], columns["date"]))[::-1]
+    positions = order[(offset_page - 1) * limit :][:limit]
+
+    location_lookup = load_location_lookup()
+    metric_lookup = load_metric_lookup()
+    records = [
+        ClimateData.row_to_dict(
+            (data_id, location_id, metric_id, day, value, QUALITY_BY_RANK[rank]),
+            location_lookup,
+            metric_lookup,
+        )
+        for data_id, location_id, metric_id, day, value, rank in zip(
+            columns["id"][positions].tolist(),
+            columns["location_id"][positions].tolist(),
+            columns["metric_id"][positions].tolist(),
+            columns["date"][positions].astype(object),
+            columns["value"][positions].tolist(),
+            columns["quality"][positions].tolist(),
+        )
+    ]
+
+    meta = {"total_count": len(columns["id"]), "page": page, "per_page": per_page}
+    return records, meta
+
+
+@dashboard_bp.route("/api/v1/dashboard", methods=["POST"])
+@read_only
+def get_dashboard():
+    """
+    Answer the climate, summary and trends views for one filter set at once.
+    JSON body: location_id, bbox, near, k, start_date, end_date, metric,
+    quality_threshold, page, per_page and sections (default: all three)
+
+    Each section equals the ``data`` of its own endpoint; the climate page's
+    meta is returned under ``meta.climate``. When the range needs raw rows,
+    the matching readings are fetched once and shared between sections.
+    """
+    try:
+        from models import ClimateData
+        from dimensions import current_dimensions
+        from filters import FilterError, parse_filters
+        from routes.climate import climate_page
+        from routes.summary import summary_data
+        from routes.trends import trends_data
+        from sharding import route_to_shard
+        from snapshot import fresh_snapshot
+
+        body = request.get_json(silent=True)
+        if body is None:
+            body = {}
+        if not isinstance(body, dict):
+            return jsonify({"error": "Invalid payload: expected a JSON object"}), 400
+
+        sections = body.get("sections", list(DASHBOARD_SECTIONS))
+        if (
+            not isinstance(sections, list)
+            or not sections
+            or any(section not in DASHBOARD_SECTIONS for section in sections)
+        ):
+            return (
+                jsonify(
+                    {"error": "Invalid sections. Use: " + ", ".join(DASHBOARD_SECTIONS)}
+                ),
+                400,
+            )
+
+        # Same parsing as the query strings of the individual endpoints
+        args = MultiDict(
+            {
+                name: str(body[name])
+                for name in DASHBOARD_FIELDS
+                if body.get(name) is not None
+            }
+        )
+        page = args.get("page", 1, type=int)
+        per_page = min(args.get("per_page", 50, type=int), 100)
+
+        try:
+            filters = parse_filters(args)
+        except FilterError as e:
+            return jsonify({"error": str(e)}), 400
+
+        route_to_shard(filters.location_id, filters.location_ids)
+        scan = SharedScan(filters)
+        data = {}
+        meta = {}
+
+        # Trends reads the scan whenever rollups cannot answer its range.
+        # Summary joins in when the scan exists or the listing needs a pass
+        # over the same rows for its count anyway; otherwise its GROUP BY is
+        # cheaper than fetching rows.
+        if "trends" in sections:
+            data["trends"] = trends_data(filters, scan)
+        if "summary" in sections:
+            shared = scan.columns is not None or "climate" in sections
+            data["summary"] = summary_data(filters, scan if shared else None)
+        # A snapshot pages from each metric's newest rows, cheaper than
+        # sorting the whole scan
+        if "climate" in sections:
+            if scan.columns is not None and fresh_snapshot() is None:
+                data["climate"], meta["climate"] = page_from_columns(
+                    scan.columns, page, per_page
+                )
+            else:
+                rows, meta["climate"] = climate_page(filters, page, per_page)
+                dimensions = current_dimensions()
+                data["climate"] = [
+                    ClimateData.row_to_dict(
+                        row, dimensions.location_lookup, dimensions.metric_lookup
+                    )
+                    for row in rows
+                ]
+
+        return jsonify({"data": data, "meta": meta})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -1,17 +1,20 @@
 from flask import Blueprint, jsonify
 
+from cache import cached_response
+
 locations_bp = Blueprint("locations", __name__)
 
 
 @locations_bp.route("/api/v1/locations", methods=["GET"])
+@cached_response(())
 def get_locations():
     """
     Retrieve all available locations.
     """
     try:
-        from models import Location
+        from dimensions import current_dimensions
 
-        locations = Location.query.all()
-        return jsonify({"data": [location.to_dict() for location in locations]})
+        # Served from the dimension cache, reloaded when the data version moves
+        return jsonify({"data": list(current_dimensions().locations)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1,17 +1,20 @@
 from flask import Blueprint, jsonify
 
+from cache import cached_response
+
 metrics_bp = Blueprint("metrics", __name__)
 
 
 @metrics_bp.route("/api/v1/metrics", methods=["GET"])
+@cached_response(())
 def get_metrics():
     """
     Retrieve all available climate metrics.
     """
     try:
-        from models import Metric
+        from dimensions import current_dimensions
 
-        metrics = Metric.query.all()
-        return jsonify({"data": [metric.to_dict() for metric in metrics]})
+        # Served from the dimension cache, reloaded when the data version moves
+        return jsonify({"data": list(current_dimensions().metrics)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,115 @@
+from flask import Blueprint, jsonify, request
+import numpy as np
+
+from cache import FILTER_PARAMS, cached_response
+
+series_bp = Blueprint("series", __name__)
+
+SERIES_PARAMS = FILTER_PARAMS + ("max_points", "method")
+DEFAULT_MAX_POINTS = 1000
+# LTTB needs the first point, the last point and at least one bucket
+MIN_MAX_POINTS = 3
+MAX_MAX_POINTS = 5000
+
+
+def series_data(columns, max_points, method):
+    """
+    One downsampled series per (metric, location) from fetch_trend_columns()
+    arrays, in metric then location order
+    """
+    from dimensions import current_dimensions
+    from downsample import downsample
+
+    if not len(columns["value"]):
+        return []
+
+    # Stable, so every series keeps the scan's date order
+    stride = int(columns["location_id"].max()) + 1
+    keys = columns["metric_id"] * stride + columns["location_id"]
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.diff(keys, prepend=-1))
+    lengths = np.diff(np.append(starts, len(keys)))
+
+    dates = columns["date"][order]
+    values = columns["value"][order]
+    kept = downsample(
+        dates.astype(np.int64).astype(np.float64),
+        values,
+        starts,
+        lengths,
+        max_points,
+        method,
+    )
+    bounds = np.searchsorted(kept, np.append(starts, len(keys)))
+    kept_dates = np.datetime_as_string(dates[kept]).tolist()
+    kept_values = np.round(values[kept], 4).tolist()
+
+    dimensions = current_dimensions()
+    data = []
+    for index, key in enumerate(keys[starts].tolist()):
+        metric_id, location_id = divmod(key, stride)
+        metric, unit = dimensions.metric_lookup[metric_id]
+        first, last = bounds[index], bounds[index + 1]
+        data.append(
+            {
+                "location_id": location_id,
+                "location_name": dimensions.location_lookup[location_id][0],
+                "metric": metric,
+                "unit": unit,
+                "total_points": int(lengths[index]),
+                "dates": kept_dates[first:last],
+                "values": kept_values[first:last],
+            }
+        )
+    return data
+
+
+@series_bp.route("/api/v1/series", methods=["GET"])
+@cached_response(SERIES_PARAMS)
+def get_series():
+    """
+    Per-(location, metric) time series reduced to at most max_points points
+    for charting.
+    Query parameters: location_id, bbox, near, k, start_date, end_date, metric,
+    quality_threshold, max_points, method (lttb or minmax)
+    """
+    try:
+        from analytics import fetch_trend_columns
+        from downsample import DOWNSAMPLE_METHODS
+        from filters import FilterError, parse_filters
+        from sharding import route_to_shard
+        from snapshot import fresh_snapshot
+
+        max_points = request.args.get("max_points", DEFAULT_MAX_POINTS, type=int)
+        max_points = min(max(max_points, MIN_MAX_POINTS), MAX_MAX_POINTS)
+        method = request.args.get("method", "lttb")
+        if method not in DOWNSAMPLE_METHODS:
+            return (
+                jsonify(
+                    {"error": "Invalid method. Use: " + ", ".join(DOWNSAMPLE_METHODS)}
+                ),
+                400,
+            )
+
+        try:
+            filters = parse_filters(request.args)
+        except FilterError as e:
+            return jsonify({"error": str(e)}), 400
+
+        route_to_shard(filters.location_id, filters.location_ids)
+        snapshot = fresh_snapshot()
+        if snapshot is not None:
+            columns = snapshot.columns(filters)
+        else:
+            columns = fetch_trend_columns(filters)
+
+        return jsonify(
+            {
+                "data": series_data(columns, max_points, method),
+                "meta": {"max_points": max_points, "method": method},
+            }
+        )
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -1,125 +1,202 @@
 from flask import Blueprint, jsonify, request
-from datetime import datetime
+from sqlalchemy import case, func
+
+from cache import cached_response
 
 summary_bp = Blueprint("summary", __name__)
 
 
+def summary_partials(filters, load_columns=None):
+    """
+    Per (metric, quality) partial aggregates for ``filters``: name, unit,
+    quality, min, max, sum, count and weighted sum. Rows for the same metric
+    merge, so shards each contribute their own and summary_data() combines them.
+    Given ``load_columns`` (returning fetch_trend_columns() arrays), ranges
+    not covered by rollups are aggregated from those arrays instead of a
+    GROUP BY query.
+    """
+    from models import db, ClimateData, QUALITY_WEIGHTS
+    from analytics import (
+        load_metric_lookup,
+        named_summary_rows,
+        ordered_summary_rows,
+        summary_rows,
+    )
+    from filters import filtered_query, statement_templates
+    from rollups import (
+        RAW,
+        plan_segments,
+        raw_condition,
+        rollups_ready,
+        summary_rollup_rows,
+    )
+    from sharding import fan_out_shards
+
+    # Loaded before any fan-out, so shard workers share the request's copy
+    metric_lookup = load_metric_lookup()
+    shards = fan_out_shards()
+    if shards is not None and load_columns is None:
+        return [
+            row
+            for shard_rows in shards.map(summary_partials, filters)
+            for row in shard_rows
+        ]
+
+    weight = case(
+        *[
+            (ClimateData.quality == quality, weight)
+            for quality, weight in QUALITY_WEIGHTS.items()
+        ],
+        else_=0,
+    )
+
+    # Grouped by metric id alone; names and units come from the dimension
+    # cache, so climate_data is never joined
+    aggregates = (
+        ClimateData.metric_id,
+        ClimateData.quality,
+        func.min(ClimateData.value),
+        func.max(ClimateData.value),
+        func.sum(ClimateData.value),
+        func.count(ClimateData.id),
+        func.sum(ClimateData.value * weight),
+    )
+    group_by = (ClimateData.metric_id, ClimateData.quality)
+
+    # Whole months/years come from the rollup tables; only the ragged
+    # edges of the date range are aggregated from raw readings. Sharded
+    # queries only get here with shared columns, which span every shard.
+    segments = (
+        plan_segments(filters.start_date, filters.end_date)
+        if shards is None and rollups_ready()
+        else []
+    )
+    if any(kind != RAW for kind, _, _ in segments):
+        raw_segments = [segment for segment in segments if segment[0] == RAW]
+        rows = summary_rollup_rows(
+            [segment for segment in segments if segment[0] != RAW],
+            metric_lookup,
+            location_id=filters.location_id,
+            location_ids=filters.location_ids,
+            metric_id=filters.metric_id,
+            qualities=filters.qualities,
+        )
+        if raw_segments:
+            rows += ordered_summary_rows(
+                named_summary_rows(
+                    filtered_query(filters, dates=False)
+                    .filter(raw_condition(raw_segments))
+                    .with_entities(*aggregates)
+                    .group_by(*group_by),
+                    metric_lookup,
+                )
+            )
+    elif load_columns is not None:
+        rows = summary_rows(load_columns(), metric_lookup)
+    else:
+        statement, params = statement_templates.get(
+            "summary",
+            filters,
+            lambda *conditions: db.select(*aggregates)
+            .where(*conditions)
+            .group_by(*group_by),
+        )
+        rows = ordered_summary_rows(
+            named_summary_rows(db.session.execute(statement, params), metric_lookup)
+        )
+    return rows
+
+
+def summary_data(filters, load_columns=None):
+    """
+    Quality-weighted statistics keyed by metric name, combined from
+    summary_partials(), or aggregated from a fresh snapshot's columns
+    """
+    from models import QUALITY_WEIGHTS
+    from analytics import summary_rows
+    from snapshot import fresh_snapshot
+
+    snapshot = fresh_snapshot()
+    if snapshot is not None:
+        columns = snapshot.columns(filters) if load_columns is None else load_columns()
+        rows = summary_rows(columns, snapshot.metric_lookup)
+    else:
+        rows = summary_partials(filters, load_columns)
+
+    by_metric = {}
+    for metric_name, unit, quality, min_q, max_q, sum_q, count_q, wsum_q in rows:
+        if metric_name not in by_metric:
+            by_metric[metric_name] = {
+                "unit": unit,
+                "min": float(min_q),
+                "max": float(max_q),
+                "sum": 0.0,
+                "count": 0,
+                "weighted_sum": 0.0,
+                "weight_sum": 0.0,
+                "quality_counts": {},
+            }
+        group = by_metric[metric_name]
+        group["min"] = min(group["min"], float(min_q))
+        group["max"] = max(group["max"], float(max_q))
+        group["sum"] += float(sum_q)
+        group["count"] += count_q
+        group["weighted_sum"] += float(wsum_q)
+        group["weight_sum"] += QUALITY_WEIGHTS[quality] * count_q
+        group["quality_counts"][quality.value] = (
+            group["quality_counts"].get(quality.value, 0) + count_q
+        )
+
+    metrics_summary = {}
+
+    for metric_name, group in by_metric.items():
+        total_count = group["count"]
+        if not total_count:
+            continue
+
+        avg_val = group["sum"] / total_count
+
+        weight_sum = group["weight_sum"]
+        weighted_avg = group["weighted_sum"] / weight_sum if weight_sum > 0 else 0
+
+        quality_distribution = {
+            quality: count / total_count
+            for quality, count in group["quality_counts"].items()
+        }
+
+        metrics_summary[metric_name] = {
+            "min": round(group["min"], 2),
+            "max": round(group["max"], 2),
+            "avg": round(avg_val, 2),
+            "weighted_avg": round(weighted_avg, 2),
+            "unit": group["unit"],
+            "quality_distribution": quality_distribution,
+        }
+
+    return metrics_summary
+
+
 @summary_bp.route("/api/v1/summary", methods=["GET"])
+@cached_response()
 def get_summary():
     """
     Retrieve quality-weighted summary statistics for climate data.
-    Query parameters: location_id, start_date, end_date, metric, quality_threshold
+    Query parameters: location_id, bbox, near, k, start_date, end_date, metric,
+    quality_threshold
     """
     try:
-        from models import ClimateData, Location, Metric, QualityLevel, QUALITY_WEIGHTS
-
-        location_id = request.args.get("location_id", type=int)
-        start_date = request.args.get("start_date")
-        end_date = request.args.get("end_date")
-        metric_filter = request.args.get("metric")
-        quality_threshold = request.args.get("quality_threshold")
-
-        query = ClimateData.query.join(Location).join(Metric)
-
-        if location_id:
-            query = query.filter(ClimateData.location_id == location_id)
-
-        if start_date:
-            try:
-                start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-                query = query.filter(ClimateData.date >= start_date_obj)
-            except ValueError:
-                return (
-                    jsonify({"error": "Invalid start_date format. Use YYYY-MM-DD"}),
-                    400,
-                )
-
-        if end_date:
-            try:
-                end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-                query = query.filter(ClimateData.date <= end_date_obj)
-            except ValueError:
-                return (
-                    jsonify({"error": "Invalid end_date format. Use YYYY-MM-DD"}),
-                    400,
-                )
-
-        if metric_filter:
-            query = query.filter(Metric.name == metric_filter)
-
-        if quality_threshold:
-            quality_levels = {
-                "poor": [
-                    QualityLevel.POOR,
-                    QualityLevel.QUESTIONABLE,
-                    QualityLevel.GOOD,
-                    QualityLevel.EXCELLENT,
-                ],
-                "questionable": [
-                    QualityLevel.QUESTIONABLE,
-                    QualityLevel.GOOD,
-                    QualityLevel.EXCELLENT,
-                ],
-                "good": [QualityLevel.GOOD, QualityLevel.EXCELLENT],
-                "excellent": [QualityLevel.EXCELLENT],
-            }
+        from filters import FilterError, SHORT_QUALITY_THRESHOLD_ERROR, parse_filters
+        from sharding import route_to_shard
 
-            if quality_threshold not in quality_levels:
-                return jsonify({"error": "Invalid quality_threshold"}), 400
-
-            query = query.filter(
-                ClimateData.quality.in_(quality_levels[quality_threshold])
+        try:
+            filters = parse_filters(
+                request.args, quality_error=SHORT_QUALITY_THRESHOLD_ERROR
             )
+        except FilterError as e:
+            return jsonify({"error": str(e)}), 400
 
-        data = query.all()
-
-        metrics_summary = {}
-
-        by_metric = {}
-        for item in data:
-            metric_name = item.metric.name
-            if metric_name not in by_metric:
-                by_metric[metric_name] = []
-            by_metric[metric_name].append(item)
-
-        for metric_name, metric_data in by_metric.items():
-            if not metric_data:
-                continue
-
-            values = [float(item.value) for item in metric_data]
-            weights = [QUALITY_WEIGHTS[item.quality] for item in metric_data]
-
-            min_val = min(values)
-            max_val = max(values)
-            avg_val = sum(values) / len(values)
-
-            weighted_sum = sum(v * w for v, w in zip(values, weights))
-            weight_sum = sum(weights)
-            weighted_avg = weighted_sum / weight_sum if weight_sum > 0 else 0
-
-            quality_counts = {}
-            for item in metric_data:
-                quality = item.quality.value
-                quality_counts[quality] = quality_counts.get(quality, 0) + 1
-
-            total_count = len(metric_data)
-            quality_distribution = {
-                quality: count / total_count
-                for quality, count in quality_counts.items()
-            }
-
-            unit = metric_data[0].metric.unit
-
-            metrics_summary[metric_name] = {
-                "min": round(min_val, 2),
-                "max": round(max_val, 2),
-                "avg": round(avg_val, 2),
-                "weighted_avg": round(weighted_avg, 2),
-                "unit": unit,
-                "quality_distribution": quality_distribution,
-            }
-
-        return jsonify({"data": metrics_summary})
+        route_to_shard(filters.location_id, filters.location_ids)
+        return jsonify({"data": summary_data(filters)})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1,157 +1,197 @@
+from concurrent.futures.process import BrokenProcessPool
+
 from flask import Blueprint, jsonify, request
-from datetime import datetime
-import statistics
+
+from cache import cached_response
 
 trends_bp = Blueprint("trends", __name__)
 
 
+def trends_data(filters, load_columns=None):
+    """
+    Trend, anomaly and seasonality results keyed by metric name.
+    ``load_columns`` returns fetch_trend_columns() arrays for ``filters``;
+    passing one lets callers share a single scan of the readings.
+    """
+    from filters import filtered_query
+    from analytics import (
+        classify_trend,
+        compute_trend,
+        fetch_seasonality_columns,
+        fetch_trend_columns,
+        find_anomalies,
+        format_anomaly,
+        load_location_lookup,
+        load_metric_lookup,
+        split_by_metric,
+    )
+    from rollups import (
+        MONTH,
+        RAW,
+        plan_segments,
+        rollup_anomaly_rows,
+        rollup_seasonality_rows,
+        rollup_trend_stats,
+        rollups_ready,
+    )
+    from seasonality import (
+        range_binned_by_day,
+        seasonality_from_columns,
+        seasonality_from_observations,
+    )
+    from sharding import fan_out_shards
+    from snapshot import fresh_snapshot
+    from trend_pool import trend_pool
+
+    snapshot = fresh_snapshot()
+    shared_scan = load_columns is not None
+    if load_columns is None:
+
+        def load_columns():
+            if snapshot is not None:
+                return snapshot.columns(filters)
+            return fetch_trend_columns(filters)
+
+    base_query = filtered_query(filters, dates=False)
+    query = filtered_query(filters)
+
+    if snapshot is not None:
+        metric_lookup = snapshot.metric_lookup
+        location_lookup = snapshot.location_lookup
+    else:
+        metric_lookup = load_metric_lookup()
+        location_lookup = load_location_lookup()
+
+    # (metric_id, direction, rate, confidence, anomalies)
+    results = []
+
+    # Ranges spanning whole months are answered from monthly rollups,
+    # reading raw rows only for the edges, the split month and anomalies.
+    # Each shard holds its own rollups but trends need the combined series,
+    # so a sharded query merges the shards' raw columns instead. A fresh
+    # snapshot answers everything from its columns without SQL.
+    segments = (
+        plan_segments(filters.start_date, filters.end_date, periods=(MONTH,))
+        if snapshot is None and fan_out_shards() is None and rollups_ready()
+        else []
+    )
+    if any(kind != RAW for kind, _, _ in segments):
+        stats = rollup_trend_stats(
+            base_query,
+            segments,
+            location_id=filters.location_id,
+            location_ids=filters.location_ids,
+            metric_id=filters.metric_id,
+            qualities=filters.qualities,
+        )
+        for metric_id, stat in stats.items():
+            direction, rate, confidence = classify_trend(
+                stat["count"],
+                stat["first_half_avg"],
+                stat["second_half_avg"],
+                stat["high_quality_count"],
+            )
+            mean_val = stat["mean"]
+            stdev_val = stat["stdev"]
+            anomalies = []
+            if stat["count"] > 3 and stdev_val > 0:
+                anomalies = [
+                    format_anomaly(
+                        day,
+                        float(value),
+                        abs(float(value) - mean_val) / stdev_val,
+                        quality_rank,
+                        data_location_id,
+                        location_lookup,
+                    )
+                    for day, value, quality_rank, data_location_id in rollup_anomaly_rows(
+                        query, metric_id, mean_val, stdev_val
+                    )
+                ]
+            results.append((metric_id, direction, rate, confidence, anomalies))
+
+        # Spans of MONTHLY_BIN_SPAN months or more are binned by month, which
+        # the rollups already hold. Shorter ones are binned by day, the only
+        # case that reads readings here: just the four columns day bins use,
+        # unless the caller's shared scan is loading every column anyway. A
+        # requested range that is already too short skips the rollup query.
+        seasonality = None
+        if not range_binned_by_day(filters.start_date, filters.end_date):
+            seasonality = seasonality_from_observations(
+                rollup_seasonality_rows(
+                    base_query,
+                    segments,
+                    location_id=filters.location_id,
+                    location_ids=filters.location_ids,
+                    metric_id=filters.metric_id,
+                    qualities=filters.qualities,
+                )
+            )
+        if seasonality is None:
+            seasonality = seasonality_from_columns(
+                load_columns() if shared_scan else fetch_seasonality_columns(filters)
+            )
+    else:
+        columns = load_columns()
+        pool = trend_pool(len(columns["value"]))
+        if pool is not None:
+            try:
+                results, seasonality = pool.analyze(columns, location_lookup)
+            except BrokenProcessPool:
+                # A worker died; this request runs serially and the next one
+                # starts a fresh pool
+                pool = None
+        if pool is None:
+            seasonality = seasonality_from_columns(columns)
+            for metric_id, series in split_by_metric(columns):
+                values = series["value"]
+                if len(values) < 2:
+                    continue
+
+                direction, rate, confidence = compute_trend(values, series["quality"])
+                anomalies = find_anomalies(series, location_lookup)
+                results.append((metric_id, direction, rate, confidence, anomalies))
+
+    trends_summary = {}
+
+    for metric_id, direction, rate, confidence, anomalies in results:
+        metric_name, unit = metric_lookup[metric_id]
+
+        trends_summary[metric_name] = {
+            "trend": {
+                "direction": direction,
+                "rate": rate,
+                "unit": f"{unit}/period",
+                "confidence": round(confidence, 2),
+            },
+            "anomalies": anomalies,
+            "seasonality": seasonality[metric_id],
+        }
+
+    return trends_summary
+
+
 @trends_bp.route("/api/v1/trends", methods=["GET"])
+@cached_response()
 def get_trends():
     """
     Analyze trends and patterns in climate data.
-    Query parameters: location_id, start_date, end_date, metric, quality_threshold
+    Query parameters: location_id, bbox, near, k, start_date, end_date, metric,
+    quality_threshold
     """
     try:
-        from models import ClimateData, Location, Metric, QualityLevel
+        from filters import FilterError, SHORT_QUALITY_THRESHOLD_ERROR, parse_filters
+        from sharding import route_to_shard
 
-        location_id = request.args.get("location_id", type=int)
-        start_date = request.args.get("start_date")
-        end_date = request.args.get("end_date")
-        metric_filter = request.args.get("metric")
-        quality_threshold = request.args.get("quality_threshold")
-
-        query = ClimateData.query.join(Location).join(Metric)
-
-        if location_id:
-            query = query.filter(ClimateData.location_id == location_id)
-
-        if start_date:
-            try:
-                start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-                query = query.filter(ClimateData.date >= start_date_obj)
-            except ValueError:
-                return (
-                    jsonify({"error": "Invalid start_date format. Use YYYY-MM-DD"}),
-                    400,
-                )
-
-        if end_date:
-            try:
-                end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-                query = query.filter(ClimateData.date <= end_date_obj)
-            except ValueError:
-                return (
-                    jsonify({"error": "Invalid end_date format. Use YYYY-MM-DD"}),
-                    400,
-                )
-
-        if metric_filter:
-            query = query.filter(Metric.name == metric_filter)
-
-        if quality_threshold:
-            quality_levels = {
-                "poor": [
-                    QualityLevel.POOR,
-                    QualityLevel.QUESTIONABLE,
-                    QualityLevel.GOOD,
-                    QualityLevel.EXCELLENT,
-                ],
-                "questionable": [
-                    QualityLevel.QUESTIONABLE,
-                    QualityLevel.GOOD,
-                    QualityLevel.EXCELLENT,
-                ],
-                "good": [QualityLevel.GOOD, QualityLevel.EXCELLENT],
-                "excellent": [QualityLevel.EXCELLENT],
-            }
-
-            if quality_threshold not in quality_levels:
-                return jsonify({"error": "Invalid quality_threshold"}), 400
-
-            query = query.filter(
-                ClimateData.quality.in_(quality_levels[quality_threshold])
+        try:
+            filters = parse_filters(
+                request.args, quality_error=SHORT_QUALITY_THRESHOLD_ERROR
             )
+        except FilterError as e:
+            return jsonify({"error": str(e)}), 400
 
-        data = query.order_by(ClimateData.date.asc()).all()
-
-        trends_summary = {}
-        by_metric = {}
-        for item in data:
-            metric_name = item.metric.name
-            if metric_name not in by_metric:
-                by_metric[metric_name] = []
-            by_metric[metric_name].append(item)
-
-        for metric_name, metric_data in by_metric.items():
-            if len(metric_data) < 2:
-                continue
-
-            values = [float(item.value) for item in metric_data]
-            dates = [item.date for item in metric_data]
-
-            mid_point = len(values) // 2
-            first_half_avg = sum(values[:mid_point]) / mid_point if mid_point > 0 else 0
-            second_half_avg = sum(values[mid_point:]) / (len(values) - mid_point)
-
-            if second_half_avg > first_half_avg * 1.05:
-                direction = "increasing"
-                rate = round((second_half_avg - first_half_avg) / len(values), 4)
-            elif second_half_avg < first_half_avg * 0.95:
-                direction = "decreasing"
-                rate = round((first_half_avg - second_half_avg) / len(values), 4)
-            else:
-                direction = "stable"
-                rate = 0
-
-            high_quality_count = sum(
-                1 for item in metric_data if item.quality.value in ["excellent", "good"]
-            )
-            confidence = min(0.95, 0.4 + (high_quality_count / len(metric_data)) * 0.5)
-
-            anomalies = []
-            if len(values) > 3:
-                mean_val = statistics.mean(values)
-                stdev_val = statistics.stdev(values)
-
-                for item in metric_data:
-                    value = float(item.value)
-                    deviation = abs(value - mean_val)
-                    if deviation > 2 * stdev_val:
-                        anomalies.append(
-                            {
-                                "date": item.date.strftime("%Y-%m-%d"),
-                                "value": round(value, 2),
-                                "deviation": round(deviation / stdev_val, 1),
-                                "quality": item.quality.value,
-                                "location": item.location.name,
-                                "location_id": item.location_id,
-                                "coordinates": {
-                                    "latitude": float(item.location.latitude),
-                                    "longitude": float(item.location.longitude),
-                                },
-                            }
-                        )
-
-            seasonality = {
-                "detected": len(values) > 8,
-                "period": "monthly" if len(values) > 8 else "insufficient_data",
-                "confidence": 0.6 if len(values) > 8 else 0.1,
-            }
-
-            unit = metric_data[0].metric.unit
-
-            trends_summary[metric_name] = {
-                "trend": {
-                    "direction": direction,
-                    "rate": rate,
-                    "unit": f"{unit}/period",
-                    "confidence": round(confidence, 2),
-                },
-                "anomalies": anomalies[:5],
-                "seasonality": seasonality,
-            }
-
-        return jsonify({"data": trends_summary})
+        route_to_shard(filters.location_id, filters.location_ids)
+        return jsonify({"data": trends_data(filters)})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,346 @@
+"""
+Running Welford statistics for EcoVision Climate Visualizer
+Per-series (count, mean, M2) states are merged with Chan's parallel update on
+every ingest, so anomaly baselines never need a rescan of the raw readings
+"""
+
+import math
+from datetime import date
+from functools import reduce
+
+import numpy as np
+from sqlalchemy import SmallInteger, String, and_, delete, or_, select, type_coerce
+from sqlalchemy.dialects import mysql, sqlite
+
+from filters import location_in
+from models import (
+    db,
+    ClimateData,
+    ClimateRollup,
+    QualityLevel,
+    SeriesStats,
+    QUALITY_LEVELS,
+)
+
+KEY_COLUMNS = ("location_id", "metric_id", "quality")
+EMPTY_STATS = (0, 0.0, 0.0)
+
+# Relative tolerance when comparing stored states against a recompute
+VERIFY_TOLERANCE = 1e-6
+# Series per statement when refreshing stats, keeping each OR short
+REFRESH_SLICE = 200
+
+
+def merge_stats(a, b):
+    """Chan et al. merge of two (count, mean, m2) states"""
+    count_a, mean_a, m2_a = a
+    count_b, mean_b, m2_b = b
+    count = count_a + count_b
+    if not count_b:
+        return a
+    if not count_a:
+        return b
+    delta = mean_b - mean_a
+    return (
+        count,
+        mean_a + delta * count_b / count,
+        m2_a + m2_b + delta * delta * count_a * count_b / count,
+    )
+
+
+def combine_stats(states):
+    """Merge any number of (count, mean, m2) states"""
+    return reduce(merge_stats, states, EMPTY_STATS)
+
+
+def sample_stdev(stats):
+    count, _, m2 = stats
+    return math.sqrt(max(m2, 0.0) / (count - 1)) if count > 1 else 0.0
+
+
+def fold_series_stats(readings, partials=None):
+    """
+    Fold (location_id, metric_id, value, quality) readings into
+    {(location_id, metric_id, quality): [count, mean, m2]} with Welford updates
+    """
+    if partials is None:
+        partials = {}
+    for location_id, metric_id, value, quality in readings:
+        if not isinstance(quality, QualityLevel):
+            quality = QualityLevel(quality)
+        value = float(value)
+
+        key = (location_id, metric_id, quality)
+        state = partials.get(key)
+        if state is None:
+            partials[key] = [1, value, 0.0]
+            continue
+        state[0] += 1
+        delta = value - state[1]
+        state[1] += delta / state[0]
+        state[2] += delta * (value - state[1])
+    return partials
+
+
+def _merged_stats(current, new):
+    # Ordered so MySQL, which applies assignments left to right, still reads
+    # the old count and mean in every expression
+    count = current.reading_count + new.reading_count
+    delta = new.value_mean - current.value_mean
+    return [
+        (
+            "value_m2",
+            current.value_m2
+            + new.value_m2
+            + delta * delta * current.reading_count * new.reading_count / count,
+        ),
+        ("value_mean", current.value_mean + delta * new.reading_count / count),
+        ("reading_count", count),
+    ]
+
+
+def upsert_series_stats(session, partials):
+    """Merge partial states into series_stats with a single upsert per batch"""
+    if not partials:
+        return
+
+    rows = [
+        dict(
+            zip(KEY_COLUMNS, key),
+            reading_count=state[0],
+            value_mean=state[1],
+            value_m2=state[2],
+        )
+        for key, state in partials.items()
+    ]
+    table = SeriesStats.__table__
+    dialect = session.get_bind().dialect.name
+
+    if dialect == "sqlite":
+        statement = sqlite.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(KEY_COLUMNS),
+            set_=dict(_merged_stats(table.c, statement.excluded)),
+        )
+        session.execute(statement, rows)
+    elif dialect in ("mysql", "mariadb"):
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update(
+            _merged_stats(table.c, statement.inserted)
+        )
+        session.execute(statement, rows)
+    else:
+        for row in rows:
+            key_filter = and_(*[table.c[name] == row[name] for name in KEY_COLUMNS])
+            existing = session.execute(select(table).where(key_filter)).first()
+            if existing is None:
+                session.execute(table.insert(), [row])
+                continue
+            count, mean, m2 = merge_stats(
+                (existing.reading_count, existing.value_mean, existing.value_m2),
+                (row["reading_count"], row["value_mean"], row["value_m2"]),
+            )
+            session.execute(
+                table.update()
+                .where(key_filter)
+                .values(reading_count=count, value_mean=mean, value_m2=m2)
+            )
+
+
+def clear_series_stats(session):
+    session.execute(delete(SeriesStats))
+
+
+def refresh_series_stats(session, series):
+    """
+    Recompute the series_stats rows of the given (location_id, metric_id)
+    series from their stored readings, for readings changed in place
+    """
+    series = sorted(series)
+    for start in range(0, len(series), REFRESH_SLICE):
+        taken = series[start : start + REFRESH_SLICE]
+        session.execute(
+            delete(SeriesStats).where(
+                or_(
+                    *[
+                        and_(
+                            SeriesStats.location_id == location_id,
+                            SeriesStats.metric_id == metric_id,
+                        )
+                        for location_id, metric_id in taken
+                    ]
+                )
+            )
+        )
+        readings = session.execute(
+            select(
+                ClimateData.location_id,
+                ClimateData.metric_id,
+                ClimateData.value,
+                ClimateData.quality,
+            ).where(
+                or_(
+                    *[
+                        and_(
+                            ClimateData.location_id == location_id,
+                            ClimateData.metric_id == metric_id,
+                        )
+                        for location_id, metric_id in taken
+                    ]
+                )
+            )
+        )
+        upsert_series_stats(session, fold_series_stats(readings))
+
+
+def series_baselines(
+    location_id=None, location_ids=None, metric_id=None, qualities=None
+):
+    """
+    {metric_id: (count, mean, m2)} over all stored readings matching the
+    filters, merged from at most one state per (location, quality)
+    """
+    query = db.session.query(
+        SeriesStats.metric_id,
+        SeriesStats.reading_count,
+        SeriesStats.value_mean,
+        SeriesStats.value_m2,
+    )
+    if location_id:
+        query = query.filter(SeriesStats.location_id == location_id)
+    if location_ids is not None:
+        query = query.filter(location_in(SeriesStats.location_id, location_ids))
+    if metric_id is not None:
+        query = query.filter(SeriesStats.metric_id == metric_id)
+    if qualities is not None:
+        query = query.filter(SeriesStats.quality.in_(qualities))
+
+    baselines = {}
+    for metric_id, count, mean, m2 in query.order_by(SeriesStats.id):
+        baselines[metric_id] = merge_stats(
+            baselines.get(metric_id, EMPTY_STATS), (count, mean, m2)
+        )
+    return baselines
+
+
+def _grouped_stats(keys, values):
+    """Exact two-pass count, mean and M2 for each distinct row of ``keys``"""
+    order = np.lexsort(keys[::-1])
+    keys = keys[:, order]
+    values = values[order]
+    boundaries = np.flatnonzero(np.any(keys[:, 1:] != keys[:, :-1], axis=0)) + 1
+    starts = np.concatenate(([0], boundaries))
+
+    counts = np.diff(np.append(starts, len(values)))
+    means = np.add.reduceat(values, starts) / counts
+    deviations = values - np.repeat(means, counts)
+    m2 = np.add.reduceat(deviations * deviations, starts)
+    return keys[:, starts].T, counts, means, m2
+
+
+def _close(stored, expected):
+    return abs(stored - expected) <= VERIFY_TOLERANCE * max(1.0, abs(expected))
+
+
+def verify_running_stats(batch_size=50000):
+    """
+    Recompute every series_stats state and monthly rollup M2 from the raw
+    readings and return a list of mismatch descriptions
+    """
+    # Codes are the stored ranks
+    qualities = QUALITY_LEVELS
+    columns = {name: [] for name in ("location", "metric", "quality", "month", "value")}
+
+    result = db.session.execute(
+        select(
+            ClimateData.location_id,
+            ClimateData.metric_id,
+            type_coerce(ClimateData.quality, SmallInteger),
+            type_coerce(ClimateData.date, String),
+            ClimateData.value,
+        ).execution_options(yield_per=batch_size)
+    )
+    for partition in result.partitions():
+        location_ids, metric_ids, quality_ranks, days, values = zip(*partition)
+        columns["location"].append(np.array(location_ids, dtype=np.int64))
+        columns["metric"].append(np.array(metric_ids, dtype=np.int64))
+        columns["quality"].append(np.array(quality_ranks, dtype=np.int64))
+        columns["month"].append(
+            np.array(days, dtype="datetime64[D]")
+            .astype("datetime64[M]")
+            .astype(np.int64)
+        )
+        columns["value"].append(np.array(values, dtype=np.float64))
+
+    mismatches = []
+    stored_series = {
+        (row.location_id, row.metric_id, row.quality): (
+            row.reading_count,
+            row.value_mean,
+            row.value_m2,
+        )
+        for row in db.session.query(SeriesStats)
+    }
+    stored_months = {
+        (row.location_id, row.metric_id, row.quality, row.period_start): (
+            row.reading_count,
+            row.value_sum / row.reading_count,
+            row.value_m2,
+        )
+        for row in db.session.query(ClimateRollup).filter(
+            ClimateRollup.period == "month"
+        )
+    }
+
+    expected_series = {}
+    expected_months = {}
+    if columns["value"]:
+        data = {name: np.concatenate(parts) for name, parts in columns.items()}
+        keys, counts, means, m2 = _grouped_stats(
+            np.stack([data["location"], data["metric"], data["quality"]]), data["value"]
+        )
+        for (location_id, metric_id, code), count, mean, m2_value in zip(
+            keys, counts, means, m2
+        ):
+            expected_series[(int(location_id), int(metric_id), qualities[code])] = (
+                int(count),
+                float(mean),
+                float(m2_value),
+            )
+
+        keys, counts, means, m2 = _grouped_stats(
+            np.stack(
+                [data["location"], data["metric"], data["quality"], data["month"]]
+            ),
+            data["value"],
+        )
+        for (location_id, metric_id, code, month), count, mean, m2_value in zip(
+            keys, counts, means, m2
+        ):
+            month_start = date.fromisoformat(
+                str(np.datetime64(int(month), "M").astype("datetime64[D]"))
+            )
+            expected_months[
+                (int(location_id), int(metric_id), qualities[code], month_start)
+            ] = (int(count), float(mean), float(m2_value))
+
+    for label, stored, expected in (
+        ("series", stored_series, expected_series),
+        ("month", stored_months, expected_months),
+    ):
+        for key in stored.keys() - expected.keys():
+            mismatches.append(f"{label} {key}: stored but has no readings")
+        for key, (count, mean, m2_value) in expected.items():
+            state = stored.get(key)
+            if state is None:
+                mismatches.append(f"{label} {key}: missing")
+            elif (
+                state[0] != count
+                or not _close(state[1], mean)
+                or not _close(state[2], m2_value)
+            ):
+                mismatches.append(
+                    f"{label} {key}: stored {state}, recomputed "
+                    f"{(count, mean, m2_value)}"
+                )
+    return mismatches
@@ -0,0 +1,280 @@
+"""
+Batched seasonality detection for EcoVision Climate Visualizer
+Every (location, metric) series in a request is binned onto one padded 2-D
+grid and scored with an FFT autocorrelation in a single vectorized pass
+"""
+
+import numpy as np
+
+# (label, period length in days)
+SEASONAL_PERIODS = (
+    ("weekly", 7.0),
+    ("monthly", 30.44),
+    ("quarterly", 91.31),
+    ("yearly", 365.25),
+)
+DAYS_PER_MONTH = 30.44
+
+# Series spanning this many calendar months or more are binned by month
+MONTHLY_BIN_SPAN = 36
+DETECTION_THRESHOLD = 0.3
+MIN_CYCLES = 1.5
+MIN_LAG_PAIRS = 3
+# Multiples of a short period also peak at longer candidate lags, so the
+# shortest candidate scoring within this fraction of the best is reported
+HARMONIC_TOLERANCE = 0.85
+
+
+def monthly_bins(first_month, last_month):
+    """True when a span of datetime64[M] months is binned by month rather than day"""
+    return int(last_month - first_month) >= MONTHLY_BIN_SPAN
+
+
+def range_binned_by_day(start, end):
+    """
+    True when an inclusive [start, end] date range is too short to be binned
+    by month, whatever readings it holds; either side may be None
+    """
+    if start is None or end is None:
+        return False
+    return not monthly_bins(np.datetime64(start, "M"), np.datetime64(end, "M"))
+
+
+def _grid(series_index, bin_index, sums, counts, n_series, n_bins):
+    """Scatter binned sums and counts onto a zero-padded (series, bin) grid"""
+    flat = series_index * n_bins + bin_index
+    size = n_series * n_bins
+    grid_sums = np.bincount(flat, weights=sums, minlength=size).reshape(
+        n_series, n_bins
+    )
+    grid_counts = np.bincount(flat, weights=counts, minlength=size).reshape(
+        n_series, n_bins
+    )
+    return grid_sums, grid_counts
+
+
+def _autocorrelation(means, mask):
+    """
+    Row-wise autocorrelation of linearly detrended bin means, normalized by the
+    number of observed bin pairs at each lag so empty bins do not bias it
+    """
+    n_bins = means.shape[1]
+    weights = mask.astype(np.float64)
+    observed = weights.sum(axis=1, keepdims=True)
+
+    # Masked least-squares line per row, removed so a long-term trend does not
+    # register as correlation at every lag
+    t = np.arange(n_bins, dtype=np.float64)
+    t_mean = (weights * t).sum(axis=1, keepdims=True) / observed
+    y_mean = (weights * means).sum(axis=1, keepdims=True) / observed
+    t_dev = (t - t_mean) * weights
+    t_var = (t_dev * t_dev).sum(axis=1, keepdims=True)
+    slope = np.divide(
+        (t_dev * (means - y_mean)).sum(axis=1, keepdims=True),
+        t_var,
+        out=np.zeros_like(t_var),
+        where=t_var > 0,
+    )
+    residuals = (means - y_mean - slope * (t - t_mean)) * weights
+
+    size = 1 << int(2 * n_bins - 1).bit_length()
+    spectrum = np.fft.rfft(residuals, n=size, axis=1)
+    covariance = np.fft.irfft(spectrum * spectrum.conj(), n=size, axis=1)[:, :n_bins]
+    mask_spectrum = np.fft.rfft(weights, n=size, axis=1)
+    pairs = np.rint(
+        np.fft.irfft(mask_spectrum * mask_spectrum.conj(), n=size, axis=1)[:, :n_bins]
+    )
+
+    valid = pairs >= MIN_LAG_PAIRS
+    lag_covariance = np.divide(
+        covariance, pairs, out=np.zeros_like(covariance), where=valid
+    )
+    variance = lag_covariance[:, :1]
+    correlation = np.divide(
+        lag_covariance,
+        variance,
+        out=np.zeros_like(lag_covariance),
+        where=variance > 1e-12,
+    )
+    return correlation, valid
+
+
+def _period_scores(correlation, valid, spans, bin_days):
+    """
+    Score each candidate period per series as the autocorrelation peak at the
+    period minus the trough at half the period, scaled to [0, 1]. Returns a
+    (series, period) array with NaN where a period cannot be evaluated.
+    """
+    n_series, n_bins = correlation.shape
+    peaks = np.where(valid, correlation, -np.inf)
+    troughs = np.where(valid, correlation, np.inf)
+    scores = np.full((n_series, len(SEASONAL_PERIODS)), np.nan)
+
+    for column, (_, days) in enumerate(SEASONAL_PERIODS):
+        period = days / bin_days
+        if period < 2:
+            continue
+        peak_lo = max(int(np.floor(period * 0.95)), 1)
+        peak_hi = int(np.ceil(period * 1.05))
+        trough_lo = max(int(round(period * 0.4)), 1)
+        trough_hi = max(int(round(period * 0.6)), trough_lo)
+        if peak_hi >= n_bins:
+            continue
+
+        peak = peaks[:, peak_lo : peak_hi + 1].max(axis=1)
+        trough = troughs[:, trough_lo : trough_hi + 1].min(axis=1)
+        evaluable = (
+            (spans >= MIN_CYCLES * period) & np.isfinite(peak) & np.isfinite(trough)
+        )
+        scores[:, column] = np.where(
+            evaluable, np.clip((peak - trough) / 2, 0.0, 1.0), np.nan
+        )
+
+    return scores
+
+
+def series_layout(metric_ids, location_ids, dates):
+    """
+    Place observations on the bin grid shared by every series. Returns
+    (bins, bin_days, n_bins, series_keys, series_index, stride): each
+    observation's bin and series row, and the packed (metric, location) key
+    per row.
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    if monthly_bins(months.min(), months.max()):
+        bins = (months - months.min()).astype(np.int64)
+        bin_days = DAYS_PER_MONTH
+    else:
+        bins = (dates - dates.min()).astype(np.int64)
+        bin_days = 1.0
+    n_bins = int(bins.max()) + 1
+
+    # Pack (metric, location) into one integer key; a row-wise np.unique on a
+    # 2-D key array is an order of magnitude slower
+    metric_ids = np.asarray(metric_ids, dtype=np.int64)
+    location_ids = np.asarray(location_ids, dtype=np.int64)
+    stride = int(location_ids.max()) + 1
+    series_keys, series_index = np.unique(
+        metric_ids * stride + location_ids, return_inverse=True
+    )
+    return bins, bin_days, n_bins, series_keys, series_index, stride
+
+
+def series_scores(series_index, bins, sums, counts, n_series, n_bins, bin_days):
+    """
+    (series, period) scores and per-series observation counts. Rows are
+    scored independently, so any contiguous range of series can be scored
+    on its own with the same ``n_bins`` and ``bin_days``.
+    """
+    grid_sums, grid_counts = _grid(
+        series_index,
+        bins,
+        np.asarray(sums, dtype=np.float64),
+        np.asarray(counts, dtype=np.float64),
+        n_series,
+        n_bins,
+    )
+    mask = grid_counts > 0
+    means = np.divide(grid_sums, grid_counts, out=np.zeros_like(grid_sums), where=mask)
+
+    first_bin = np.argmax(mask, axis=1)
+    last_bin = n_bins - 1 - np.argmax(mask[:, ::-1], axis=1)
+    spans = (last_bin - first_bin + 1).astype(np.float64)
+
+    correlation, valid = _autocorrelation(means, mask)
+    return _period_scores(correlation, valid, spans, bin_days), grid_counts.sum(axis=1)
+
+
+def metric_seasonality(series_keys, stride, scores, weights):
+    """
+    Combine location series into one result per metric, weighting each
+    series' scores by its reading count
+    """
+    metric_keys, metric_index = np.unique(series_keys // stride, return_inverse=True)
+    evaluable = ~np.isnan(scores)
+    weighted = np.where(evaluable, scores, 0.0) * weights[:, None]
+    totals = np.zeros((len(metric_keys), scores.shape[1]))
+    coverage = np.zeros_like(totals)
+    np.add.at(totals, metric_index, weighted)
+    np.add.at(coverage, metric_index, evaluable * weights[:, None])
+    metric_scores = np.divide(
+        totals, coverage, out=np.full_like(totals, np.nan), where=coverage > 0
+    )
+
+    results = {}
+    for metric_id, row in zip(metric_keys, metric_scores):
+        if np.isnan(row).all():
+            results[int(metric_id)] = {
+                "detected": False,
+                "period": "insufficient_data",
+                "confidence": 0.0,
+            }
+            continue
+        best_score = np.nanmax(row)
+        best = int(np.flatnonzero(row >= HARMONIC_TOLERANCE * best_score)[0])
+        confidence = float(row[best])
+        detected = confidence >= DETECTION_THRESHOLD
+        results[int(metric_id)] = {
+            "detected": detected,
+            "period": SEASONAL_PERIODS[best][0] if detected else "none",
+            "confidence": round(confidence, 2),
+        }
+    return results
+
+
+def detect_seasonality(metric_ids, location_ids, dates, sums, counts):
+    """
+    Seasonality per metric from observations given as parallel arrays. Each
+    observation is a reading (sum = value, count = 1) or, for month-binned
+    spans, a pre-aggregated month keyed by its first day.
+
+    Returns {metric_id: {"detected", "period", "confidence"}} where a metric's
+    score is the reading-weighted mean over its location series.
+    """
+    if not len(dates):
+        return {}
+
+    bins, bin_days, n_bins, series_keys, series_index, stride = series_layout(
+        metric_ids, location_ids, dates
+    )
+    scores, weights = series_scores(
+        series_index, bins, sums, counts, len(series_keys), n_bins, bin_days
+    )
+    return metric_seasonality(series_keys, stride, scores, weights)
+
+
+def seasonality_from_columns(columns):
+    """Seasonality per metric from fetch_trend_columns() arrays"""
+    count = len(columns["value"])
+    return detect_seasonality(
+        columns["metric_id"],
+        columns["location_id"],
+        columns["date"],
+        columns["value"],
+        np.ones(count),
+    )
+
+
+def seasonality_from_observations(rows):
+    """
+    Seasonality per metric from (metric_id, location_id, date, sum, count)
+    rows mixing monthly aggregates and single readings, or None when their
+    span is too short to be binned by month
+    """
+    if not rows:
+        return {}
+
+    metric_ids, location_ids, dates, sums, counts = zip(*rows)
+    dates = np.array(dates, dtype="datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    if not monthly_bins(months.min(), months.max()):
+        return None
+
+    return detect_seasonality(
+        np.array(metric_ids, dtype=np.int64),
+        np.array(location_ids, dtype=np.int64),
+        dates,
+        np.array(sums, dtype=np.float64),
+        np.array(counts, dtype=np.float64),
+    )
@@ -0,0 +1,217 @@
+"""
+Location-sharded storage for EcoVision Climate Visualizer
+Readings are partitioned by location_id across N databases, each holding the
+full schema, a copy of the locations and metrics tables and its own rollups.
+A request for one location is pinned to that location's shard; other queries
+run on every shard in a thread pool and their partial results are merged.
+"""
+
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from flask import current_app, g
+from sqlalchemy import func, select
+
+from models import db, ClimateData, DataVersion
+from replicas import SHARD_INFO_KEY
+
+SHARD_BIND_PREFIX = "shard_"
+# Per-request values on flask.g that shard workers reuse instead of re-reading
+SHARED_REQUEST_STATE = ("data_version", "dimensions")
+
+
+def shard_binds(urls):
+    """SQLALCHEMY_BINDS entries for a list of shard URLs"""
+    return {f"{SHARD_BIND_PREFIX}{index}": url for index, url in enumerate(urls)}
+
+
+def shard_index(location_id, count):
+    """Shard number holding a location's readings"""
+    return location_id % count
+
+
+class ShardSet:
+    """Shard engines plus the worker pool that runs one task per shard"""
+
+    def __init__(self, app, engines, max_workers=None):
+        self.app = app
+        self.engines = list(engines)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or len(self.engines),
+            thread_name_prefix="shard",
+        )
+        self.lock = threading.Lock()
+        self.id_floor = None
+        self.reserved_ids = {}
+
+    def engine_for(self, location_id):
+        return self.engines[shard_index(location_id, len(self.engines))]
+
+    def _run(self, index, function, args, request_state):
+        # Each worker gets its own app context, and with it its own session;
+        # it sees the data version and dimensions its request already read
+        with self.app.app_context():
+            for name, value in request_state.items():
+                setattr(g, name, value)
+            db.session.info[SHARD_INFO_KEY] = self.engines[index]
+            return function(*args)
+
+    def submit(self, index, function, *args):
+        """Run function(*args) with the session pinned to one shard"""
+        request_state = {
+            name: g.get(name) for name in SHARED_REQUEST_STATE if name in g
+        }
+        return self.executor.submit(self._run, index, function, args, request_state)
+
+    def map(self, function, *args):
+        """Run function(*args) on every shard concurrently; results in shard order"""
+        futures = [
+            self.submit(index, function, *args) for index in range(len(self.engines))
+        ]
+        return [future.result() for future in futures]
+
+    def data_version(self):
+        """Sum of the primary's and every shard's data version"""
+        total = 0
+        for engine in (db.engine, *self.engines):
+            with engine.connect() as connection:
+                total += (
+                    connection.execute(
+                        select(DataVersion.version).where(DataVersion.id == 1)
+                    ).scalar()
+                    or 0
+                )
+        return total
+
+    def new_ids(self, engine, count):
+        """
+        ``count`` ids for new readings in a shard, unique across shards: above
+        every id stored when this process started and every id it handed out,
+        in the shard's residue class modulo the shard count
+        """
+        shards = len(self.engines)
+        index = self.engines.index(engine)
+        current = db.session.execute(select(func.max(ClimateData.id))).scalar() or 0
+
+        with self.lock:
+            if self.id_floor is None:
+                floor = 0
+                for shard in self.engines:
+                    with shard.connect() as connection:
+                        floor = max(
+                            floor,
+                            connection.execute(
+                                select(func.max(ClimateData.id))
+                            ).scalar()
+                            or 0,
+                        )
+                self.id_floor = floor
+
+            # Ids are reserved here, so concurrent requests in this process
+            # never pick the same ones before either commits
+            start = max(current, self.id_floor, self.reserved_ids.get(index, 0)) + 1
+            first = start + (index - start) % shards
+            ids = range(first, first + count * shards, shards)
+            self.reserved_ids[index] = ids[-1]
+        return ids
+
+
+def fan_out_shards():
+    """
+    The ShardSet a query has to run on, or None when storage is unsharded or
+    the session is already pinned to one shard
+    """
+    shards = current_app.extensions.get("shards")
+    if shards is None or SHARD_INFO_KEY in db.session.info:
+        return None
+    return shards
+
+
+def route_to_shard(location_id, location_ids=None):
+    """
+    Pin the session to the shard holding ``location_id``, or holding every
+    one of ``location_ids``, when sharded
+    """
+    shards = current_app.extensions.get("shards")
+    if shards is None:
+        return
+    if location_id is None and location_ids:
+        count = len(shards.engines)
+        if len({shard_index(data_id, count) for data_id in location_ids}) == 1:
+            location_id = location_ids[0]
+    if location_id is not None:
+        db.session.info[SHARD_INFO_KEY] = shards.engine_for(location_id)
+
+
+def assign_shard_ids(rows):
+    """Set an id on rows about to be inserted into the shard the session is pinned to"""
+    engine = db.session.info.get(SHARD_INFO_KEY)
+    if engine is None or not rows:
+        return
+    shards = current_app.extensions["shards"]
+    for row, data_id in zip(rows, shards.new_ids(engine, len(rows))):
+        row["id"] = data_id
+
+
+def execute_all(statement, params):
+    return db.session.execute(statement, params).all()
+
+
+def merged_rows(shards, statement, params, key, reverse=False):
+    """
+    Rows of an ordered statement run on every shard, merged into one ordered
+    list; each shard applies the statement's own LIMIT, so the merged list is
+    at most shard count times longer
+    """
+    return list(
+        heapq.merge(
+            *shards.map(execute_all, statement, params), key=key, reverse=reverse
+        )
+    )
+
+
+def merged_partitions(shards, statement, key, size):
+    """
+    Stream an ordered statement from every shard at once, yielding lists of
+    up to ``size`` rows in merged order
+    """
+    connections = []
+    try:
+        for engine in shards.engines:
+            connections.append(engine.connect())
+        rows = heapq.merge(
+            *(connection.execute(statement) for connection in connections), key=key
+        )
+        while True:
+            partition = list(islice(rows, size))
+            if not partition:
+                return
+            yield partition
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def init_sharding(app, db):
+    """Create the ShardSet for configured shard binds"""
+    keys = sorted(
+        (
+            key
+            for key in app.config.get("SQLALCHEMY_BINDS", {})
+            if key and key.startswith(SHARD_BIND_PREFIX)
+        ),
+        key=lambda key: int(key[len(SHARD_BIND_PREFIX) :]),
+    )
+    if not keys:
+        return None
+
+    with app.app_context():
+        shards = ShardSet(
+            app,
+            (db.engines[key] for key in keys),
+            max_workers=app.config.get("SHARD_WORKERS"),
+        )
+    app.extensions["shards"] = shards
+    return shards
@@ -0,0 +1,398 @@
+"""
+Memory-mapped columnar snapshots for EcoVision Climate Visualizer
+Readings are exported to per-metric column files sorted by (date, id).
+Every worker maps the same files read-only, so the page cache holds one copy,
+and summary, trend and listing requests are answered from the arrays while
+the snapshot's data version is current.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+from flask import current_app, g
+
+from analytics import fetch_trend_columns, load_location_lookup, load_metric_lookup
+from cache import get_data_version, request_data_version
+from filters import ClimateFilters
+from models import QUALITY_RANKS
+
+SNAPSHOT_FORMAT = 1
+CURRENT_LINK = "current"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+SNAPSHOT_PREFIX = "snapshot-"
+BUILD_PREFIX = ".build-"
+
+# Fixed little-endian layouts, so a snapshot reads the same on any host
+COLUMN_DTYPES = {
+    "id": np.dtype("<i8"),
+    "day": np.dtype("<i4"),
+    "value": np.dtype("<f8"),
+    "quality": np.dtype("u1"),
+    "location": np.dtype("<u2"),
+}
+LOCATION_ID_LIMIT = np.iinfo(COLUMN_DTYPES["location"]).max
+
+
+def day_number(day):
+    """Days since 1970-01-01, the snapshot's date encoding"""
+    return int(np.datetime64(day, "D").astype(np.int64))
+
+
+class Snapshot:
+    """One snapshot directory's manifest and memory-mapped columns"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest["format"] != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format {manifest['format']}")
+
+        self.path = path
+        self.version = manifest["data_version"]
+        self.built_at = manifest["built_at"]
+        self.metric_lookup = {
+            int(metric_id): (metric["name"], metric["unit"])
+            for metric_id, metric in manifest["metrics"].items()
+        }
+        self.location_lookup = {
+            location_id: (name, latitude, longitude)
+            for location_id, name, latitude, longitude in manifest["locations"]
+        }
+        self.columns_by_metric = {}
+        for metric_id, metric in manifest["metrics"].items():
+            rows = metric["rows"]
+            self.columns_by_metric[int(metric_id)] = {
+                name: (
+                    np.memmap(
+                        os.path.join(path, f"{metric_id}.{name}"),
+                        dtype=dtype,
+                        mode="r",
+                        shape=(rows,),
+                    )
+                    if rows
+                    # Empty files cannot be mapped
+                    else np.empty(0, dtype=dtype)
+                )
+                for name, dtype in COLUMN_DTYPES.items()
+            }
+
+    def _parts(self, filters):
+        """
+        (metric_id, column arrays) per metric for the filters, each in
+        (date, id) order; dates are cut by binary search, the rest by masks
+        """
+        if filters.metric_id is not None:
+            metric_ids = [filters.metric_id]
+        else:
+            metric_ids = sorted(self.columns_by_metric)
+        if filters.location_id and filters.location_id > LOCATION_ID_LIMIT:
+            return []
+        selected = None
+        if filters.location_ids is not None:
+            # Lookup table indexed by the uint16 location column
+            ids = np.asarray(filters.location_ids, dtype=np.int64)
+            selected = np.zeros(LOCATION_ID_LIMIT + 1, dtype=bool)
+            selected[ids[(ids >= 0) & (ids <= LOCATION_ID_LIMIT)]] = True
+
+        parts = []
+        for metric_id in metric_ids:
+            columns = self.columns_by_metric.get(metric_id)
+            if columns is None:
+                continue
+            days = columns["day"]
+            start = (
+                np.searchsorted(days, day_number(filters.start_date), "left")
+                if filters.start_date
+                else 0
+            )
+            end = (
+                np.searchsorted(days, day_number(filters.end_date), "right")
+                if filters.end_date
+                else len(days)
+            )
+            part = {name: column[start:end] for name, column in columns.items()}
+
+            mask = None
+            if filters.location_id:
+                mask = part["location"] == filters.location_id
+            if selected is not None:
+                in_selection = selected[part["location"]]
+                mask = in_selection if mask is None else mask & in_selection
+            if filters.qualities is not None:
+                passing = part["quality"] >= QUALITY_RANKS[filters.qualities[0]]
+                mask = passing if mask is None else mask & passing
+            if mask is not None:
+                part = {name: column[mask] for name, column in part.items()}
+            parts.append((metric_id, part))
+        return parts
+
+    @staticmethod
+    def _trend_columns(metric_id, part):
+        return {
+            "id": np.asarray(part["id"], dtype=np.int64),
+            "metric_id": np.full(len(part["id"]), metric_id, dtype=np.int64),
+            "date": np.asarray(part["day"]).astype("datetime64[D]"),
+            "value": np.asarray(part["value"], dtype=np.float64),
+            "quality": np.asarray(part["quality"], dtype=np.int8),
+            "location_id": np.asarray(part["location"], dtype=np.int64),
+        }
+
+    def columns(self, filters):
+        """fetch_trend_columns() arrays for the filters, in the same order"""
+        parts = [self._trend_columns(*part) for part in self._parts(filters)]
+        if not parts:
+            empty = {name: np.empty(0, dtype) for name, dtype in COLUMN_DTYPES.items()}
+            parts = [self._trend_columns(0, empty)]
+        return {
+            name: np.concatenate([part[name] for part in parts]) for name in parts[0]
+        }
+
+    def listing_rows(self, filters, limit, offset=0, before=None):
+        """
+        (rows, total_count) for the /climate listing, newest first: rows are
+        listing_columns() tuples for ClimateData.row_to_dict(), skipping
+        ``offset`` rows, or starting below a ``before`` (date, id) position
+        """
+        from analytics import QUALITY_BY_RANK
+
+        parts = self._parts(filters)
+        total_count = sum(len(part["id"]) for _, part in parts)
+
+        # Each part is in ascending (date, id) order, so the page lies in
+        # the last offset + limit rows of every part
+        tails = []
+        for metric_id, part in parts:
+            end = len(part["id"])
+            if before is not None:
+                before_day, before_id = day_number(before[0]), before[1]
+                end = np.searchsorted(part["day"], before_day, "left")
+                same_day = np.searchsorted(part["day"], before_day, "right")
+                end += np.searchsorted(part["id"][end:same_day], before_id, "left")
+            start = max(end - (offset + limit), 0)
+            tails.append(
+                self._trend_columns(
+                    metric_id,
+                    {name: column[start:end] for name, column in part.items()},
+                )
+            )
+
+        if not tails:
+            return [], total_count
+        columns = {
+            name: np.concatenate([tail[name] for tail in tails]) for name in tails[0]
+        }
+        positions = np.lexsort((columns["id"], columns["date"]))[::-1][
+            offset : offset + limit
+        ]
+
+        rows = list(
+            zip(
+                columns["id"][positions].tolist(),
+                columns["location_id"][positions].tolist(),
+                columns["metric_id"][positions].tolist(),
+                columns["date"][positions].astype(object),
+                columns["value"][positions].tolist(),
+                [
+                    QUALITY_BY_RANK[rank]
+                    for rank in columns["quality"][positions].tolist()
+                ],
+            )
+        )
+        return rows, total_count
+
+
+class SnapshotStore:
+    """The snapshot directory: builds, atomic swaps and the loaded snapshot"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.target = None
+        self.snapshot = None
+        self.rebuild_lock = threading.Lock()
+        self.rebuild_pending = False
+        self.rebuild_thread = None
+
+    def current(self):
+        """The snapshot the ``current`` link points at, or None"""
+        try:
+            target = os.readlink(os.path.join(self.directory, CURRENT_LINK))
+        except OSError:
+            return None
+        if target != self.target:
+            with self.lock:
+                if target != self.target:
+                    try:
+                        self.snapshot = Snapshot(os.path.join(self.directory, target))
+                    except (OSError, ValueError, KeyError):
+                        # Swapped out and pruned mid-load, or unreadable
+                        self.snapshot = None
+                    self.target = target
+        return self.snapshot
+
+    def fresh(self, version):
+        """The current snapshot if it was built at ``version``, else None"""
+        snapshot = self.current()
+        if snapshot is None or snapshot.version != version:
+            return None
+        return snapshot
+
+    def _write(self, path, version):
+        metric_lookup = load_metric_lookup()
+        location_lookup = load_location_lookup()
+        if location_lookup and max(location_lookup) > LOCATION_ID_LIMIT:
+            raise ValueError(
+                f"Location ids above {LOCATION_ID_LIMIT} do not fit in a snapshot"
+            )
+
+        metrics = {}
+        for metric_id in sorted(metric_lookup):
+            # One metric at a time keeps memory to the largest metric
+            columns = fetch_trend_columns(
+                ClimateFilters(
+                    location_id=None,
+                    location_ids=None,
+                    metric_name=None,
+                    metric_id=metric_id,
+                    qualities=None,
+                    start_date=None,
+                    end_date=None,
+                )
+            )
+            arrays = {
+                "id": columns["id"],
+                "day": columns["date"].astype(np.int64),
+                "value": columns["value"],
+                "quality": columns["quality"],
+                "location": columns["location_id"],
+            }
+            for name, dtype in COLUMN_DTYPES.items():
+                arrays[name].astype(dtype).tofile(
+                    os.path.join(path, f"{metric_id}.{name}")
+                )
+            name, unit = metric_lookup[metric_id]
+            metrics[str(metric_id)] = {
+                "name": name,
+                "unit": unit,
+                "rows": len(columns["id"]),
+            }
+
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "data_version": version,
+            "built_at": time.time(),
+            "metrics": metrics,
+            "locations": [
+                [location_id, name, latitude, longitude]
+                for location_id, (name, latitude, longitude) in sorted(
+                    location_lookup.items()
+                )
+            ],
+        }
+        with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f)
+        return manifest
+
+    def build(self):
+        """
+        Export every reading to a new snapshot and make it current. Files are
+        written to a hidden directory, which is renamed into place and then
+        swapped in by renaming a fresh ``current`` link over the old one.
+        Returns the manifest.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_FILE), "w") as lock_file:
+            # One builder at a time, across worker processes too
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            # Read first: a write during the export makes the snapshot stale
+            # rather than mislabelled
+            version = get_data_version()
+            build_path = tempfile.mkdtemp(prefix=BUILD_PREFIX, dir=self.directory)
+            # mkdtemp() is private to its creator; workers may run as others
+            os.chmod(build_path, 0o755)
+            try:
+                manifest = self._write(build_path, version)
+                suffix = os.path.basename(build_path)[len(BUILD_PREFIX) :]
+                name = f"{SNAPSHOT_PREFIX}{version}-{suffix}"
+                os.rename(build_path, os.path.join(self.directory, name))
+            except BaseException:
+                shutil.rmtree(build_path, ignore_errors=True)
+                raise
+
+            link = os.path.join(self.directory, f".{CURRENT_LINK}-{os.getpid()}")
+            os.symlink(name, link)
+            os.replace(link, os.path.join(self.directory, CURRENT_LINK))
+
+            # Workers still reading an older snapshot keep its mapped files
+            # until they move on; only new opens of those paths fail
+            for entry in os.listdir(self.directory):
+                if entry.startswith(SNAPSHOT_PREFIX) and entry != name:
+                    shutil.rmtree(
+                        os.path.join(self.directory, entry), ignore_errors=True
+                    )
+        return manifest
+
+    def _rebuild_loop(self, app):
+        while True:
+            with self.rebuild_lock:
+                if not self.rebuild_pending:
+                    self.rebuild_thread = None
+                    return
+                self.rebuild_pending = False
+            with app.app_context():
+                try:
+                    self.build()
+                except Exception:
+                    app.logger.exception("Snapshot rebuild failed")
+
+    def request_rebuild(self, app):
+        """
+        Rebuild in a background thread; requests made during a build are
+        folded into one more build after it
+        """
+        with self.rebuild_lock:
+            self.rebuild_pending = True
+            if self.rebuild_thread is None:
+                self.rebuild_thread = threading.Thread(
+                    target=self._rebuild_loop,
+                    args=(app,),
+                    name="snapshot-rebuild",
+                    daemon=True,
+                )
+                self.rebuild_thread.start()
+
+
+def fresh_snapshot():
+    """The snapshot matching the current data version, or None (once per request)"""
+    store = current_app.extensions.get("snapshots")
+    if store is None:
+        return None
+    if "snapshot" not in g:
+        g.snapshot = store.fresh(request_data_version())
+    return g.snapshot
+
+
+def rebuild_after_ingest():
+    """Queue a snapshot rebuild when SNAPSHOT_REBUILD_ON_INGEST is on"""
+    store = current_app.extensions.get("snapshots")
+    if store is not None and current_app.config["SNAPSHOT_REBUILD_ON_INGEST"]:
+        store.request_rebuild(current_app._get_current_object())
+
+
+def init_snapshots(app):
+    """Create the store for SNAPSHOT_DIR, if one is configured"""
+    app.config.setdefault("SNAPSHOT_DIR", None)
+    app.config.setdefault("SNAPSHOT_REBUILD_ON_INGEST", True)
+    if not app.config["SNAPSHOT_DIR"]:
+        return None
+    store = SnapshotStore(app.config["SNAPSHOT_DIR"])
+    app.extensions["snapshots"] = store
+    return store
@@ -0,0 +1,159 @@
+"""
+In-memory spatial index over location coordinates for EcoVision Climate Visualizer
+Locations are bucketed on a latitude/longitude grid and kept sorted by cell,
+so a bounding box reads one contiguous slice per grid row, and a nearest
+search widens a block of cells around the point until no unread cell can
+hold a closer location
+"""
+
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+# Cell size targets this many locations per cell on a uniform spread; the
+# bounds keep tiny tables coarse and huge ones from exploding the grid
+LOCATIONS_PER_CELL = 8
+MIN_CELL_DEGREES = 0.05
+MAX_CELL_DEGREES = 30.0
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances in km from one point to arrays of points"""
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class SpatialIndex:
+    """Location ids on a latitude/longitude grid, for box and nearest queries"""
+
+    def __init__(self, ids, latitudes, longitudes):
+        ids = np.asarray(ids, dtype=np.int64)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+
+        cell = math.sqrt(180 * 360 * LOCATIONS_PER_CELL / max(len(ids), 1))
+        cell = min(max(cell, MIN_CELL_DEGREES), MAX_CELL_DEGREES)
+        # Whole numbers of cells, so longitude columns wrap evenly at ±180
+        self.rows = math.ceil(180 / cell)
+        self.cols = math.ceil(360 / cell)
+        self.cell_lat = 180 / self.rows
+        self.cell_lon = 360 / self.cols
+
+        keys = self._row(latitudes) * self.cols + self._col(longitudes)
+        order = np.lexsort((ids, keys))
+        self.keys = keys[order]
+        self.ids = ids[order]
+        self.latitudes = latitudes[order]
+        self.longitudes = longitudes[order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _row(self, latitude):
+        row = np.floor((np.asarray(latitude) + 90) / self.cell_lat).astype(np.int64)
+        return np.clip(row, 0, self.rows - 1)
+
+    def _col(self, longitude):
+        col = np.floor((np.asarray(longitude) + 180) / self.cell_lon).astype(np.int64)
+        return np.clip(col, 0, self.cols - 1)
+
+    def _block(self, row_lo, row_hi, col_ranges):
+        """Positions of the locations in rows row_lo..row_hi and the column ranges"""
+        rows = np.arange(row_lo, row_hi + 1) * self.cols
+        starts = np.concatenate(
+            [np.searchsorted(self.keys, rows + lo, "left") for lo, _ in col_ranges]
+        )
+        ends = np.concatenate(
+            [np.searchsorted(self.keys, rows + hi, "right") for _, hi in col_ranges]
+        )
+        sizes = ends - starts
+        return np.repeat(starts - (np.cumsum(sizes) - sizes), sizes) + np.arange(
+            sizes.sum()
+        )
+
+    def _inside(self, positions, bbox):
+        """Mask of positions inside (min_lon, min_lat, max_lon, max_lat)"""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        latitudes = self.latitudes[positions]
+        longitudes = self.longitudes[positions]
+        inside = (latitudes >= min_lat) & (latitudes <= max_lat)
+        if min_lon <= max_lon:
+            return inside & (longitudes >= min_lon) & (longitudes <= max_lon)
+        # A box whose west edge is east of its east edge crosses the antimeridian
+        return inside & ((longitudes >= min_lon) | (longitudes <= max_lon))
+
+    def within(self, min_lon, min_lat, max_lon, max_lat):
+        """Sorted ids of the locations inside the box (edges included)"""
+        col_lo, col_hi = int(self._col(min_lon)), int(self._col(max_lon))
+        if min_lon <= max_lon:
+            col_ranges = [(col_lo, col_hi)]
+        elif col_lo > col_hi:
+            col_ranges = [(col_lo, self.cols - 1), (0, col_hi)]
+        else:
+            # Both edges of an antimeridian box in one column: the two wrapped
+            # ranges would overlap there, so read every column once instead
+            col_ranges = [(0, self.cols - 1)]
+        positions = self._block(
+            int(self._row(min_lat)), int(self._row(max_lat)), col_ranges
+        )
+        bbox = (min_lon, min_lat, max_lon, max_lat)
+        return np.sort(self.ids[positions[self._inside(positions, bbox)]])
+
+    def _reach_km(self, latitude, longitude, row_lo, row_hi, col, span):
+        """Lower bound on the distance to any location outside the searched block"""
+        bounds = []
+        if row_hi < self.rows - 1:
+            bounds.append((row_hi + 1) * self.cell_lat - 90 - latitude)
+        if row_lo > 0:
+            bounds.append(latitude - (row_lo * self.cell_lat - 90))
+        if 2 * span + 1 < self.cols:
+            west = (col - span) * self.cell_lon - 180
+            east = (col + span + 1) * self.cell_lon - 180
+            gap = math.radians(min(longitude - west, east - longitude, 90))
+            # Closest a point at least ``gap`` of longitude away can come
+            bounds.append(
+                math.degrees(
+                    math.asin(math.cos(math.radians(latitude)) * math.sin(gap))
+                )
+            )
+        if not bounds:
+            return math.inf
+        return math.radians(min(bounds)) * EARTH_RADIUS_KM
+
+    def nearest(self, latitude, longitude, k, within=None):
+        """
+        Ids of the ``k`` locations closest to the point by great-circle
+        distance, nearest first (ties by id), optionally only those inside
+        the ``within`` box
+        """
+        row, col = int(self._row(latitude)), int(self._col(longitude))
+        span = 0
+        while True:
+            row_lo, row_hi = max(row - span, 0), min(row + span, self.rows - 1)
+            if 2 * span + 1 >= self.cols:
+                col_ranges = [(0, self.cols - 1)]
+            else:
+                lo, hi = (col - span) % self.cols, (col + span) % self.cols
+                col_ranges = [(lo, hi)] if lo <= hi else [(lo, self.cols - 1), (0, hi)]
+            positions = self._block(row_lo, row_hi, col_ranges)
+            if within is not None:
+                positions = positions[self._inside(positions, within)]
+
+            reach = self._reach_km(latitude, longitude, row_lo, row_hi, col, span)
+            if len(positions) >= k or reach == math.inf:
+                distances = haversine_km(
+                    latitude,
+                    longitude,
+                    self.latitudes[positions],
+                    self.longitudes[positions],
+                )
+                closest = np.lexsort((self.ids[positions], distances))[:k]
+                if reach == math.inf or distances[closest[-1]] <= reach:
+                    return self.ids[positions[closest]]
+            span = max(span * 2, 1)
@@ -0,0 +1,89 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+READING_DAYS = 60
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """App on a fresh SQLite file holding READING_DAYS readings per location/metric"""
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'climate.db'}")
+    monkeypatch.setenv("RESPONSE_CACHE_SIZE", "0")
+    for name in ("READ_REPLICA_URLS", "SHARD_URLS", "SNAPSHOT_DIR"):
+        monkeypatch.delenv(name, raising=False)
+
+    from app import create_app
+    from models import db, ClimateData, Location, Metric, QUALITY_LEVELS
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(
+            [
+                Location(
+                    id=1,
+                    name="Irvine",
+                    country="USA",
+                    latitude=33.6846,
+                    longitude=-117.8265,
+                    region="California",
+                ),
+                Location(
+                    id=2,
+                    name="Tokyo",
+                    country="Japan",
+                    latitude=35.6762,
+                    longitude=139.6503,
+                    region="Kanto",
+                ),
+                Metric(
+                    id=1,
+                    name="temperature",
+                    display_name="Temperature",
+                    unit="celsius",
+                    description="Average daily temperature",
+                ),
+                Metric(
+                    id=2,
+                    name="precipitation",
+                    display_name="Precipitation",
+                    unit="mm",
+                    description="Daily precipitation",
+                ),
+            ]
+        )
+        db.session.commit()
+
+        start = date(2024, 1, 1)
+        db.session.execute(
+            ClimateData.__table__.insert(),
+            [
+                {
+                    "location_id": location_id,
+                    "metric_id": metric_id,
+                    "date": start + timedelta(days=day),
+                    "value": 10.0 + day % 7,
+                    "quality": QUALITY_LEVELS[day % 4],
+                }
+                for location_id in (1, 2)
+                for metric_id in (1, 2)
+                for day in range(READING_DAYS)
+            ],
+        )
+        db.session.commit()
+    yield app
+
+    # Apps built with replica or shard binds register their keys on the shared
+    # db, where the next test's create_all() would look for their engines
+    for key in [key for key in db.metadatas if key is not None]:
+        del db.metadatas[key]
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,129 @@
+import gzip
+from datetime import date
+
+import pytest
+from sqlalchemy import update
+
+from cache import response_cache
+
+
+@pytest.fixture
+def cached_client(client, monkeypatch):
+    """Client with the response cache on; it is process-wide, so start empty"""
+    monkeypatch.setattr(response_cache, "max_entries", 16)
+    response_cache.clear()
+    yield client
+    response_cache.clear()
+
+
+def cache_stats(client):
+    return client.get("/api/v1/cache/stats").get_json()["data"]
+
+
+def raise_february(app, value):
+    """Set Irvine's February temperatures to ``value``, turning its trend upward"""
+    from models import db, ClimateData
+
+    with app.app_context():
+        db.session.execute(
+            update(ClimateData)
+            .where(
+                ClimateData.location_id == 1,
+                ClimateData.metric_id == 1,
+                ClimateData.date >= date(2024, 2, 1),
+            )
+            .values(value=value)
+        )
+        db.session.commit()
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/api/v1/summary?location_id=1",
+        "/api/v1/trends?location_id=1",
+        "/api/v1/climate?location_id=1&metric=temperature&per_page=5",
+    ],
+)
+def test_cached_response_is_replaced_after_a_write(app, cached_client, url):
+    first = cached_client.get(url)
+    assert first.status_code == 200
+    assert cached_client.get(url).get_data() == first.get_data()
+    assert cache_stats(cached_client)["hits"] == 1
+    version = cache_stats(cached_client)["data_version"]
+
+    raise_february(app, 99.5)
+
+    assert cache_stats(cached_client)["data_version"] == version + 1
+    changed = cached_client.get(url)
+    assert changed.status_code == 200
+    assert changed.get_data() != first.get_data()
+    assert cache_stats(cached_client)["hits"] == 1
+
+
+def test_cache_key_ignores_parameter_order_and_unknown_parameters(cached_client):
+    cached_client.get("/api/v1/summary?location_id=1&metric=temperature")
+    cached_client.get("/api/v1/summary?metric=temperature&location_id=1&utm=x")
+    assert cache_stats(cached_client)["hits"] == 1
+
+
+def test_missing_version_table_reads_as_version_zero(app, client):
+    from models import db, DataVersion
+
+    with app.app_context():
+        DataVersion.__table__.drop(db.engine)
+
+    response = client.get("/api/v1/summary?location_id=1")
+    assert response.status_code == 200
+    assert cache_stats(client)["data_version"] == 0
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/api/v1/summary?location_id=1",
+        "/api/v1/trends?location_id=1",
+        "/api/v1/climate?location_id=1&end_date=2024-01-05&per_page=5",
+    ],
+)
+def test_etag_revalidates_until_a_write(client, url):
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+
+    not_modified = client.get(url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.get_data() == b""
+    assert not_modified.headers["ETag"] == etag
+    assert client.get(url + "&metric=temperature").headers["ETag"] != etag
+
+    written = client.post(
+        "/api/v1/climate/batch",
+        json=[
+            {
+                "location_id": 1,
+                "metric_id": 1,
+                "date": "2024-01-05",
+                "value": 99.5,
+                "quality": "excellent",
+            }
+        ],
+    )
+    assert written.get_json()["data"]["updated"] == 1
+
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.get_data() != first.get_data()
+
+
+def test_large_responses_are_gzipped(client):
+    url = "/api/v1/climate?per_page=100"
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    encoded = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in plain.headers
+    assert encoded.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in encoded.headers["Vary"]
+    assert gzip.decompress(encoded.get_data()) == plain.get_data()
+    assert encoded.headers["ETag"] != plain.headers["ETag"]
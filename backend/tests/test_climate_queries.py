@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+
+@contextmanager
+def counted_statements(app):
+    """Collect every SQL statement any of the app's engines sends to a cursor"""
+    from models import db
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", record)
+
+
+def statements_per_request(app, client, url):
+    with counted_statements(app) as statements:
+        response = client.get(url)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json(), statements
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "",
+        "&with_count=1",
+        "&cursor=",
+        "&metric=temperature&location_id=2",
+        "&start_date=2024-01-10&quality_threshold=good",
+    ],
+)
+def test_climate_listing_statement_count_ignores_page_size(app, client, query):
+    # Warm the dimension cache so both requests start from the same state
+    client.get("/api/v1/climate?per_page=1")
+
+    small, small_statements = statements_per_request(
+        app, client, "/api/v1/climate?per_page=1" + query
+    )
+    large, large_statements = statements_per_request(
+        app, client, "/api/v1/climate?per_page=100" + query
+    )
+
+    assert len(small["data"]) == 1
+    assert len(large["data"]) > 1
+    # No per-row lazy loads of locations or metrics
+    assert len(large_statements) == len(small_statements), large_statements
+    assert not any(
+        "FROM locations" in statement or "FROM metrics" in statement
+        for statement in large_statements
+    )
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from conftest import READING_DAYS
+from downsample import downsample
+
+
+def reference_lttb(x, y, max_points):
+    """One-series LTTB written out loop by loop"""
+    n = len(x)
+    n_buckets = max_points - 2
+    bounds = [(j * (n - 2)) // n_buckets + 1 for j in range(n_buckets + 1)] + [n]
+    kept = [0]
+    for step in range(n_buckets):
+        lo, hi = bounds[step], bounds[step + 1]
+        next_lo, next_hi = bounds[step + 1], bounds[step + 2]
+        cx = np.mean(x[next_lo:next_hi])
+        cy = np.mean(y[next_lo:next_hi])
+        ax, ay = x[kept[-1]], y[kept[-1]]
+        areas = [
+            abs((ax - cx) * (y[i] - ay) - (ax - x[i]) * (cy - ay))
+            for i in range(lo, hi)
+        ]
+        kept.append(lo + int(np.argmax(areas)))
+    kept.append(n - 1)
+    return kept
+
+
+def reference_minmax(y, max_points):
+    n = len(y)
+    n_buckets = max_points // 2
+    bounds = [(j * n) // n_buckets for j in range(n_buckets)] + [n]
+    kept = set()
+    for lo, hi in zip(bounds, bounds[1:]):
+        kept.add(lo + int(np.argmin(y[lo:hi])))
+        kept.add(lo + int(np.argmax(y[lo:hi])))
+    return sorted(kept)
+
+
+def random_series(lengths, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.concatenate([np.arange(length, dtype=np.float64) for length in lengths])
+    y = rng.normal(0, 10, len(x)).round(1)
+    starts = np.cumsum(lengths) - lengths
+    return x, y, starts, np.asarray(lengths)
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+@pytest.mark.parametrize("max_points", [3, 4, 10, 51])
+def test_downsample_matches_reference_per_series(method, max_points):
+    lengths = [500, 7, 120, max_points, max_points + 1, 1000]
+    x, y, starts, lengths = random_series(lengths)
+
+    kept = downsample(x, y, starts, lengths, max_points, method=method)
+
+    expected = []
+    for start, length in zip(starts, lengths):
+        xs, ys = x[start : start + length], y[start : start + length]
+        if length <= max_points:
+            indices = range(length)
+        elif method == "lttb":
+            indices = reference_lttb(xs, ys, max_points)
+        else:
+            indices = reference_minmax(ys, max_points)
+        expected.extend(start + index for index in indices)
+    assert kept.tolist() == expected
+
+
+@pytest.mark.parametrize("max_points", [3, 10, 100])
+def test_downsample_point_counts(max_points):
+    x, y, starts, lengths = random_series([1000, 250], seed=1)
+
+    lttb = downsample(x, y, starts, lengths, max_points, method="lttb")
+    minmax = downsample(x, y, starts, lengths, max_points, method="minmax")
+
+    assert len(lttb) == 2 * max_points
+    assert len(minmax) <= 2 * max_points
+    for start, length in zip(starts, lengths):
+        in_series = minmax[(minmax >= start) & (minmax < start + length)]
+        values = y[start : start + length]
+        # Every bucket keeps its extremes, so the series' own survive
+        assert values.min() in y[in_series]
+        assert values.max() in y[in_series]
+        # LTTB always keeps the first and last reading
+        assert {start, start + length - 1} <= set(lttb.tolist())
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_series_endpoint_reduces_every_series(client, method):
+    body = client.get(f"/api/v1/series?max_points=10&method={method}").get_json()
+
+    assert body["meta"] == {"max_points": 10, "method": method}
+    assert len(body["data"]) == 4
+    for series in body["data"]:
+        assert series["total_points"] == READING_DAYS
+        if method == "lttb":
+            assert len(series["dates"]) == 10
+            assert series["dates"][0] == "2024-01-01"
+            assert series["dates"][-1] == "2024-02-29"
+        else:
+            assert len(series["dates"]) <= 10
+            # The fixture cycles 10..16 every week
+            assert min(series["values"]) == 10.0
+            assert max(series["values"]) == 16.0
+        assert len(series["values"]) == len(series["dates"])
+        assert series["dates"] == sorted(series["dates"])
+
+
+def test_series_endpoint_returns_short_series_whole(client):
+    body = client.get("/api/v1/series?location_id=1&metric=temperature").get_json()
+    (series,) = body["data"]
+    assert len(series["dates"]) == series["total_points"] == READING_DAYS
+    assert series["values"][:8] == [10.0, 11.0, 12.0, 13.0, 14.0, 15.0, 16.0, 10.0]
+
+
+def test_series_endpoint_limits(client):
+    assert client.get("/api/v1/series?method=mean").status_code == 400
+    body = client.get("/api/v1/series?max_points=1").get_json()
+    assert body["meta"]["max_points"] == 3
+    assert all(len(series["dates"]) == 3 for series in body["data"])
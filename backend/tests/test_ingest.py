@@ -0,0 +1,118 @@
+import json
+
+
+def post_batch(client, readings, content_type="application/json"):
+    response = client.post(
+        "/api/v1/climate/batch",
+        data=readings if isinstance(readings, str) else json.dumps(readings),
+        content_type=content_type,
+    )
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["data"]
+
+
+def reading(**fields):
+    values = {
+        "location_id": 1,
+        "metric": "temperature",
+        "date": "2024-05-01",
+        "value": 21.5,
+        "quality": "good",
+    }
+    values.update(fields)
+    return values
+
+
+def test_batch_reports_each_rejection_reason(client):
+    readings = [
+        reading(),
+        "not an object",
+        reading(location_id=99),
+        reading(metric="humidity"),
+        reading(date="2024-13-01"),
+        reading(date="0000-01-01"),
+        reading(value="21.5"),
+        reading(value=1e6),
+        reading(quality="perfect"),
+        # First broken rule wins
+        reading(location_id=99, quality="perfect"),
+        reading(date="2024-05-02"),
+    ]
+
+    result = post_batch(client, readings)
+
+    assert result["received"] == 11
+    assert result["accepted"] == 2
+    assert result["inserted"] == 2
+    assert result["rejected"] == 9
+    assert result["rejection_reasons"] == {
+        "malformed": 1,
+        "unknown_location": 2,
+        "unknown_metric": 1,
+        "invalid_date": 2,
+        "invalid_value": 2,
+        "invalid_quality": 1,
+    }
+    assert result["rejected_rows"] == [
+        {"index": 1, "reason": "malformed"},
+        {"index": 2, "reason": "unknown_location"},
+        {"index": 3, "reason": "unknown_metric"},
+        {"index": 4, "reason": "invalid_date"},
+        {"index": 5, "reason": "invalid_date"},
+        {"index": 6, "reason": "invalid_value"},
+        {"index": 7, "reason": "invalid_value"},
+        {"index": 8, "reason": "invalid_quality"},
+        {"index": 9, "reason": "unknown_location"},
+    ]
+
+
+def test_batch_counts_inserts_updates_duplicates_and_unchanged(client):
+    readings = [
+        # Stored by the fixture as 10.0, poor (day 0): unchanged
+        reading(date="2024-01-01", value=10.0, quality="poor"),
+        # Stored as 11.0 (day 1): updated
+        reading(date="2024-01-02", value=30.25),
+        # New key sent twice: only the last one is kept
+        reading(date="2024-06-01", value=1.0),
+        reading(date="2024-06-01", value=2.0),
+    ]
+
+    result = post_batch(client, readings)
+
+    assert result["received"] == 4
+    assert result["accepted"] == 3
+    assert result["inserted"] == 1
+    assert result["updated"] == 1
+    assert result["unchanged"] == 1
+    assert result["duplicates"] == 1
+    assert result["rejected"] == 0
+
+    listing = client.get(
+        "/api/v1/climate?location_id=1&metric=temperature&start_date=2024-06-01"
+    ).get_json()["data"]
+    assert [row["value"] for row in listing] == [2.0]
+
+    # Retrying the same batch writes nothing
+    retried = post_batch(client, readings)
+    assert retried["inserted"] == retried["updated"] == 0
+    assert retried["unchanged"] == 3
+
+
+def test_batch_accepts_ndjson_and_rejects_bad_lines(client):
+    body = "\n".join(
+        [json.dumps(reading(date="2024-07-01")), "{not json", ""]
+        + [json.dumps(reading(date="2024-07-02", metric_id=2))]
+    )
+
+    result = post_batch(client, body, content_type="application/x-ndjson")
+
+    assert result["received"] == 3
+    assert result["inserted"] == 2
+    assert result["rejection_reasons"]["malformed"] == 1
+
+
+def test_batch_rejects_unparseable_body(client):
+    response = client.post(
+        "/api/v1/climate/batch", data="{", content_type="application/json"
+    )
+    assert response.status_code == 400
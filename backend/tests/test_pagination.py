@@ -0,0 +1,79 @@
+import base64
+
+import pytest
+
+from conftest import READING_DAYS
+
+
+def walk_cursor(client, query):
+    """Follow meta.next_cursor from the first page, returning every row seen"""
+    rows = []
+    cursor = ""
+    while cursor is not None:
+        response = client.get(f"/api/v1/climate?cursor={cursor}&{query}")
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        rows.extend(body["data"])
+        cursor = body["meta"]["next_cursor"]
+    return rows
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("per_page=7", 4 * READING_DAYS),
+        ("per_page=100", 4 * READING_DAYS),
+        ("per_page=1&location_id=2&metric=temperature", READING_DAYS),
+        ("per_page=9&start_date=2024-01-20&end_date=2024-02-10", 4 * 22),
+    ],
+)
+def test_cursor_walk_has_no_duplicates_or_gaps(client, query, expected):
+    rows = walk_cursor(client, query)
+
+    ids = [row["id"] for row in rows]
+    assert len(ids) == len(set(ids)) == expected
+    # Newest first, ties broken by id
+    keys = [(row["date"], row["id"]) for row in rows]
+    assert keys == sorted(keys, reverse=True)
+
+    # The same rows the offset pages return
+    offset_ids = set()
+    page = 1
+    while len(offset_ids) < expected:
+        body = client.get(f"/api/v1/climate?page={page}&{query}").get_json()
+        assert body["data"]
+        offset_ids.update(row["id"] for row in body["data"])
+        page += 1
+    assert set(ids) == offset_ids
+
+
+@pytest.mark.parametrize("per_page", [0, -5])
+def test_cursor_page_size_stays_positive(client, per_page):
+    # A non-positive LIMIT would read as no limit at all on SQLite
+    body = client.get(f"/api/v1/climate?cursor=&per_page={per_page}").get_json()
+    assert body["meta"]["per_page"] == len(body["data"]) == 20
+
+
+def test_cursor_counts_on_request(client):
+    body = client.get("/api/v1/climate?cursor=&per_page=5&with_count=1").get_json()
+    assert body["meta"]["total_count"] == 4 * READING_DAYS
+    assert (
+        "total_count"
+        not in client.get("/api/v1/climate?cursor=&per_page=5").get_json()["meta"]
+    )
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not-a-cursor",
+        base64.urlsafe_b64encode(b"2024-01-01").decode(),
+        base64.urlsafe_b64encode(b"2024-02-30|5").decode(),
+        base64.urlsafe_b64encode(b"2024-01-01|five").decode(),
+        "%FF%FE",
+    ],
+)
+def test_bad_cursor_is_rejected(client, cursor):
+    response = client.get(f"/api/v1/climate?cursor={cursor}")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid cursor"}
@@ -0,0 +1,93 @@
+import sqlite3
+
+import pytest
+
+
+def copy_database(app, tmp_path, name):
+    """Copy the app's SQLite database, WAL included, to a new file"""
+    source = app.config["SQLALCHEMY_DATABASE_URI"][len("sqlite:///") :]
+    target = tmp_path / name
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+    return target
+
+
+def set_first_value(path, value):
+    """Mark a database by giving its oldest Irvine temperature reading ``value``"""
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "UPDATE climate_data SET value = ? WHERE id = ("
+            "SELECT MIN(id) FROM climate_data WHERE location_id = 1 AND metric_id = 1)",
+            (value,),
+        )
+
+
+def first_value(client):
+    body = client.get(
+        "/api/v1/climate?location_id=1&metric=temperature&end_date=2024-01-01"
+    ).get_json()
+    (row,) = body["data"]
+    return row["value"]
+
+
+@pytest.fixture
+def replica_app(app, tmp_path):
+    """An app reading from two marked copies of the fixture database"""
+    from app import create_app
+
+    replicas = [copy_database(app, tmp_path, f"replica{index}.db") for index in (0, 1)]
+    set_first_value(replicas[0], 100.0)
+    set_first_value(replicas[1], 200.0)
+    return create_app(read_replica_urls=[f"sqlite:///{path}" for path in replicas])
+
+
+def test_reads_rotate_across_replicas(replica_app):
+    client = replica_app.test_client()
+    values = [first_value(client) for _ in range(4)]
+    assert sorted(values) == [100.0, 100.0, 200.0, 200.0]
+    assert values[0] != values[1]
+
+
+def test_writes_go_to_the_primary(replica_app, client):
+    replica_client = replica_app.test_client()
+    response = replica_client.post(
+        "/api/v1/climate/batch",
+        json=[
+            {
+                "location_id": 1,
+                "metric_id": 1,
+                "date": "2024-01-01",
+                "value": 300.0,
+                "quality": "good",
+            }
+        ],
+    )
+    assert response.get_json()["data"]["updated"] == 1
+
+    # The primary took the write; replicas still serve their own copies
+    assert first_value(client) == 300.0
+    assert {first_value(replica_client) for _ in range(2)} == {100.0, 200.0}
+
+
+def test_unreachable_replica_is_skipped(app, tmp_path):
+    from app import create_app
+
+    healthy = copy_database(app, tmp_path, "healthy.db")
+    set_first_value(healthy, 100.0)
+    missing = tmp_path / "no-such-directory" / "replica.db"
+    client = create_app(
+        read_replica_urls=[f"sqlite:///{missing}", f"sqlite:///{healthy}"]
+    ).test_client()
+
+    assert [first_value(client) for _ in range(4)] == [100.0] * 4
+
+
+def test_reads_fall_back_to_the_primary(app, tmp_path):
+    from app import create_app
+
+    missing = tmp_path / "no-such-directory" / "replica.db"
+    client = create_app(read_replica_urls=[f"sqlite:///{missing}"]).test_client()
+
+    # The fixture stores 10.0 on the first day
+    assert [first_value(client) for _ in range(2)] == [10.0, 10.0]
+    assert client.get("/api/v1/summary").status_code == 200
@@ -0,0 +1,106 @@
+from datetime import date, timedelta
+
+import pytest
+
+import rollups
+
+SAMPLE_QUERIES = [
+    "",
+    "location_id=1",
+    "location_id=2",
+    "location_id=3",
+    "metric=temperature",
+    "start_date=2025-01-01",
+    "start_date=2025-01-15&end_date=2025-03-20",
+    "quality_threshold=good",
+    "location_id=1&quality_threshold=excellent",
+]
+BATCH_QUERIES = [
+    "",
+    "location_id=1",
+    "metric=precipitation",
+    "start_date=2024-01-10&end_date=2024-03-05",
+    "quality_threshold=good",
+]
+
+
+def rollup_and_raw(client, monkeypatch, url):
+    """JSON of ``url`` served from the rollups, then from raw rows only"""
+    rolled = client.get(url)
+    with monkeypatch.context() as patch:
+        patch.setattr(rollups, "rollups_ready", lambda: False)
+        raw = client.get(url)
+    assert rolled.status_code == raw.status_code == 200, rolled.get_json()
+    return rolled.get_json(), raw.get_json()
+
+
+@pytest.fixture
+def sample_client(tmp_path, monkeypatch):
+    """Client on a database seeded from data/sample_data.json by init_db.py"""
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'sample.db'}")
+    monkeypatch.setenv("RESPONSE_CACHE_SIZE", "0")
+    for name in ("READ_REPLICA_URLS", "SHARD_URLS", "SNAPSHOT_DIR"):
+        monkeypatch.delenv(name, raising=False)
+
+    from app import create_app
+    from init_db import init_database
+
+    init_database()
+    app = create_app()
+    with app.app_context():
+        assert rollups.rollups_ready()
+    return app.test_client()
+
+
+@pytest.mark.parametrize("endpoint", ["trends", "summary"])
+@pytest.mark.parametrize("query", SAMPLE_QUERIES)
+def test_rollups_match_raw_on_sample_data(sample_client, monkeypatch, endpoint, query):
+    rolled, raw = rollup_and_raw(
+        sample_client, monkeypatch, f"/api/v1/{endpoint}?{query}"
+    )
+    assert rolled == raw
+
+
+def test_rollups_match_raw_after_batch_writes(app, client, monkeypatch):
+    with app.app_context():
+        rollups.rebuild_rollups()
+
+    qualities = ["excellent", "good", "questionable", "poor"]
+    inserted = [
+        {
+            "location_id": location_id,
+            "metric_id": metric_id,
+            "date": (date(2024, 3, 1) + timedelta(days=day)).isoformat(),
+            "value": round(12.3456 + day * 0.5 - location_id, 4),
+            "quality": qualities[(day + metric_id) % 4],
+        }
+        for location_id in (1, 2)
+        for metric_id in (1, 2)
+        for day in range(31)
+    ]
+    # Corrections to stored January and February readings, value and quality
+    updated = [
+        {
+            "location_id": 1,
+            "metric_id": metric_id,
+            "date": (date(2024, 1, 1) + timedelta(days=day)).isoformat(),
+            "value": 40.1234 - day,
+            "quality": qualities[(day + 1) % 4],
+        }
+        for metric_id in (1, 2)
+        for day in range(0, 60, 3)
+    ]
+    response = client.post("/api/v1/climate/batch", json=inserted + updated)
+    assert response.status_code == 200, response.get_json()
+    counts = response.get_json()["data"]
+    assert counts["inserted"] == len(inserted)
+    assert counts["updated"] == len(updated)
+
+    with app.app_context():
+        assert rollups.rollups_ready()
+    for endpoint in ("trends", "summary"):
+        for query in BATCH_QUERIES:
+            rolled, raw = rollup_and_raw(
+                client, monkeypatch, f"/api/v1/{endpoint}?{query}"
+            )
+            assert rolled == raw, (endpoint, query)
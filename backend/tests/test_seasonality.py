@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+from seasonality import detect_seasonality, seasonality_from_columns
+
+START = np.datetime64("2020-01-01")
+
+
+def daily_series(days, period, amplitude=5.0, noise=0.5, seed=0):
+    """A daily sine of ``period`` days on a slow trend, with Gaussian noise"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(days)
+    values = (
+        20.0
+        + 0.01 * t
+        + amplitude * np.sin(2 * np.pi * t / period)
+        + rng.normal(0, noise, days)
+    )
+    return START + t, values
+
+
+def detect_one(dates, values, metric_id=1, location_id=1):
+    count = len(values)
+    return detect_seasonality(
+        np.full(count, metric_id),
+        np.full(count, location_id),
+        dates,
+        values,
+        np.ones(count),
+    )[metric_id]
+
+
+@pytest.mark.parametrize(
+    "days, period, expected",
+    [
+        (120, 7, "weekly"),
+        (365, 30.44, "monthly"),
+        (730, 91.31, "quarterly"),
+    ],
+)
+def test_detects_daily_binned_periods(days, period, expected):
+    result = detect_one(*daily_series(days, period))
+    assert result["detected"]
+    assert result["period"] == expected
+    assert result["confidence"] >= 0.8
+
+
+def test_detects_yearly_cycle_on_monthly_bins():
+    # Six years of readings: long enough to be binned by month
+    dates, values = daily_series(6 * 365, 365.25, amplitude=10.0)
+    result = detect_one(dates, values)
+    assert result["detected"]
+    assert result["period"] == "yearly"
+    assert result["confidence"] >= 0.8
+
+
+def test_monthly_aggregates_score_like_their_readings():
+    dates, values = daily_series(6 * 365, 365.25, amplitude=10.0)
+    months = dates.astype("datetime64[M]")
+    starts, index = np.unique(months, return_inverse=True)
+    sums = np.bincount(index, weights=values)
+    counts = np.bincount(index).astype(np.float64)
+
+    aggregated = detect_seasonality(
+        np.ones(len(starts)),
+        np.ones(len(starts)),
+        starts.astype("datetime64[D]"),
+        sums,
+        counts,
+    )
+    assert aggregated == {1: detect_one(dates, values)}
+
+
+def test_noise_is_not_seasonal():
+    rng = np.random.default_rng(1)
+    dates = START + np.arange(200)
+    result = detect_one(dates, rng.normal(20, 3, 200))
+    assert not result["detected"]
+    assert result["period"] == "none"
+
+
+def test_too_few_readings_are_insufficient():
+    dates, values = daily_series(5, 7)
+    assert detect_one(dates, values) == {
+        "detected": False,
+        "period": "insufficient_data",
+        "confidence": 0.0,
+    }
+
+
+def test_series_are_scored_separately_and_combined_per_metric():
+    weekly_dates, weekly = daily_series(120, 7, seed=2)
+    monthly_dates, monthly = daily_series(120, 30.44, seed=3)
+    columns = {
+        # Metric 1 is weekly at both locations; metric 2 is monthly
+        "metric_id": np.repeat([1, 1, 2], 120),
+        "location_id": np.repeat([1, 2, 1], 120),
+        "date": np.concatenate([weekly_dates, weekly_dates, monthly_dates]),
+        "value": np.concatenate([weekly, weekly[::-1], monthly]),
+    }
+
+    results = seasonality_from_columns(columns)
+
+    assert results[1]["period"] == "weekly"
+    assert results[2]["period"] == "monthly"
+    assert results[1] == detect_one(weekly_dates, weekly)
+
+
+def test_trends_endpoint_reports_the_weekly_fixture_cycle(client):
+    # The fixture's readings repeat every 7 days
+    data = client.get("/api/v1/trends").get_json()["data"]
+    for metric in ("temperature", "precipitation"):
+        seasonality = data[metric]["seasonality"]
+        assert seasonality["detected"]
+        assert seasonality["period"] == "weekly"
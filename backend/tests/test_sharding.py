@@ -0,0 +1,158 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, text
+
+from conftest import READING_DAYS
+
+SHARD_COUNT = 2
+COMPARED_URLS = [
+    "/api/v1/climate?per_page=100",
+    "/api/v1/climate?per_page=100&page=2",
+    "/api/v1/climate?cursor=&per_page=50&with_count=1",
+    "/api/v1/climate?location_id=1&metric=temperature",
+    "/api/v1/climate/export?format=ndjson&start_date=2024-02-01",
+    "/api/v1/summary",
+    "/api/v1/summary?location_id=2&quality_threshold=good",
+    "/api/v1/trends",
+    "/api/v1/trends?location_id=1",
+]
+
+
+@pytest.fixture
+def shard_app(app, tmp_path, monkeypatch):
+    """An app over SHARD_COUNT shards split from the fixture database"""
+    from app import create_app
+    from init_db import shard_database
+
+    urls = [
+        f"sqlite:///{tmp_path / f'shard{index}.db'}" for index in range(SHARD_COUNT)
+    ]
+    monkeypatch.setenv("SHARD_URLS", ",".join(urls))
+    assert shard_database()
+    return create_app()
+
+
+@contextmanager
+def shard_queries(shard_app):
+    """
+    Collect the statements each shard runs, by shard number, leaving out the
+    data version every request reads from all of them
+    """
+    engines = shard_app.extensions["shards"].engines
+    seen = [[] for _ in engines]
+    listeners = []
+    for index, engine in enumerate(engines):
+
+        def record(
+            conn, cursor, statement, parameters, context, executemany, index=index
+        ):
+            if "data_version" not in statement:
+                seen[index].append(statement)
+
+        event.listen(engine, "before_cursor_execute", record)
+        listeners.append((engine, record))
+    try:
+        yield seen
+    finally:
+        for engine, record in listeners:
+            event.remove(engine, "before_cursor_execute", record)
+
+
+def shard_counts(shard_app):
+    counts = []
+    for engine in shard_app.extensions["shards"].engines:
+        with engine.connect() as connection:
+            counts.append(
+                dict(
+                    connection.execute(
+                        text(
+                            "SELECT location_id, COUNT(*) FROM climate_data "
+                            "GROUP BY location_id"
+                        )
+                    ).all()
+                )
+            )
+    return counts
+
+
+@pytest.mark.parametrize("url", COMPARED_URLS)
+def test_sharded_responses_match_unsharded(client, shard_app, url):
+    sharded = shard_app.test_client().get(url)
+    unsharded = client.get(url)
+    assert sharded.status_code == unsharded.status_code == 200
+    assert sharded.get_json() == unsharded.get_json()
+
+
+def test_each_shard_holds_its_locations(shard_app):
+    # location_id % SHARD_COUNT picks the shard
+    assert shard_counts(shard_app) == [{2: 2 * READING_DAYS}, {1: 2 * READING_DAYS}]
+
+
+@pytest.mark.parametrize(
+    "query, shards",
+    [
+        ("location_id=1", [1]),
+        ("location_id=2&metric=temperature", [0]),
+        # A selection inside one shard runs there alone
+        ("bbox=130,30,150,40", [0]),
+        ("near=33,-117&k=1", [1]),
+        ("", [0, 1]),
+        ("metric=precipitation", [0, 1]),
+    ],
+)
+@pytest.mark.parametrize("endpoint", ["climate", "summary", "trends"])
+def test_requests_run_on_the_shards_they_need(shard_app, endpoint, query, shards):
+    client = shard_app.test_client()
+    # Load the dimension cache outside the counted request
+    client.get("/api/v1/locations")
+
+    with shard_queries(shard_app) as seen:
+        response = client.get(f"/api/v1/{endpoint}?{query}")
+
+    assert response.status_code == 200, response.get_json()
+    assert [index for index, statements in enumerate(seen) if statements] == shards
+
+
+def test_batch_ingest_writes_each_reading_to_its_shard(shard_app):
+    client = shard_app.test_client()
+    before = client.get("/api/v1/summary")
+
+    response = client.post(
+        "/api/v1/climate/batch",
+        json=[
+            {
+                "location_id": location_id,
+                "metric_id": 1,
+                "date": f"2024-03-{day:02d}",
+                "value": 20.0 + day,
+                "quality": "good",
+            }
+            for location_id in (1, 2)
+            for day in range(1, 4)
+        ]
+        + [
+            {
+                "location_id": 2,
+                "metric_id": 1,
+                "date": "2024-01-01",
+                "value": 55.0,
+                "quality": "good",
+            }
+        ],
+    )
+    data = response.get_json()["data"]
+    assert (data["inserted"], data["updated"]) == (6, 1)
+
+    assert shard_counts(shard_app) == [
+        {2: 2 * READING_DAYS + 3},
+        {1: 2 * READING_DAYS + 3},
+    ]
+    listing = client.get("/api/v1/climate?per_page=100&start_date=2024-03-01")
+    ids = [row["id"] for row in listing.get_json()["data"]]
+    assert len(ids) == len(set(ids)) == 6
+
+    # The summed data version moves, so cached responses and ETags do too
+    after = client.get("/api/v1/summary")
+    assert after.headers["ETag"] != before.headers["ETag"]
+    assert after.get_json() != before.get_json()
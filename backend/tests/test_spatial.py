@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+from spatial import SpatialIndex, haversine_km
+
+
+def random_locations(count, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = rng.permutation(np.arange(1, count + 1))
+    latitudes = np.degrees(np.arcsin(rng.uniform(-1, 1, count))).round(4)
+    longitudes = rng.uniform(-180, 180, count).round(4)
+    # Points on the antimeridian, the poles and duplicated coordinates
+    latitudes[:6] = [0.0, 0.0, 90.0, -90.0, 45.0, 45.0]
+    longitudes[:6] = [180.0, -180.0, 12.0, -77.0, 179.9999, 179.9999]
+    return ids, latitudes, longitudes
+
+
+def brute_within(ids, latitudes, longitudes, min_lon, min_lat, max_lon, max_lat):
+    inside = (latitudes >= min_lat) & (latitudes <= max_lat)
+    if min_lon <= max_lon:
+        inside &= (longitudes >= min_lon) & (longitudes <= max_lon)
+    else:
+        inside &= (longitudes >= min_lon) | (longitudes <= max_lon)
+    return np.sort(ids[inside])
+
+
+def brute_nearest(ids, latitudes, longitudes, latitude, longitude, k, mask=None):
+    if mask is not None:
+        ids, latitudes, longitudes = ids[mask], latitudes[mask], longitudes[mask]
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    return ids[np.lexsort((ids, distances))[:k]]
+
+
+BOXES = [
+    (-10.0, -10.0, 10.0, 10.0),
+    (-180.0, -90.0, 180.0, 90.0),
+    (100.0, 20.0, 160.0, 60.0),
+    (0.0, 0.0, 0.0, 0.0),
+    (12.0, 90.0, 12.0, 90.0),
+    # Across the antimeridian
+    (170.0, -30.0, -170.0, 30.0),
+    (179.9999, 40.0, -179.0, 50.0),
+    (90.0, -90.0, -90.0, 90.0),
+    # Both edges of an antimeridian box in the same grid column
+    (179.5, -60.0, 179.4, 60.0),
+    (-179.9, -5.0, -179.95, 5.0),
+]
+POINTS = [
+    (0.0, 0.0),
+    (0.0, 179.99),
+    (45.0, -179.99),
+    (89.9, 100.0),
+    (-89.9, -100.0),
+    (51.5, -0.12),
+]
+
+
+@pytest.mark.parametrize("count", [6, 40, 3000])
+@pytest.mark.parametrize("box", BOXES)
+def test_within_matches_brute_force(count, box):
+    ids, latitudes, longitudes = random_locations(count)
+    index = SpatialIndex(ids, latitudes, longitudes)
+
+    found = index.within(*box)
+
+    assert found.tolist() == brute_within(ids, latitudes, longitudes, *box).tolist()
+
+
+@pytest.mark.parametrize("count", [6, 40, 3000])
+@pytest.mark.parametrize("point", POINTS)
+@pytest.mark.parametrize("k", [1, 5, 60])
+def test_nearest_matches_brute_force(count, point, k):
+    ids, latitudes, longitudes = random_locations(count, seed=1)
+    index = SpatialIndex(ids, latitudes, longitudes)
+
+    found = index.nearest(*point, k)
+
+    expected = brute_nearest(ids, latitudes, longitudes, *point, k)
+    assert found.tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize("box", BOXES[2:])
+@pytest.mark.parametrize("point", POINTS)
+def test_nearest_within_box_matches_brute_force(box, point):
+    ids, latitudes, longitudes = random_locations(3000, seed=2)
+    index = SpatialIndex(ids, latitudes, longitudes)
+    inside = np.isin(ids, brute_within(ids, latitudes, longitudes, *box))
+
+    found = index.nearest(*point, 7, within=box)
+
+    expected = brute_nearest(ids, latitudes, longitudes, *point, 7, mask=inside)
+    assert found.tolist() == expected.tolist()
+
+
+def test_empty_index():
+    index = SpatialIndex([], [], [])
+    assert len(index) == 0
+    assert index.within(-180, -90, 180, 90).tolist() == []
+    assert index.nearest(0, 0, 3).tolist() == []
+
+
+@pytest.mark.parametrize(
+    "query, location_ids",
+    [
+        ("bbox=130,30,150,40", {2}),
+        ("bbox=-120,30,-110,40", {1}),
+        ("bbox=0,0,10,10", set()),
+        # Across the antimeridian: Tokyo and Irvine, not the Atlantic side
+        ("bbox=130,30,-110,40", {1, 2}),
+        ("bbox=150,30,-150,40", set()),
+        ("near=35,139&k=1", {2}),
+        ("near=35,-100&k=1", {1}),
+        ("near=35,139&k=5", {1, 2}),
+        ("near=0,0&k=1&bbox=130,30,150,40", {2}),
+        ("location_id=1&bbox=130,30,150,40", set()),
+    ],
+)
+def test_spatial_filters_select_locations(client, query, location_ids):
+    body = client.get(f"/api/v1/climate?per_page=100&{query}").get_json()
+    assert {row["location_id"] for row in body["data"]} == location_ids
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["bbox=1,2,3", "bbox=0,50,10,40", "bbox=0,0,200,10", "near=91,0", "near=a,b"],
+)
+def test_invalid_spatial_filters(client, query):
+    assert client.get(f"/api/v1/climate?{query}").status_code == 400
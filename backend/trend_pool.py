@@ -0,0 +1,255 @@
+"""
+Process-pool trend analysis for EcoVision Climate Visualizer
+Large trend requests copy their column arrays into one shared memory block.
+Worker processes compute trends and anomalies per metric and seasonality
+scores per range of (metric, location) series, returning small arrays; the
+parent merges them in metric order, so results match the serial path exactly.
+Only the raw-column path uses the pool: ranges answered from monthly rollups
+read too few rows to be worth shipping and stay in the request thread.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+from flask import current_app
+
+TRENDS_EXECUTORS = ("serial", "process")
+DEFAULT_TRENDS_EXECUTOR = "serial"
+# Below this many readings the serial path finishes before the arrays could
+# be shipped to the workers
+DEFAULT_MIN_ROWS = 200000
+# Seasonality chunks per worker, so uneven series sizes still balance
+CHUNKS_PER_WORKER = 2
+
+
+def default_start_method():
+    """forkserver where the platform has it: workers never inherit request threads"""
+    methods = multiprocessing.get_all_start_methods()
+    return "forkserver" if "forkserver" in methods else "spawn"
+
+
+class SharedColumns:
+    """Named NumPy arrays copied into one shared memory block"""
+
+    def __init__(self, arrays):
+        layout = []
+        size = 0
+        for name, array in arrays.items():
+            layout.append((name, array.dtype.str, array.shape, size))
+            # 8-byte aligned so every view is aligned for its dtype
+            size += -(-array.nbytes // 8) * 8
+        self.block = shared_memory.SharedMemory(create=True, size=max(size, 8))
+        for (name, dtype, shape, offset), array in zip(layout, arrays.values()):
+            np.ndarray(shape, dtype, buffer=self.block.buf, offset=offset)[...] = array
+        self.spec = (self.block.name, tuple(layout))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.block.close()
+        self.block.unlink()
+
+
+def _run_attached(spec, function, *args):
+    """Call function(arrays, *args) in a worker with the shared arrays mapped"""
+    name, layout = spec
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return function(
+            {
+                column: np.ndarray(shape, dtype, buffer=block.buf, offset=offset)
+                for column, dtype, shape, offset in layout
+            },
+            *args,
+        )
+    finally:
+        try:
+            block.close()
+        except BufferError:
+            # A traceback still holds views; the mapping goes with it
+            pass
+
+
+def _metric_trend(arrays, start, end):
+    from analytics import anomaly_positions, compute_trend
+
+    values = arrays["value"][start:end]
+    positions, deviations = anomaly_positions(values)
+    return (
+        compute_trend(values, arrays["quality"][start:end]),
+        positions + start,
+        deviations,
+    )
+
+
+def _series_scores(arrays, first, last, n_bins, bin_days):
+    from seasonality import series_scores
+
+    series = arrays["series"]
+    selected = (series >= first) & (series < last)
+    values = arrays["value"][selected]
+    return series_scores(
+        series[selected] - first,
+        arrays["bins"][selected],
+        values,
+        np.ones(len(values)),
+        last - first,
+        n_bins,
+        bin_days,
+    )
+
+
+def series_chunks(series_index, n_series, count):
+    """Split series rows into up to ``count`` contiguous ranges of similar size"""
+    totals = np.cumsum(np.bincount(series_index, minlength=n_series))
+    targets = totals[-1] * np.arange(1, count) / count
+    bounds = np.unique(
+        np.concatenate(([0], np.searchsorted(totals, targets) + 1, [n_series]))
+    )
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+class TrendPool:
+    """Worker processes for trends_data(), started on first use"""
+
+    def __init__(self, max_workers=None, min_rows=DEFAULT_MIN_ROWS, start_method=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.min_rows = min_rows
+        self.start_method = start_method or default_start_method()
+        self.lock = threading.Lock()
+        self._executor = None
+
+    def executor(self):
+        with self.lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                )
+            return self._executor
+
+    def reset(self, executor):
+        """Drop a broken executor so the next request starts fresh workers"""
+        with self.lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self.lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def analyze(self, columns, location_lookup):
+        """
+        (results, seasonality) for fetch_trend_columns() arrays: results holds
+        (metric_id, direction, rate, confidence, anomalies) for metrics with at
+        least two readings, in metric order; seasonality maps every metric to
+        its detect_seasonality() result
+        """
+        from analytics import format_anomaly
+        from seasonality import metric_seasonality, series_layout
+
+        metric_ids, starts = np.unique(columns["metric_id"], return_index=True)
+        ends = np.append(starts[1:], len(columns["metric_id"]))
+        bins, bin_days, n_bins, series_keys, series_index, stride = series_layout(
+            columns["metric_id"], columns["location_id"], columns["date"]
+        )
+        groups = [
+            (int(metric_id), int(start), int(end))
+            for metric_id, start, end in zip(metric_ids, starts, ends)
+            if end - start >= 2
+        ]
+        chunks = series_chunks(
+            series_index, len(series_keys), self.max_workers * CHUNKS_PER_WORKER
+        )
+
+        executor = self.executor()
+        with SharedColumns(
+            {
+                "value": columns["value"],
+                "quality": columns["quality"],
+                "bins": bins,
+                "series": series_index,
+            }
+        ) as shared:
+            try:
+                trend_futures = [
+                    executor.submit(
+                        _run_attached, shared.spec, _metric_trend, start, end
+                    )
+                    for _, start, end in groups
+                ]
+                score_futures = [
+                    executor.submit(
+                        _run_attached,
+                        shared.spec,
+                        _series_scores,
+                        first,
+                        last,
+                        n_bins,
+                        bin_days,
+                    )
+                    for first, last in chunks
+                ]
+                trends = [future.result() for future in trend_futures]
+                scores = [future.result() for future in score_futures]
+            except BrokenProcessPool:
+                self.reset(executor)
+                raise
+
+        seasonality = metric_seasonality(
+            series_keys,
+            stride,
+            np.concatenate([chunk_scores for chunk_scores, _ in scores]),
+            np.concatenate([weights for _, weights in scores]),
+        )
+        results = []
+        for (metric_id, _, _), (trend, positions, deviations) in zip(groups, trends):
+            anomalies = [
+                format_anomaly(
+                    columns["date"][pos],
+                    float(columns["value"][pos]),
+                    float(deviation),
+                    int(columns["quality"][pos]),
+                    int(columns["location_id"][pos]),
+                    location_lookup,
+                )
+                for pos, deviation in zip(positions, deviations)
+            ]
+            results.append((metric_id, *trend, anomalies))
+        return results, seasonality
+
+
+def trend_pool(row_count):
+    """The app's TrendPool, or None when ``row_count`` readings run serially"""
+    pool = current_app.extensions.get("trend_pool")
+    if pool is None or not row_count or row_count < pool.min_rows:
+        return None
+    return pool
+
+
+def init_trend_pool(app):
+    """Create the TrendPool when TRENDS_EXECUTOR selects worker processes"""
+    executor = app.config.setdefault("TRENDS_EXECUTOR", DEFAULT_TRENDS_EXECUTOR)
+    if executor not in TRENDS_EXECUTORS:
+        raise ValueError(
+            f"Unknown TRENDS_EXECUTOR {executor!r}. Use: {', '.join(TRENDS_EXECUTORS)}"
+        )
+    if executor == "serial":
+        return None
+
+    pool = TrendPool(
+        max_workers=app.config.get("TRENDS_WORKERS"),
+        min_rows=app.config.get("TRENDS_MIN_ROWS", DEFAULT_MIN_ROWS),
+        start_method=app.config.get("TRENDS_START_METHOD"),
+    )
+    app.extensions["trend_pool"] = pool
+    return pool
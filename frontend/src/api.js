@@ -19,6 +19,9 @@ export const getClimateData = async (filters = {}) => {
     if (filters.metric) params.append("metric", filters.metric);
     if (filters.qualityThreshold)
       params.append("quality_threshold", filters.qualityThreshold);
+    if (filters.bbox) params.append("bbox", filters.bbox);
+    if (filters.near) params.append("near", filters.near);
+    if (filters.k) params.append("k", filters.k);
     if (filters.perPage) params.append("per_page", filters.perPage);
 
     const response = await fetch(`${API_BASE_URL}/climate?${params}`);
@@ -78,6 +81,9 @@ export const getClimateSummary = async (filters = {}) => {
     if (filters.metric) params.append("metric", filters.metric);
     if (filters.qualityThreshold)
       params.append("quality_threshold", filters.qualityThreshold);
+    if (filters.bbox) params.append("bbox", filters.bbox);
+    if (filters.near) params.append("near", filters.near);
+    if (filters.k) params.append("k", filters.k);
 
     const response = await fetch(`${API_BASE_URL}/summary?${params}`);
     if (!response.ok) throw new Error(`HTTP ${response.status}`);
@@ -104,6 +110,9 @@ export const getTrends = async (filters = {}) => {
     if (filters.metric) params.append("metric", filters.metric);
     if (filters.qualityThreshold)
       params.append("quality_threshold", filters.qualityThreshold);
+    if (filters.bbox) params.append("bbox", filters.bbox);
+    if (filters.near) params.append("near", filters.near);
+    if (filters.k) params.append("k", filters.k);
 
     const response = await fetch(`${API_BASE_URL}/trends?${params}`);
     if (!response.ok) throw new Error(`HTTP ${response.status}`);
@@ -114,3 +123,34 @@ export const getTrends = async (filters = {}) => {
     throw error;
   }
 };
+
+/**
+ * Fetch downsampled time series per location and metric for charting
+ * @param {Object} filters - Filter parameters, plus maxPoints and method ("lttb" or "minmax")
+ * @returns {Promise} - API response
+ */
+export const getSeries = async (filters = {}) => {
+  try {
+    const params = new URLSearchParams();
+
+    if (filters.locationId) params.append("location_id", filters.locationId);
+    if (filters.startDate) params.append("start_date", filters.startDate);
+    if (filters.endDate) params.append("end_date", filters.endDate);
+    if (filters.metric) params.append("metric", filters.metric);
+    if (filters.qualityThreshold)
+      params.append("quality_threshold", filters.qualityThreshold);
+    if (filters.bbox) params.append("bbox", filters.bbox);
+    if (filters.near) params.append("near", filters.near);
+    if (filters.k) params.append("k", filters.k);
+    if (filters.maxPoints) params.append("max_points", filters.maxPoints);
+    if (filters.method) params.append("method", filters.method);
+
+    const response = await fetch(`${API_BASE_URL}/series?${params}`);
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
+    return await response.json();
+  } catch (error) {
+    console.error("API Error:", error);
+    throw error;
+  }
+};